@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Compression cost/benefit benchmark
+
+For each endpoint payload and each encoding, reports the CPU time to
+compress and the bytes saved, so COMPRESSION_* levels can be tuned.
+
+Usage: python benchmarks/bench_compression.py [--number N]
+"""
+
+import argparse
+import base64
+import os
+import sys
+import timeit
+from datetime import datetime
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from routes_python.gallery import mock_gallery_items
+from routes_python.content import mock_features, mock_faqs
+from services.compression import GzipEncoder, BrotliEncoder, ZstdEncoder, available_encodings
+from services.serialization import dumps
+
+UPLOADS_DIR = Path(__file__).resolve().parent.parent / "uploads"
+
+
+def build_payloads():
+    # Use a real generated PNG when one is around so base64 ratios are realistic
+    sample_png = next(iter(sorted(UPLOADS_DIR.glob("*.png"))), None)
+    png_bytes = sample_png.read_bytes() if sample_png else os.urandom(1024 * 1024)
+    data_url = f"data:image/png;base64,{base64.b64encode(png_bytes).decode('utf-8')}"
+
+    return {
+        "gallery (50 items)": dumps({
+            "success": True,
+            "gallery": [dict(mock_gallery_items[i % 4], id=str(i)) for i in range(50)]
+        }),
+        "content/features": dumps({"success": True, "features": mock_features}),
+        "content/faqs": dumps({"success": True, "faqs": mock_faqs}),
+        "status (1000 docs)": dumps([
+            {"id": str(i), "client_name": f"client-{i}", "timestamp": datetime.utcnow()}
+            for i in range(1000)
+        ]),
+        "generation data URL": dumps({"success": True, "images": [data_url]}),
+        "raw PNG (skipped)": png_bytes,
+    }
+
+
+def compress(factory, body):
+    encoder = factory()
+    return encoder.compress(body) + encoder.finish()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--number", type=int, default=20, help="iterations per payload")
+    args = parser.parse_args()
+
+    factories = {"gzip": GzipEncoder, "br": BrotliEncoder, "zstd": ZstdEncoder}
+    encodings = available_encodings()
+
+    print(f"{'payload':<24}{'enc':>6}{'bytes':>11}{'compressed':>12}{'saved':>8}{'ms':>9}{'MB/s':>9}")
+    for name, body in build_payloads().items():
+        for encoding in encodings:
+            factory = factories[encoding]
+            elapsed = min(timeit.repeat(lambda: compress(factory, body), number=args.number, repeat=3)) / args.number
+            size = len(compress(factory, body))
+            saved = 1 - size / len(body)
+            throughput = len(body) / elapsed / 1024 / 1024
+            print(f"{name:<24}{encoding:>6}{len(body):>11}{size:>12}{saved:>7.0%}{elapsed * 1000:>9.2f}{throughput:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Perceptual-hash lookup benchmark
+
+Fills a MultiIndexHash with random 64-bit hashes plus planted near-duplicates,
+then times radius queries at several Hamming distances against a vectorized
+NumPy linear scan over the same hashes, checking both return the same ids.
+
+Usage: python benchmarks/bench_image_hash.py [--size 1000000] [--queries 200]
+"""
+
+import argparse
+import random
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from services.imageHash import MultiIndexHash, popcount
+
+RADII = [0, 4, 6, 8, 10]
+
+
+def flip_bits(value, count, rng):
+    for position in rng.sample(range(64), count):
+        value ^= 1 << position
+    return value
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(pct / 100 * len(values)))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--size", type=int, default=1_000_000, help="hashes in the index")
+    parser.add_argument("--queries", type=int, default=200, help="queries per radius")
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    values = [rng.getrandbits(64) for _ in range(args.size)]
+    # Every query has a few near-duplicates in the index
+    queries = [rng.getrandbits(64) for _ in range(args.queries)]
+    for query in queries:
+        for distance in (1, 3, 5, 7, 9):
+            values.append(flip_bits(query, distance, rng))
+
+    start = time.perf_counter()
+    index = MultiIndexHash()
+    for i, value in enumerate(values):
+        index.add(str(i), value)
+    build = time.perf_counter() - start
+    array = np.array(values, dtype=np.uint64)
+    print(f"Indexed {len(index):,} hashes in {build:.1f}s")
+
+    print(f"{'radius':>6}{'index p50 ms':>14}{'index p99 ms':>14}{'scan p50 ms':>13}{'matches':>9}")
+    for radius in RADII:
+        mih_times, scan_times, found = [], [], 0
+        for query in queries:
+            start = time.perf_counter()
+            matches = index.search(query, radius)
+            mih_times.append((time.perf_counter() - start) * 1000)
+
+            start = time.perf_counter()
+            distances = popcount(array ^ np.uint64(query))
+            expected = np.nonzero(distances <= radius)[0]
+            scan_times.append((time.perf_counter() - start) * 1000)
+
+            assert sorted(int(i) for _, i in matches) == sorted(expected.tolist()), "index and scan disagree"
+            found += len(matches)
+
+        print(f"{radius:>6}{percentile(mih_times, 50):>14.3f}{percentile(mih_times, 99):>14.3f}"
+              f"{percentile(scan_times, 50):>13.3f}{found / len(queries):>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Prompt enhancement benchmark
+
+Runs the legacy chained `in` scans and the compiled PromptEnhancer over a
+synthetic prompt corpus, uncached, then again with extra categories added
+to show per-prompt cost stays flat as rules grow.
+
+Usage: python benchmarks/bench_prompt_enhancer.py [--prompts N] [--extra-categories N]
+"""
+
+import argparse
+import json
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from services.promptEnhancer import PromptEnhancer, DEFAULT_RULES_PATH
+
+VOCABULARY = (
+    "a the majestic snowy golden vibrant quiet old futuristic neon misty city street river "
+    "castle dragon robot cat dog garden beach sunset aurora desert temple market train "
+    "mountain forest ocean portrait face character painting drawing art landscape person"
+).split()
+
+
+def legacy_enhance(prompt, keyword_sets):
+    """The original AIService._enhance_prompt, generalized to N keyword lists"""
+    if len(prompt.split()) > 15:
+        return prompt
+    for words, suffix in keyword_sets:
+        if any(word in prompt.lower() for word in words):
+            return f"{prompt}, {suffix}"
+    return f"{prompt}, highly detailed, professional quality, 8k resolution"
+
+
+def build_rules(extra_categories):
+    rules = json.loads(Path(DEFAULT_RULES_PATH).read_text())
+    for i in range(extra_categories):
+        rules["categories"].append({
+            "name": f"extra{i}",
+            "priority": 0,
+            "keywords": [f"kw{i}x{j}" for j in range(5)],
+            "template": "{prompt}, extra style " + str(i)
+        })
+    return rules
+
+
+def run(prompts, extra_categories):
+    rules = build_rules(extra_categories)
+    keyword_sets = [(c["keywords"], c["template"]) for c in rules["categories"]]
+
+    start = time.perf_counter()
+    for prompt in prompts:
+        legacy_enhance(prompt, keyword_sets)
+    legacy = (time.perf_counter() - start) / len(prompts)
+
+    enhancer = PromptEnhancer(rules)
+    start = time.perf_counter()
+    for prompt in prompts:
+        enhancer._enhance(prompt)
+    compiled = (time.perf_counter() - start) / len(prompts)
+
+    start = time.perf_counter()
+    for prompt in prompts:
+        enhancer.enhance(prompt)
+    memoized = (time.perf_counter() - start) / len(prompts)
+
+    print(f"{len(rules['categories']):>11}{legacy * 1e6:>12.2f}{compiled * 1e6:>12.2f}{memoized * 1e6:>12.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--prompts", type=int, default=50000)
+    parser.add_argument("--extra-categories", type=int, nargs="+", default=[0, 10, 100, 1000])
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    # A few hundred distinct prompts repeated, like real traffic
+    distinct = [" ".join(rng.choice(VOCABULARY) for _ in range(rng.randint(3, 14))) for _ in range(500)]
+    prompts = [rng.choice(distinct) for _ in range(args.prompts)]
+
+    print(f"{'categories':>11}{'legacy µs':>12}{'compiled µs':>12}{'cached µs':>12}")
+    for extra in args.extra_categories:
+        run(prompts, extra)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+Serialization micro-benchmark
+
+Compares the old response path (jsonable_encoder + stdlib json, as used by
+FastAPI's default JSONResponse) against the orjson FastJSONResponse path for
+the payloads our hot endpoints return.
+
+Usage: python benchmarks/bench_serialization.py [--number N]
+"""
+
+import argparse
+import base64
+import json
+import os
+import sys
+import timeit
+from datetime import datetime
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from fastapi.encoders import jsonable_encoder
+
+from routes_python.gallery import mock_gallery_items
+from routes_python.content import mock_features, mock_reviews, mock_faqs
+from services.serialization import dumps
+
+
+def stdlib_render(content):
+    """What FastAPI did before: encode to primitives, then json.dumps"""
+    return json.dumps(
+        jsonable_encoder(content),
+        ensure_ascii=False,
+        allow_nan=False,
+        indent=None,
+        separators=(",", ":"),
+    ).encode("utf-8")
+
+
+def build_payloads():
+    gallery_page = [dict(item, id=str(i)) for i in range(50) for item in mock_gallery_items[:1]]
+    image_base64 = base64.b64encode(os.urandom(1536 * 1024)).decode('utf-8')
+
+    return {
+        "gallery (50 items)": {
+            "success": True,
+            "gallery": gallery_page,
+            "pagination": {"total": 50, "limit": 50, "skip": 0, "hasMore": False},
+            "filters": {"featured": False, "sort": "recent"}
+        },
+        "content/features": {"success": True, "features": mock_features},
+        "content/reviews": {"success": True, "reviews": mock_reviews},
+        "content/faqs": {"success": True, "faqs": mock_faqs, "categories": ["general"]},
+        "status (1000 docs)": [
+            {"id": str(i), "client_name": f"client-{i}", "timestamp": datetime.utcnow()}
+            for i in range(1000)
+        ],
+        "generation (1.5MB base64)": {
+            "success": True,
+            "images": [f"data:image/png;base64,{image_base64}"],
+            "processingTime": 1234.5,
+            "metadata": {"model": "dall-e-3-via-emergent", "mode": "text-to-image"}
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--number", type=int, default=200, help="iterations per payload")
+    args = parser.parse_args()
+
+    print(f"{'payload':<28}{'bytes':>10}{'before µs':>12}{'after µs':>12}{'speedup':>10}")
+    for name, payload in build_payloads().items():
+        number = max(1, args.number // 20) if "base64" in name else args.number
+        before = min(timeit.repeat(lambda: stdlib_render(payload), number=number, repeat=3)) / number
+        after = min(timeit.repeat(lambda: dumps(payload), number=number, repeat=3)) / number
+        size = len(dumps(payload))
+        print(f"{name:<28}{size:>10}{before * 1e6:>12.1f}{after * 1e6:>12.1f}{before / after:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Fake Stripe webhook sender for load tests
+
+Signs checkout.session.completed events the way Stripe does
+(Stripe-Signature: t=<ts>,v1=<hmac-sha256>) and fires them at the webhook
+endpoint concurrently, optionally redelivering a share of events to
+exercise inbox dedupe.
+
+Usage: python benchmarks/fake_stripe_webhook.py --sessions cs_1 cs_2 --events 500 --concurrency 20
+"""
+
+import argparse
+import hashlib
+import hmac
+import json
+import os
+import random
+import statistics
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+
+def sign(payload: bytes, secret: str, timestamp: int) -> str:
+    signed = f"{timestamp}.".encode() + payload
+    signature = hmac.new(secret.encode(), signed, hashlib.sha256).hexdigest()
+    return f"t={timestamp},v1={signature}"
+
+
+def build_event(session_id: str, payment_status: str = "paid") -> dict:
+    return {
+        "id": f"evt_{uuid.uuid4().hex[:24]}",
+        "object": "event",
+        "type": "checkout.session.completed",
+        "created": int(time.time()),
+        "data": {
+            "object": {
+                "id": session_id,
+                "object": "checkout.session",
+                "payment_status": payment_status,
+                "status": "complete",
+                "metadata": {"source": "fake_stripe_webhook"}
+            }
+        }
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--url", default="http://localhost:8001/api/payments/webhook/stripe")
+    parser.add_argument("--secret", default=os.getenv("STRIPE_WEBHOOK_SECRET", "whsec_test"))
+    parser.add_argument("--sessions", nargs="+", default=["cs_test_fake"], help="checkout session IDs to complete")
+    parser.add_argument("--events", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--duplicate-rate", type=float, default=0.2, help="share of sends that redeliver an earlier event")
+    args = parser.parse_args()
+
+    session = requests.Session()
+    sent = []
+
+    def send(_):
+        if sent and random.random() < args.duplicate_rate:
+            event = random.choice(sent)
+        else:
+            event = build_event(random.choice(args.sessions))
+            sent.append(event)
+
+        payload = json.dumps(event).encode()
+        headers = {
+            "Content-Type": "application/json",
+            "Stripe-Signature": sign(payload, args.secret, int(time.time()))
+        }
+        start = time.perf_counter()
+        response = session.post(args.url, data=payload, headers=headers, timeout=30)
+        return response.status_code, (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        results = list(pool.map(send, range(args.events)))
+    elapsed = time.perf_counter() - start
+
+    latencies = sorted(latency for _, latency in results)
+    statuses = {}
+    for status, _ in results:
+        statuses[status] = statuses.get(status, 0) + 1
+
+    print(f"Sent {args.events} webhooks ({len(sent)} unique) in {elapsed:.2f}s - {args.events / elapsed:.1f} req/s")
+    print(f"Status codes: {statuses}")
+    print(f"Latency ms: p50={statistics.median(latencies):.1f} "
+          f"p95={latencies[int(len(latencies) * 0.95) - 1]:.1f} max={latencies[-1]:.1f}")
+
+
+if __name__ == "__main__":
+    main()
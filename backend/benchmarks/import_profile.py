@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+Cold-start import profile
+
+Imports server.py in a fresh interpreter with -X importtime and reports
+the total import time plus the slowest modules (cumulative, including
+their own imports), grouped by top-level package.
+
+Usage: python benchmarks/import_profile.py [--top N] [--module server]
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+
+def profile(module):
+    env = dict(os.environ, PYTHONDONTWRITEBYTECODE="1")
+    start = time.perf_counter()
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=BACKEND_DIR, env=env, capture_output=True, text=True
+    )
+    wall = time.perf_counter() - start
+    if completed.returncode != 0:
+        sys.stderr.write(completed.stderr[-4000:])
+        raise SystemExit(f"Importing {module} failed")
+
+    # Lines look like: "import time:   self [us] | cumulative | imported package"
+    modules = []
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        modules.append((name.strip(), int(self_us), int(cumulative_us)))
+    return wall, modules
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--module", default="server")
+    parser.add_argument("--top", type=int, default=20)
+    args = parser.parse_args()
+
+    wall, modules = profile(args.module)
+
+    by_package = defaultdict(int)
+    for name, self_us, _ in modules:
+        by_package[name.split(".")[0]] += self_us
+
+    total_self = sum(self_us for _, self_us, _ in modules)
+    print(f"import {args.module}: {wall * 1000:.0f} ms wall, {total_self / 1000:.0f} ms in module bodies, "
+          f"{len(modules)} modules")
+
+    print(f"\nTop {args.top} packages by self time")
+    for package, self_us in sorted(by_package.items(), key=lambda item: -item[1])[:args.top]:
+        print(f"  {package:<40}{self_us / 1000:>9.1f} ms")
+
+    print(f"\nTop {args.top} modules by cumulative time")
+    for name, _, cumulative_us in sorted(modules, key=lambda item: -item[2])[:args.top]:
+        print(f"  {name:<40}{cumulative_us / 1000:>9.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
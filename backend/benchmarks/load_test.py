@@ -0,0 +1,242 @@
+#!/usr/bin/env python3
+"""
+Offline end-to-end load test
+
+Starts the FastAPI app in-process against the stub image provider and a
+local Mongo stand-in (mongomock-motor by default, or a real mongod via
+--mongo-url), drives a weighted mix of concurrent traffic and reports
+throughput and latency percentiles per endpoint. Results are saved as JSON
+so runs can be compared across commits with --compare.
+
+Usage:
+    python benchmarks/load_test.py --duration 20 --concurrency 32
+    python benchmarks/load_test.py --compare benchmarks/results/<previous>.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+RESULTS_DIR = Path(__file__).resolve().parent / "results"
+sys.path.insert(0, str(BACKEND_DIR))
+
+# Offline configuration - must be set before the app is imported
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "nano_banana_loadtest")
+os.environ["IMAGE_PROVIDER"] = "stub"
+os.environ.setdefault("STUB_PROVIDER_LATENCY", "0.05")
+os.environ.setdefault("FREE_CREDITS", "1000000000")
+for tier in ("FREE", "PRO", "ENTERPRISE", "IP"):
+    os.environ.setdefault(f"RATE_LIMIT_{tier}_PER_MIN", "100000000")
+
+import httpx
+
+# Share of requests per scenario
+TRAFFIC_MIX = {
+    "generate": 10,
+    "generation_status": 20,
+    "gallery": 25,
+    "gallery_showcase": 10,
+    "content": 15,
+    "files": 15,
+    "payment_status": 5,
+}
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(pct / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR, stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except Exception:
+        return "unknown"
+
+
+async def create_database(mongo_url):
+    if mongo_url:
+        from services.database import create_client
+        return create_client(mongo_url)[os.environ["DB_NAME"]]
+
+    from mongomock_motor import AsyncMongoMockClient
+    return AsyncMongoMockClient()[os.environ["DB_NAME"]]
+
+
+async def seed(db):
+    """Data the read scenarios need"""
+    await db.payment_transactions.delete_many({"session_id": {"$regex": "^cs_load_"}})
+    await db.payment_transactions.insert_many([
+        {
+            "session_id": f"cs_load_{i}",
+            "package_id": "pro_monthly",
+            "amount": 19.0,
+            "currency": "usd",
+            "payment_status": "paid",
+            "status": "complete",
+            "metadata": {},
+            "created_at": datetime.utcnow(),
+            "updated_at": datetime.utcnow()
+        }
+        for i in range(20)
+    ])
+    from services import creditLedger
+    for i in range(1, 201):
+        await creditLedger.open_account(db, f"load-{i}")
+    return sorted(p.name for p in (BACKEND_DIR / "uploads").glob("*.png"))
+
+
+class Scenarios:
+    def __init__(self, client, files):
+        self.client = client
+        self.file_names = files
+        self.generation_ids = []
+
+    async def generate(self):
+        response = await self.client.post("/api/generate/", json={
+            "prompt": random.choice(["A majestic mountain at dawn", "portrait of a robot", "neon city street"]),
+            "sessionId": f"load-{random.randint(1, 200)}"
+        })
+        if response.status_code == 200:
+            self.generation_ids.append(response.json()["generationId"])
+            del self.generation_ids[:-1000]
+        return response
+
+    async def generation_status(self):
+        generation_id = random.choice(self.generation_ids) if self.generation_ids else "warmup"
+        return await self.client.get(f"/api/generate/{generation_id}")
+
+    async def gallery(self):
+        sort = random.choice(["recent", "popular", "featured"])
+        return await self.client.get(f"/api/gallery/?sort={sort}&limit=20")
+
+    async def gallery_showcase(self):
+        return await self.client.get("/api/gallery/featured/showcase")
+
+    async def content(self):
+        return await self.client.get(f"/api/content/{random.choice(['features', 'reviews', 'faqs', 'stats'])}")
+
+    async def files(self):
+        return await self.client.get(f"/api/files/{random.choice(self.file_names)}")
+
+    async def payment_status(self):
+        return await self.client.get(f"/api/payments/status/cs_load_{random.randint(0, 19)}")
+
+
+async def run_load(args):
+    import server
+
+    db = await create_database(args.mongo_url)
+    server.db = db
+    await server.startup_db_client()
+    files = await seed(db)
+
+    mix = {name: weight for name, weight in TRAFFIC_MIX.items() if name != "files" or files}
+    names, weights = list(mix), list(mix.values())
+
+    transport = httpx.ASGITransport(app=server.app)
+    samples = {name: [] for name in names}
+    errors = {name: 0 for name in names}
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://loadtest") as client:
+        scenarios = Scenarios(client, files)
+        deadline = time.perf_counter() + args.duration
+
+        async def worker():
+            while time.perf_counter() < deadline:
+                name = random.choices(names, weights)[0]
+                start = time.perf_counter()
+                try:
+                    response = await getattr(scenarios, name)()
+                    ok = response.status_code < 400
+                except Exception:
+                    ok = False
+                samples[name].append((time.perf_counter() - start) * 1000)
+                if not ok:
+                    errors[name] += 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+        elapsed = time.perf_counter() - started
+
+    await server.shutdown_db_client()
+
+    endpoints = {}
+    for name in names:
+        latencies = sorted(samples[name])
+        endpoints[name] = {
+            "requests": len(latencies),
+            "errors": errors[name],
+            "throughput": round(len(latencies) / elapsed, 1),
+            "p50_ms": round(percentile(latencies, 50), 2),
+            "p95_ms": round(percentile(latencies, 95), 2),
+            "p99_ms": round(percentile(latencies, 99), 2),
+            "max_ms": round(latencies[-1], 2) if latencies else 0.0,
+        }
+
+    total = sum(endpoint["requests"] for endpoint in endpoints.values())
+    return {
+        "revision": git_revision(),
+        "timestamp": datetime.utcnow().isoformat(),
+        "config": {
+            "duration": args.duration,
+            "concurrency": args.concurrency,
+            "mongo": args.mongo_url or "mongomock",
+            "stub_latency": float(os.environ["STUB_PROVIDER_LATENCY"]),
+        },
+        "total": {"requests": total, "throughput": round(total / elapsed, 1)},
+        "endpoints": endpoints,
+    }
+
+
+def print_report(results, baseline=None):
+    print(f"Revision {results['revision']} - {results['total']['requests']} requests, "
+          f"{results['total']['throughput']} req/s")
+    header = f"{'endpoint':<20}{'req':>8}{'err':>6}{'req/s':>9}{'p50':>9}{'p95':>9}{'p99':>9}"
+    if baseline:
+        header += f"{'Δp95':>9}"
+    print(header)
+    for name, stats in results["endpoints"].items():
+        line = (f"{name:<20}{stats['requests']:>8}{stats['errors']:>6}{stats['throughput']:>9}"
+                f"{stats['p50_ms']:>9}{stats['p95_ms']:>9}{stats['p99_ms']:>9}")
+        previous = (baseline or {}).get("endpoints", {}).get(name)
+        if previous and previous["p95_ms"]:
+            line += f"{(stats['p95_ms'] / previous['p95_ms'] - 1):>+9.0%}"
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--duration", type=float, default=15, help="seconds of traffic")
+    parser.add_argument("--concurrency", type=int, default=32, help="concurrent virtual clients")
+    parser.add_argument("--mongo-url", default=None, help="use a real mongod instead of mongomock")
+    parser.add_argument("--output", type=Path, default=None, help="results file (default: results/<time>-<rev>.json)")
+    parser.add_argument("--compare", type=Path, default=None, help="previous results file to diff against")
+    args = parser.parse_args()
+
+    results = asyncio.run(run_load(args))
+
+    output = args.output or RESULTS_DIR / f"{datetime.utcnow():%Y%m%dT%H%M%S}-{results['revision']}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(results, indent=2))
+
+    baseline = json.loads(args.compare.read_text()) if args.compare else None
+    print_report(results, baseline)
+    print(f"Saved {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmarks for per-request CPU paths
+
+Each benchmark runs over several data sizes and reports time per call and
+allocations (tracemalloc peak and block count). Save a run with --save and
+check later runs against it with --baseline; the script exits non-zero when
+any case is slower than the baseline by more than --threshold.
+
+Usage:
+    python benchmarks/microbench.py --save benchmarks/results/micro-baseline.json
+    python benchmarks/microbench.py --baseline benchmarks/results/micro-baseline.json --threshold 0.25
+    python benchmarks/microbench.py --only get_gallery search_gallery
+"""
+
+import argparse
+import asyncio
+import base64
+import json
+import os
+import random
+import sys
+import timeit
+import tracemalloc
+from datetime import datetime, timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+os.environ["IMAGE_PROVIDER"] = "stub"
+
+from routes_python import gallery
+from services.aiService import AIService
+from services.promptEnhancer import promptEnhancer
+from services.serialization import dumps
+
+BENCHMARKS = {}
+LOOP = asyncio.new_event_loop()
+
+
+def benchmark(name, sizes):
+    """Register a benchmark; the function takes a size and returns a zero-arg callable"""
+    def decorator(setup):
+        BENCHMARKS[name] = (setup, sizes)
+        return setup
+    return decorator
+
+
+def make_gallery_items(count):
+    rng = random.Random(count)
+    now = datetime.now()
+    return [
+        {
+            **gallery.mock_gallery_items[i % len(gallery.mock_gallery_items)],
+            "id": str(i),
+            "likes": rng.randint(0, 1000),
+            "createdAt": now - timedelta(minutes=rng.randint(0, 100000)),
+            "metadata": {"featured": rng.random() < 0.3}
+        }
+        for i in range(count)
+    ]
+
+
+class GalleryData:
+    """Swap the gallery's mock data for a generated set while a case runs"""
+
+    def __init__(self, count):
+        self.items = make_gallery_items(count)
+
+    def __enter__(self):
+        self.original = gallery.mock_gallery_items[:]
+        gallery.mock_gallery_items[:] = self.items
+
+    def __exit__(self, *exc):
+        gallery.mock_gallery_items[:] = self.original
+
+
+@benchmark("enhance_prompt", sizes=[10, 100, 1000])
+def bench_enhance_prompt(size):
+    rng = random.Random(size)
+    words = "a majestic mountain portrait of a cat painting neon city ocean at dusk".split()
+    prompts = [" ".join(rng.choice(words) for _ in range(rng.randint(3, 14))) for _ in range(size)]
+    return lambda: [promptEnhancer._enhance(p) for p in prompts]
+
+
+@benchmark("validate_generation_params", sizes=[10, 100, 1000])
+def bench_validate(size):
+    cases = [("a prompt " * (i % 120), "text-to-image" if i % 3 else "image-to-image") for i in range(size)]
+    return lambda: [AIService.validateGenerationParams(None, prompt, mode) for prompt, mode in cases]
+
+
+@benchmark("get_gallery", sizes=[4, 100, 1000, 10000])
+def bench_get_gallery(size):
+    data = GalleryData(size)
+
+    def run():
+        with data:
+            for sort in ("recent", "popular", "featured"):
+                LOOP.run_until_complete(gallery.get_gallery(limit=20, skip=0, featured=sort == "featured", sort=sort))
+    return run
+
+
+@benchmark("search_gallery", sizes=[4, 100, 1000, 10000])
+def bench_search_gallery(size):
+    data = GalleryData(size)
+
+    def run():
+        with data:
+            for query in ("mountain", "beach", "zzz"):
+                LOOP.run_until_complete(gallery.search_gallery(q=query, limit=20, skip=0))
+    return run
+
+
+@benchmark("base64_data_url", sizes=[64 * 1024, 1024 * 1024, 4 * 1024 * 1024])
+def bench_base64(size):
+    image = os.urandom(size)
+
+    def run():
+        image_base64 = base64.b64encode(image).decode('utf-8')
+        return f"data:image/png;base64,{image_base64}"
+    return run
+
+
+@benchmark("serialize_gallery", sizes=[20, 100, 1000])
+def bench_serialize_gallery(size):
+    payload = {"success": True, "gallery": make_gallery_items(size)}
+    return lambda: dumps(payload)
+
+
+@benchmark("serialize_status", sizes=[100, 1000, 10000])
+def bench_serialize_status(size):
+    payload = [{"id": str(i), "client_name": f"client-{i}", "timestamp": datetime.utcnow()} for i in range(size)]
+    return lambda: dumps(payload)
+
+
+def measure(func, min_time=0.2):
+    """Time per call (best of 3 after auto-ranging) and allocations of one call"""
+    timer = timeit.Timer(func)
+    number, elapsed = timer.autorange()
+    while elapsed < min_time:
+        number *= 2
+        elapsed = timer.timeit(number)
+    best = min(timer.repeat(repeat=3, number=number)) / number
+
+    # Peak traced memory during one call, and blocks still held by its result
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    result = func()
+    after = tracemalloc.take_snapshot()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    blocks = sum(max(stat.count_diff, 0) for stat in after.compare_to(before, "filename"))
+    del result
+
+    return {"us_per_call": round(best * 1e6, 2), "peak_kb": round(peak / 1024, 1), "blocks": blocks}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--only", nargs="+", default=None, help="benchmark names to run")
+    parser.add_argument("--save", type=Path, default=None, help="write results JSON")
+    parser.add_argument("--baseline", type=Path, default=None, help="results JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2, help="allowed slowdown vs baseline (0.2 = 20%%)")
+    args = parser.parse_args()
+
+    baseline = json.loads(args.baseline.read_text())["results"] if args.baseline else {}
+    results = {}
+    regressions = []
+
+    print(f"{'benchmark':<28}{'size':>10}{'µs/call':>12}{'peak KB':>10}{'blocks':>9}{'vs base':>9}")
+    for name, (setup, sizes) in BENCHMARKS.items():
+        if args.only and name not in args.only:
+            continue
+        for size in sizes:
+            case = f"{name}[{size}]"
+            stats = measure(setup(size))
+            results[case] = stats
+
+            change = ""
+            previous = baseline.get(case)
+            if previous:
+                ratio = stats["us_per_call"] / previous["us_per_call"] - 1
+                change = f"{ratio:+.0%}"
+                if ratio > args.threshold:
+                    regressions.append((case, ratio))
+            print(f"{name:<28}{size:>10}{stats['us_per_call']:>12}{stats['peak_kb']:>10}{stats['blocks']:>9}{change:>9}")
+
+    if args.save:
+        args.save.parent.mkdir(parents=True, exist_ok=True)
+        args.save.write_text(json.dumps({"timestamp": datetime.utcnow().isoformat(), "results": results}, indent=2))
+        print(f"Saved {args.save}")
+
+    if regressions:
+        print(f"\n{len(regressions)} regression(s) over {args.threshold:.0%}:")
+        for case, ratio in regressions:
+            print(f"  {case}: {ratio:+.0%}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
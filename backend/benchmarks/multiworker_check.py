@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Multi-worker consistency check
+
+Launches the app under gunicorn with several uvicorn workers against a
+local mongod and the stub provider, sends concurrent likes spread over many
+connections (so they land on different workers), then reads the count back
+repeatedly and checks every worker reports the same total.
+
+Usage:
+    python benchmarks/multiworker_check.py --workers 4 --likes 400
+    python benchmarks/multiworker_check.py --backend memory   # shows the inconsistency
+"""
+
+import argparse
+import os
+import signal
+import subprocess
+import sys
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import requests
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+
+def wait_until_ready(base_url, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            if requests.get(f"{base_url}/api/", timeout=1).status_code == 200:
+                return
+        except requests.RequestException:
+            pass
+        time.sleep(0.3)
+    raise SystemExit("Server did not become ready")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--likes", type=int, default=400)
+    parser.add_argument("--reads", type=int, default=40)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--backend", choices=["mongo", "memory"], default="mongo")
+    parser.add_argument("--mongo-url", default=os.getenv("MONGO_URL", "mongodb://localhost:27017"))
+    args = parser.parse_args()
+
+    env = dict(
+        os.environ,
+        MONGO_URL=args.mongo_url,
+        DB_NAME=f"multiworker_{uuid.uuid4().hex[:8]}",
+        IMAGE_PROVIDER="stub",
+        SHARED_STATE_BACKEND=args.backend,
+        RATE_LIMIT_BACKEND=args.backend,
+        WEB_CONCURRENCY=str(args.workers),
+        BIND=f"127.0.0.1:{args.port}",
+    )
+    base_url = f"http://127.0.0.1:{args.port}"
+    server = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "server:app"],
+        cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+
+    try:
+        wait_until_ready(base_url)
+        before = requests.get(f"{base_url}/api/gallery/1").json()["galleryItem"]["likes"]
+
+        # A fresh connection per request spreads requests across workers
+        def like(_):
+            return requests.post(f"{base_url}/api/gallery/1/like", headers={"Connection": "close"}).status_code
+
+        with ThreadPoolExecutor(max_workers=32) as pool:
+            statuses = list(pool.map(like, range(args.likes)))
+        failed = sum(1 for status in statuses if status != 200)
+
+        def read(_):
+            response = requests.get(f"{base_url}/api/gallery/1", headers={"Connection": "close"})
+            return response.json()["galleryItem"]["likes"]
+
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            observed = set(pool.map(read, range(args.reads)))
+
+        expected = before + args.likes - failed
+        print(f"{args.workers} workers, backend={args.backend}: {args.likes} likes ({failed} failed), "
+              f"expected {expected}, observed {sorted(observed)}")
+
+        if observed != {expected}:
+            print("INCONSISTENT")
+            sys.exit(1)
+        print("OK")
+    finally:
+        server.send_signal(signal.SIGTERM)
+        server.wait(timeout=30)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+Admin command line for backups and migrations
+
+Usage:
+    python cli.py export backup.ndjson.zst
+    python cli.py export payments.ndjson --collections payment_transactions,credit_ledger
+    python cli.py import backup.ndjson.zst --import-id restore-1
+"""
+
+import asyncio
+import os
+import sys
+import time
+import uuid
+from pathlib import Path
+from typing import Optional
+
+import aiofiles
+import typer
+from dotenv import load_dotenv
+
+ROOT_DIR = Path(__file__).parent
+sys.path.insert(0, str(ROOT_DIR))
+load_dotenv(ROOT_DIR / '.env')
+
+from services.bulkTransfer import EXPORT_COLLECTIONS, export_ndjson, import_ndjson
+from services.database import create_client
+
+app = typer.Typer(help=__doc__.strip().splitlines()[0])
+
+
+def _database():
+    client = create_client(os.environ['MONGO_URL'])
+    return client, client[os.environ['DB_NAME']]
+
+
+async def _read_chunks(path: Path, chunk_size: int = 1024 * 1024):
+    async with aiofiles.open(path, 'rb') as f:
+        while chunk := await f.read(chunk_size):
+            yield chunk
+
+
+@app.command("export")
+def export_command(
+    output: Path = typer.Argument(..., help="file to write; a .zst suffix enables zstd"),
+    collections: str = typer.Option(",".join(EXPORT_COLLECTIONS), help="comma-separated collections"),
+    batch_size: int = typer.Option(1000, help="documents per cursor batch"),
+):
+    """Stream collections to an NDJSON file"""
+    names = collections.split(",")
+    unknown = [name for name in names if name not in EXPORT_COLLECTIONS]
+    if unknown:
+        raise typer.BadParameter(f"Unknown collections: {', '.join(unknown)}")
+
+    async def run():
+        client, db = _database()
+        started = time.perf_counter()
+        written = 0
+        try:
+            async with aiofiles.open(output, 'wb') as f:
+                async for chunk in export_ndjson(db, names, batch_size=batch_size, compress=output.suffix == ".zst"):
+                    await f.write(chunk)
+                    written += len(chunk)
+        finally:
+            client.close()
+        elapsed = time.perf_counter() - started
+        typer.echo(f"Wrote {written / 1024 / 1024:.1f} MB to {output} in {elapsed:.1f}s "
+                   f"({written / 1024 / 1024 / elapsed:.1f} MB/s)")
+
+    asyncio.run(run())
+
+
+@app.command("import")
+def import_command(
+    source: Path = typer.Argument(..., exists=True, help="NDJSON export; .zst files are decompressed"),
+    import_id: Optional[str] = typer.Option(None, help="reuse to resume an interrupted import"),
+    batch_size: int = typer.Option(1000, help="documents per bulk_write"),
+):
+    """Load an NDJSON export, resuming from the last checkpoint of --import-id"""
+    import_id = import_id or str(uuid.uuid4())
+    typer.echo(f"Import ID {import_id}")
+
+    async def run():
+        client, db = _database()
+        try:
+            return await import_ndjson(
+                db, _read_chunks(source), import_id, compressed=source.suffix == ".zst", batch_size=batch_size
+            )
+        finally:
+            client.close()
+
+    stats = asyncio.run(run())
+    typer.echo(f"Imported {stats['imported']} documents in {stats['batches']} batches, "
+               f"skipped {stats['skipped']} already-imported lines, {stats['docsPerSecond']} docs/s")
+
+
+if __name__ == "__main__":
+    app()
@@ -0,0 +1,34 @@
+# Multi-worker launch profile: gunicorn -c gunicorn.conf.py server:app
+#
+# Every worker is a separate process, so run with the shared backends:
+#   SHARED_STATE_BACKEND=mongo RATE_LIMIT_BACKEND=mongo
+import multiprocessing
+import os
+
+bind = os.getenv("BIND", "0.0.0.0:8001")
+workers = int(os.getenv("WEB_CONCURRENCY", str(min(8, multiprocessing.cpu_count() * 2))))
+worker_class = "uvicorn.workers.UvicornWorker"
+
+# Generation jobs run as background tasks after the response - give them time to finish on reload
+timeout = int(os.getenv("WORKER_TIMEOUT", "120"))
+graceful_timeout = int(os.getenv("GRACEFUL_TIMEOUT", "60"))
+keepalive = 5
+
+# Recycle workers periodically to cap memory growth from image buffers
+max_requests = int(os.getenv("MAX_REQUESTS", "5000"))
+max_requests_jitter = int(os.getenv("MAX_REQUESTS_JITTER", "500"))
+
+# Each worker opens its own Motor pool and event loop, so don't preload the app
+preload_app = False
+
+accesslog = "-"
+errorlog = "-"
+loglevel = os.getenv("LOG_LEVEL", "info")
+
+
+def on_starting(server):
+    if workers > 1 and os.getenv("SHARED_STATE_BACKEND", "memory") != "mongo":
+        server.log.warning(
+            "Running %s workers with SHARED_STATE_BACKEND=memory - likes, locks and "
+            "invalidations will differ between workers", workers
+        )
@@ -0,0 +1,96 @@
+from fastapi import APIRouter, HTTPException, Request, Depends, Query
+from fastapi.responses import StreamingResponse
+from typing import Optional
+import hmac
+import os
+import uuid
+from datetime import datetime
+
+from services.bulkTransfer import EXPORT_COLLECTIONS, decode_line, export_ndjson, import_ndjson
+from services.database import get_db
+from services.scheduler import Scheduler, get_scheduler
+from services.serialization import json_response
+
+def require_admin(request: Request):
+    """Admin endpoints are disabled unless ADMIN_TOKEN is set, then need it in X-Admin-Token"""
+    token = os.environ.get('ADMIN_TOKEN')
+    if not token:
+        raise HTTPException(status_code=403, detail="Admin API is disabled")
+    if not hmac.compare_digest(request.headers.get("x-admin-token", ""), token):
+        raise HTTPException(status_code=401, detail="Invalid admin token")
+
+router = APIRouter(prefix="/admin", tags=["admin"], dependencies=[Depends(require_admin)])
+
+def _collections(collections: Optional[str]):
+    names = collections.split(",") if collections else list(EXPORT_COLLECTIONS)
+    unknown = [name for name in names if name not in EXPORT_COLLECTIONS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown collections: {', '.join(unknown)}")
+    return names
+
+@router.get("/export")
+async def export_data(
+    collections: Optional[str] = None,
+    compress: bool = False,
+    after: Optional[str] = None,
+    batchSize: int = Query(1000, ge=1, le=10000),
+    db=Depends(get_db)
+):
+    """Stream gallery, generation and payment data as NDJSON (zstd with compress=true)"""
+    names = _collections(collections)
+    # {"collection": last _id} in Extended JSON, from the last line a previous export got to
+    resume = decode_line(after.encode()) if after else None
+
+    filename = f"export-{datetime.utcnow():%Y%m%dT%H%M%S}.ndjson" + (".zst" if compress else "")
+    return StreamingResponse(
+        export_ndjson(db, names, batch_size=batchSize, compress=compress, after=resume),
+        media_type="application/zstd" if compress else "application/x-ndjson",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+@router.post("/import")
+async def import_data(
+    request: Request,
+    importId: Optional[str] = None,
+    compressed: bool = False,
+    batchSize: int = Query(1000, ge=1, le=10000),
+    db=Depends(get_db)
+):
+    """Load an NDJSON export from the request body; repeat with the same importId to resume"""
+    try:
+        return await import_ndjson(
+            db,
+            request.stream(),
+            importId or str(uuid.uuid4()),
+            compressed=compressed or request.headers.get("content-encoding") == "zstd",
+            batch_size=batchSize
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.get("/tasks")
+async def list_tasks(scheduler: Scheduler = Depends(get_scheduler)):
+    """Scheduled maintenance tasks with their next and last runs"""
+    return json_response({"success": True, "tasks": await scheduler.describe()})
+
+@router.get("/tasks/{name}/history")
+async def task_history(
+    name: str,
+    limit: int = Query(20, ge=1, le=200),
+    scheduler: Scheduler = Depends(get_scheduler)
+):
+    """Recent runs of a task, newest first"""
+    if name not in scheduler.tasks:
+        raise HTTPException(status_code=404, detail="Unknown task")
+    return json_response({"success": True, "runs": await scheduler.history(name, limit)})
+
+@router.post("/tasks/{name}/run")
+async def run_task(name: str, scheduler: Scheduler = Depends(get_scheduler)):
+    """Run a task now on this replica and return the recorded run"""
+    if name not in scheduler.tasks:
+        raise HTTPException(status_code=404, detail="Unknown task")
+    try:
+        run = await scheduler.trigger(name)
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return json_response({"success": run["status"] == "ok", "run": run})
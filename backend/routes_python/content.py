@@ -1,6 +1,11 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Depends
 from typing import Optional, List
 from datetime import datetime
+import os
+
+from services.database import get_db
+from services.scheduler import TaskContext, scheduled_task
+from services.serialization import cached_json, json_response
 
 router = APIRouter(prefix="/content", tags=["content"])
 
@@ -144,12 +149,11 @@ mock_faqs = [
 async def get_features():
     """Get application features"""
     try:
-        active_features = [f for f in mock_features if f["isActive"]]
-        
-        return {
+        # Static payload - encoded once and served from bytes
+        return cached_json("content:features", lambda: {
             "success": True,
-            "features": active_features
-        }
+            "features": [f for f in mock_features if f["isActive"]]
+        })
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
@@ -159,12 +163,10 @@ async def get_reviews():
     """Get user reviews/testimonials"""
     try:
         # Sort by creation date, newest first
-        sorted_reviews = sorted(mock_reviews, key=lambda x: x["createdAt"], reverse=True)
-        
-        return {
+        return cached_json("content:reviews", lambda: {
             "success": True,
-            "reviews": sorted_reviews
-        }
+            "reviews": sorted(mock_reviews, key=lambda x: x["createdAt"], reverse=True)
+        })
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
@@ -173,30 +175,59 @@ async def get_reviews():
 async def get_faqs(category: Optional[str] = None):
     """Get FAQ data"""
     try:
-        active_faqs = [f for f in mock_faqs if f["isActive"]]
-        
-        if category:
-            active_faqs = [f for f in active_faqs if f["category"] == category]
-        
-        # Sort by order
-        sorted_faqs = sorted(active_faqs, key=lambda x: x["order"])
-        
-        categories = list(set(f["category"] for f in mock_faqs if f["isActive"]))
-        
-        return {
-            "success": True,
-            "faqs": sorted_faqs,
-            "categories": categories
-        }
+        categories = sorted(set(f["category"] for f in mock_faqs if f["isActive"]))
+
+        def build_faqs():
+            active_faqs = [f for f in mock_faqs if f["isActive"]]
+            
+            if category:
+                active_faqs = [f for f in active_faqs if f["category"] == category]
+            
+            # Sort by order
+            return {
+                "success": True,
+                "faqs": sorted(active_faqs, key=lambda x: x["order"]),
+                "categories": categories
+            }
+
+        # Only cache known categories so arbitrary query values can't grow the cache
+        if category is None or category in categories:
+            return cached_json(("content:faqs", category), build_faqs)
+        return json_response(build_faqs())
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
+@scheduled_task("stats_rollup", interval=float(os.environ.get('STATS_ROLLUP_INTERVAL', '300')), budget=60, initial_delay=30)
+async def rollup_stats(context: TaskContext) -> dict:
+    """Aggregate counters for /content/stats so the endpoint never scans collections"""
+    db = context.db
+    generations = await db.image_hashes.count_documents({"kind": "generation"})
+    uploads = await db.image_metadata.count_documents({})
+    revenue = [
+        row async for row in db.payment_transactions.aggregate([
+            {"$match": {"payment_status": "paid"}},
+            {"$group": {"_id": "$currency", "count": {"$sum": 1}, "amount": {"$sum": "$amount"}}}
+        ])
+    ]
+    rollup = {
+        "generations": generations,
+        "uploads": uploads,
+        "paidTransactions": sum(row["count"] for row in revenue),
+        "revenue": {row["_id"] or "usd": round(row["amount"], 2) for row in revenue},
+        "updated_at": datetime.utcnow()
+    }
+    await db.stats_rollups.replace_one({"_id": "current"}, {"_id": "current", **rollup}, upsert=True)
+    # Keep one snapshot per day for trends
+    day = rollup["updated_at"].strftime("%Y-%m-%d")
+    await db.stats_rollups.replace_one({"_id": day}, {"_id": day, **rollup}, upsert=True)
+    return {key: value for key, value in rollup.items() if key != "updated_at"}
+
 @router.get("/stats")
-async def get_stats():
+async def get_stats(db=Depends(get_db)):
     """Get application statistics"""
     try:
-        # Mock statistics - in real app would query database
+        # Mock baseline, overlaid with the latest scheduled rollup when there is one
         stats = {
             "totalGenerations": 12847,
             "publicGallery": 4,
@@ -206,10 +237,16 @@ async def get_stats():
             "lastUpdated": datetime.utcnow().isoformat()
         }
         
-        return {
+        rollup = await db.stats_rollups.find_one({"_id": "current"})
+        if rollup:
+            stats["totalGenerations"] += rollup["generations"]
+            stats["totalUploads"] = rollup["uploads"]
+            stats["lastUpdated"] = rollup["updated_at"].isoformat()
+        
+        return json_response({
             "success": True,
             "stats": stats
-        }
+        })
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
\ No newline at end of file
@@ -1,39 +1,53 @@
-from fastapi import APIRouter, HTTPException
-from fastapi.responses import FileResponse, Response
-from pathlib import Path
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import FileResponse, Response, StreamingResponse
+import asyncio
 import os
+import time
 import mimetypes
 
+from services import promptWarming
+from services.database import get_db
+from services.imageHash import image_hash_index
+from services.scheduler import TaskContext, scheduled_task
+from services.storage import storage
+
 router = APIRouter(prefix="/files", tags=["files"])
 
-# Configure uploads directory
-UPLOADS_DIR = Path(__file__).parent.parent / "uploads"
-UPLOADS_DIR.mkdir(exist_ok=True)
+async def delete_stored_file(db, name: str) -> bool:
+    """Delete a file from both tiers along with the records that point at it"""
+    existed = await storage.delete(name)
+    await asyncio.gather(
+        db.image_metadata.delete_many({"file": name}),
+        image_hash_index.forget_file(db, name),
+        promptWarming.forget_file(db, name)
+    )
+    return existed
 
 @router.get("/{filename}")
 async def serve_file(filename: str):
-    """Serve uploaded files"""
+    """Serve uploaded files from the hot tier, or stream them from cold storage"""
     try:
-        file_path = UPLOADS_DIR / filename
-        
-        # Check if file exists
-        if not file_path.exists():
-            raise HTTPException(status_code=404, detail="File not found")
-        
         # Get MIME type
-        mime_type, _ = mimetypes.guess_type(str(file_path))
+        mime_type, _ = mimetypes.guess_type(filename)
         if not mime_type:
             mime_type = "application/octet-stream"
         
-        # Return file with appropriate headers
-        return FileResponse(
-            path=file_path,
-            media_type=mime_type,
-            headers={
-                "Cache-Control": "public, max-age=86400",  # Cache for 24 hours
-                "ETag": f'"{filename}"'
-            }
-        )
+        headers = {
+            "Cache-Control": "public, max-age=86400",  # Cache for 24 hours
+            "ETag": f'"{filename}"'
+        }
+        
+        file_path = storage.hot_path(filename)
+        if file_path is not None:
+            return FileResponse(path=file_path, media_type=mime_type, headers=headers)
+        
+        # Cold object - stream it through, promoting it to the hot tier on the way
+        stored = await storage.stat(filename)
+        if stored is None:
+            raise HTTPException(status_code=404, detail="File not found")
+        
+        headers["Content-Length"] = str(stored.size)
+        return StreamingResponse(storage.stream(filename), media_type=mime_type, headers=headers)
         
     except HTTPException:
         raise
@@ -41,13 +55,10 @@ async def serve_file(filename: str):
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
 @router.delete("/{filename}")
-async def delete_file(filename: str):
+async def delete_file(filename: str, db=Depends(get_db)):
     """Delete uploaded file"""
     try:
-        file_path = UPLOADS_DIR / filename
-        
-        if file_path.exists():
-            os.remove(file_path)
+        if await delete_stored_file(db, filename):
             return {
                 "success": True,
                 "message": "File deleted successfully"
@@ -66,14 +77,9 @@ async def delete_file(filename: str):
 async def get_storage_stats():
     """Get storage statistics"""
     try:
-        total_files = 0
-        total_size = 0
-        
-        if UPLOADS_DIR.exists():
-            for file_path in UPLOADS_DIR.iterdir():
-                if file_path.is_file():
-                    total_files += 1
-                    total_size += file_path.stat().st_size
+        tiers = await storage.stats()
+        total_files = tiers["hot"]["fileCount"] + tiers["cold"]["fileCount"]
+        total_size = tiers["hot"]["totalSize"] + tiers["cold"]["totalSize"]
         
         return {
             "success": True,
@@ -81,34 +87,41 @@ async def get_storage_stats():
                 "fileCount": total_files,
                 "totalSize": total_size,
                 "totalSizeMB": round(total_size / 1024 / 1024, 2),
-                "uploadsDirectory": str(UPLOADS_DIR)
+                "uploadsDirectory": str(storage.hot_root),
+                "tiers": tiers
             }
         }
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
-@router.post("/admin/cleanup")
-async def cleanup_old_files(days: int = 7):
-    """Cleanup old files"""
-    try:
-        import time
-        from datetime import datetime, timedelta
-        
-        cutoff_time = time.time() - (days * 24 * 60 * 60)
-        deleted_count = 0
-        
-        if UPLOADS_DIR.exists():
-            for file_path in UPLOADS_DIR.iterdir():
-                if file_path.is_file() and file_path.stat().st_mtime < cutoff_time:
-                    os.remove(file_path)
-                    deleted_count += 1
-        
-        return {
-            "success": True,
-            "message": f"Cleanup completed for files older than {days} days",
-            "deletedFiles": deleted_count
-        }
-        
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
\ No newline at end of file
+# Deletes from both tiers, so it only runs on a schedule when FILE_CLEANUP_ENABLED=true;
+# otherwise trigger it by hand via /api/admin/tasks/file_cleanup/run
+FILE_RETENTION_DAYS = float(os.environ.get('FILE_RETENTION_DAYS', '7'))
+FILE_CLEANUP_ENABLED = os.environ.get('FILE_CLEANUP_ENABLED', 'false').lower() == 'true'
+
+@scheduled_task(
+    "file_cleanup",
+    interval=float(os.environ.get('FILE_CLEANUP_INTERVAL', '21600')),
+    budget=300,
+    enabled=FILE_CLEANUP_ENABLED
+)
+async def cleanup_old_files(context: TaskContext) -> dict:
+    """Delete stored files not used within the retention window, stopping early if the budget runs low"""
+    cutoff_time = time.time() - (FILE_RETENTION_DAYS * 24 * 60 * 60)
+    deleted_count = 0
+    complete = True
+    
+    for stored in await storage.list():
+        if context.out_of_time():
+            complete = False
+            break
+        if max(stored.modified, stored.accessed) < cutoff_time:
+            await delete_stored_file(context.db, stored.name)
+            deleted_count += 1
+    
+    return {
+        "retentionDays": FILE_RETENTION_DAYS,
+        "deletedFiles": deleted_count,
+        "complete": complete
+    }
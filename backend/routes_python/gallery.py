@@ -1,7 +1,16 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Depends, Query
 from pydantic import BaseModel
 from typing import Optional, List
 from datetime import datetime
+import asyncio
+import os
+
+from services.database import get_db
+from services.imageHash import image_hash_index
+from services.scheduler import TaskContext, scheduled_task
+from services.serialization import json_response
+from services.sharedState import get_shared_state
+from services.storage import storage
 
 router = APIRouter(prefix="/gallery", tags=["gallery"])
 
@@ -63,6 +72,34 @@ mock_gallery_items = [
     }
 ]
 
+def likes_key(gallery_id: str) -> str:
+    return f"gallery:likes:{gallery_id}"
+
+async def with_likes(items: List[dict]) -> List[dict]:
+    """Copy items with likes from the shared counters added, so every worker agrees"""
+    counts = await get_shared_state().get_counters(likes_key(item["id"]) for item in items)
+    return [{**item, "likes": item["likes"] + counts[likes_key(item["id"])]} for item in items]
+
+FILES_PREFIX = "/api/files/"
+_prefetch_tasks = set()
+
+def prefetch_images(items: List[dict]):
+    """Start pulling a page's locally stored images into the hot tier before the browser asks"""
+    names = [item["image"][len(FILES_PREFIX):] for item in items if item.get("image", "").startswith(FILES_PREFIX)]
+    if names:
+        task = asyncio.create_task(storage.prefetch(names))
+        _prefetch_tasks.add(task)
+        task.add_done_callback(_prefetch_tasks.discard)
+
+@scheduled_task("cache_warm", interval=float(os.environ.get('CACHE_WARM_INTERVAL', '600')), budget=120, initial_delay=15)
+async def warm_caches(context: TaskContext) -> dict:
+    """Keep showcase images on the hot tier and the similar-image index loaded"""
+    showcase = [item for item in mock_gallery_items if item.get("metadata", {}).get("featured", False)]
+    names = [item["image"][len(FILES_PREFIX):] for item in showcase if item.get("image", "").startswith(FILES_PREFIX)]
+    await storage.prefetch(names)
+    await image_hash_index.refresh(context.db)
+    return {"prefetched": len(names), "hashesIndexed": len(image_hash_index.index)}
+
 @router.get("/")
 async def get_gallery(
     limit: int = 20, 
@@ -73,7 +110,7 @@ async def get_gallery(
     """Get public gallery images"""
     try:
         # Filter and sort gallery items
-        items = mock_gallery_items.copy()
+        items = await with_likes(mock_gallery_items)
         
         if featured:
             items = [item for item in items if item.get("metadata", {}).get("featured", False)]
@@ -89,8 +126,10 @@ async def get_gallery(
         # Pagination
         total = len(items)
         paginated_items = items[skip:skip + limit]
+        # This page's images, plus the next page's for when the user scrolls
+        prefetch_images(items[skip:skip + 2 * limit])
         
-        return {
+        return json_response({
             "success": True,
             "gallery": paginated_items,
             "pagination": {
@@ -103,7 +142,7 @@ async def get_gallery(
                 "featured": featured,
                 "sort": sort
             }
-        }
+        })
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
@@ -113,20 +152,21 @@ async def get_featured_showcase(limit: int = 4):
     """Get featured gallery items for homepage showcase"""
     try:
         # Get featured items
-        featured_items = [
+        featured_items = await with_likes([
             item for item in mock_gallery_items 
             if item.get("metadata", {}).get("featured", False)
-        ]
+        ])
         
         # Sort by likes and limit
         featured_items.sort(key=lambda x: x["likes"], reverse=True)
         showcase_items = featured_items[:limit]
+        prefetch_images(showcase_items)
         
-        return {
+        return json_response({
             "success": True,
             "showcase": showcase_items,
             "count": len(showcase_items)
-        }
+        })
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
@@ -141,10 +181,45 @@ async def get_gallery_item(gallery_id: str):
         if not gallery_item:
             raise HTTPException(status_code=404, detail="Gallery item not found")
         
-        return {
+        gallery_item = (await with_likes([gallery_item]))[0]
+        
+        return json_response({
             "success": True,
             "galleryItem": gallery_item
-        }
+        })
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+
+@router.get("/{image_id}/similar")
+async def get_similar_items(
+    image_id: str,
+    maxDistance: int = Query(10, ge=0, le=16),
+    limit: int = Query(20, ge=1, le=100),
+    db=Depends(get_db)
+):
+    """
+    Find near-duplicate images by perceptual hash
+
+    `image_id` is an upload ID or a generation ID - the images that are
+    hashed as they're stored. Gallery items link to external images and
+    aren't indexed.
+    """
+    try:
+        matches = await image_hash_index.similar(db, image_id, max_distance=maxDistance, limit=limit)
+        if matches is None:
+            raise HTTPException(status_code=404, detail="Image not indexed")
+        
+        for match in matches:
+            match["url"] = f"{FILES_PREFIX}{match['file']}" if match["file"] else None
+        
+        return json_response({
+            "success": True,
+            "similar": matches,
+            "count": len(matches)
+        })
         
     except HTTPException:
         raise
@@ -161,13 +236,13 @@ async def like_gallery_item(gallery_id: str):
         if not gallery_item:
             raise HTTPException(status_code=404, detail="Gallery item not found")
         
-        # Increment likes (in real app, this would update database)
-        gallery_item["likes"] += 1
+        # Increment the shared counter so likes are consistent across workers
+        likes = gallery_item["likes"] + await get_shared_state().incr(likes_key(gallery_id))
         
         return {
             "success": True,
             "message": "Liked successfully",
-            "likes": gallery_item["likes"]
+            "likes": likes
         }
         
     except HTTPException:
@@ -192,6 +267,8 @@ async def search_gallery(q: str, limit: int = 20, skip: int = 0):
                 query in item["prompt"].lower()):
                 results.append(item)
         
+        results = await with_likes(results)
+        
         # Sort by likes
         results.sort(key=lambda x: x["likes"], reverse=True)
         
@@ -199,7 +276,7 @@ async def search_gallery(q: str, limit: int = 20, skip: int = 0):
         total = len(results)
         paginated_results = results[skip:skip + limit]
         
-        return {
+        return json_response({
             "success": True,
             "results": paginated_results,
             "query": q,
@@ -209,9 +286,50 @@ async def search_gallery(q: str, limit: int = 20, skip: int = 0):
                 "skip": skip,
                 "hasMore": (skip + limit) < total
             }
-        }
+        })
         
     except HTTPException:
         raise
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+
+@router.get("/search/filter")
+async def filter_images(
+    aspect: Optional[str] = None,
+    color: Optional[str] = None,
+    tone: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=100),
+    skip: int = Query(0, ge=0),
+    db=Depends(get_db)
+):
+    """Filter analyzed images by aspect class, color family and tone"""
+    try:
+        query = {}
+        if aspect:
+            query["aspect"] = aspect
+        if color:
+            query["color_families"] = color
+        if tone:
+            query["tone"] = tone
+        
+        projection = {"_id": 1, "file": 1, "width": 1, "height": 1, "aspect": 1,
+                      "dominant_colors": 1, "brightness": 1, "tone": 1, "created_at": 1}
+        cursor = db.image_metadata.find(query, projection).sort("created_at", -1).skip(skip).limit(limit + 1)
+        items = []
+        async for doc in cursor:
+            item_id = doc.pop("_id")
+            items.append({**doc, "id": item_id, "url": f"{FILES_PREFIX}{doc['file']}"})
+        
+        return json_response({
+            "success": True,
+            "results": items[:limit],
+            "filters": {"aspect": aspect, "color": color, "tone": tone},
+            "pagination": {
+                "limit": limit,
+                "skip": skip,
+                "hasMore": len(items) > limit
+            }
+        })
+        
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
@@ -1,24 +1,51 @@
-from fastapi import APIRouter, HTTPException, UploadFile, File, Form, BackgroundTasks
+from fastapi import APIRouter, HTTPException, UploadFile, File, Form, BackgroundTasks, Depends, Request
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from typing import Optional, List
 import uuid
 import asyncio
+import base64
 import json
+import time
 from datetime import datetime
-import aiofiles
 import os
 from pathlib import Path
 
 # Import the real AI service
+from services import creditLedger, progressiveDelivery, promptWarming
 from services.aiService import aiService
+from services.database import get_db
+from services.fairQueue import DeadlineExceeded, generation_queue
+from services.generationJobs import generation_jobs
+from services.imageAnalysis import InvalidImageError, analyze_and_store, inspect_header
+from services.imageHash import image_hash_index
+from services.rateLimiter import RateLimiter, get_rate_limiter, client_ip
+from services.scheduler import TaskContext, scheduled_task
+from services.serialization import json_response
+from services.storage import storage
+from routes_python.gallery import mock_gallery_items
 
 router = APIRouter(prefix="/generate", tags=["generation"])
 
+# Return the existing file instead of storing a near-identical upload again
+UPLOAD_DEDUPE_ENABLED = os.getenv('UPLOAD_DEDUPE_ENABLED', 'false').lower() == 'true'
+# Serve text-to-image prompts from pre-rendered results when one exists
+RESULT_CACHE_ENABLED = os.getenv('RESULT_CACHE_ENABLED', 'true').lower() == 'true'
+# Most reference images a multi-image generation may combine
+MAX_CONTEXT_IMAGES = int(os.getenv('MAX_CONTEXT_IMAGES', '4'))
+# Publish a blurred placeholder and a mid-res preview before the full image
+PROGRESSIVE_DELIVERY_ENABLED = os.getenv('PROGRESSIVE_DELIVERY_ENABLED', 'true').lower() == 'true'
+# Longest deadline a client may ask for
+MAX_DEADLINE_MS = int(os.getenv('MAX_GENERATION_DEADLINE_MS', '600000'))
+
 # Pydantic models
 class GenerateRequest(BaseModel):
     prompt: str
     mode: str = "text-to-image"
     sessionId: Optional[str] = None
+    imageId: Optional[str] = None  # upload ID or file name from /generate/upload
+    imageIds: Optional[List[str]] = None  # several uploads for mode "multi-image"
+    deadlineMs: Optional[int] = None  # give up if no result within this many ms
 
 class GenerateResponse(BaseModel):
     success: bool
@@ -32,8 +59,25 @@ class GenerationStatus(BaseModel):
     generation: dict
 
 
+async def enforce_rate_limit(rate_limiter: RateLimiter, checks: List[tuple]):
+    """Raise 429 with Retry-After if any of the limits is exceeded"""
+    decision = await rate_limiter.check(checks)
+    if not decision.allowed:
+        raise HTTPException(
+            status_code=429,
+            detail=f"Rate limit exceeded ({decision.scope}). Try again in {decision.retry_after:.1f} seconds",
+            headers={"Retry-After": str(max(1, round(decision.retry_after)))}
+        )
+
+
 @router.post("/", response_model=GenerateResponse)
-async def generate_image(request: GenerateRequest, background_tasks: BackgroundTasks):
+async def generate_image(
+    request: GenerateRequest,
+    background_tasks: BackgroundTasks,
+    http_request: Request,
+    db=Depends(get_db),
+    rate_limiter: RateLimiter = Depends(get_rate_limiter)
+):
     """Generate image from text prompt"""
     try:
         # Validate input
@@ -43,8 +87,42 @@ async def generate_image(request: GenerateRequest, background_tasks: BackgroundT
         if len(request.prompt) > 500:
             raise HTTPException(status_code=400, detail="Prompt must be less than 500 characters")
         
-        # Generate session ID if not provided
-        session_id = request.sessionId or str(uuid.uuid4())
+        if request.deadlineMs is not None and not 0 < request.deadlineMs <= MAX_DEADLINE_MS:
+            raise HTTPException(status_code=400, detail=f"deadlineMs must be between 1 and {MAX_DEADLINE_MS}")
+        
+        if request.imageId and await storage.locate(request.imageId) is None:
+            raise HTTPException(status_code=400, detail="Reference image not found")
+        
+        if request.mode == "multi-image":
+            if not request.imageIds or not 2 <= len(request.imageIds) <= MAX_CONTEXT_IMAGES:
+                raise HTTPException(status_code=400, detail=f"multi-image needs 2 to {MAX_CONTEXT_IMAGES} imageIds")
+            located = await asyncio.gather(*(storage.locate(image_id) for image_id in request.imageIds))
+            if any(name is None for name in located):
+                raise HTTPException(status_code=400, detail="Reference image not found")
+        elif request.imageIds:
+            raise HTTPException(status_code=400, detail='imageIds requires mode "multi-image"')
+        
+        # Credits and limits are per session, so every request must name one
+        if not request.sessionId:
+            raise HTTPException(status_code=400, detail="sessionId is required")
+        session_id = request.sessionId
+        
+        # Per-IP limit first, so throttled clients never reach the account lookup
+        await enforce_rate_limit(rate_limiter, [("ip", f"ip:{client_ip(http_request)}")])
+        
+        # Then the per-session limit for the account's plan tier
+        tier = "free"
+        if creditLedger.CREDIT_METERING_ENABLED:
+            account = await creditLedger.get_account(db, session_id)
+            if account is None:
+                raise HTTPException(
+                    status_code=403,
+                    detail="Unknown session. Open it with POST /api/payments/credits/{sessionId} first"
+                )
+            tier = "enterprise" if account["unlimited"] else creditLedger.tier_for_plan(account["plan"])
+        await enforce_rate_limit(rate_limiter, [(tier, f"session:{session_id}")])
+        
+        deadline = time.monotonic() + request.deadlineMs / 1000 if request.deadlineMs else None
         
         # Create generation record
         generation_id = str(uuid.uuid4())
@@ -62,8 +140,32 @@ async def generate_image(request: GenerateRequest, background_tasks: BackgroundT
         # In a real app, save to database here
         # await db.generations.insert_one(generation_data)
         
-        # Start background processing
-        background_tasks.add_task(process_generation, generation_id, request.prompt, request.mode)
+        # Reserve credits up front; settled or refunded when the job finishes
+        reservation = None
+        if creditLedger.CREDIT_METERING_ENABLED:
+            try:
+                reservation = await creditLedger.reserve(db, session_id, generation_id)
+            except creditLedger.AccountNotFoundError as e:
+                raise HTTPException(status_code=403, detail=str(e))
+            except creditLedger.InsufficientCreditsError as e:
+                raise HTTPException(status_code=402, detail=str(e))
+        
+        # Popular prompts are pre-rendered off-peak (see prompt_prewarm)
+        if request.mode == "text-to-image" and not request.imageId:
+            background_tasks.add_task(promptWarming.record_prompt, db, request.prompt)
+        
+        # Readable from GET /generate/{id} and its event stream straight away
+        await progressiveDelivery.publish_state(
+            generation_id, status="processing", stage="queued", prompt=request.prompt, mode=request.mode,
+            createdAt=generation_data["createdAt"].isoformat()
+        )
+        
+        # Start background processing as a job DELETE /generate/{id} can cancel
+        background_tasks.add_task(
+            generation_jobs.run, generation_id, process_generation,
+            generation_id, request.prompt, request.mode, db, reservation, session_id, tier, request.imageId, deadline,
+            image_ids=request.imageIds
+        )
         
         return GenerateResponse(
             success=True,
@@ -78,24 +180,139 @@ async def generate_image(request: GenerateRequest, background_tasks: BackgroundT
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
-async def process_generation(generation_id: str, prompt: str, mode: str):
-    """Background task to process image generation"""
+async def process_generation(
+    generation_id: str,
+    prompt: str,
+    mode: str,
+    db=None,
+    reservation: Optional[dict] = None,
+    session_id: Optional[str] = None,
+    tier: str = "free",
+    image_id: Optional[str] = None,
+    deadline: Optional[float] = None,
+    image_ids: Optional[List[str]] = None
+):
+    """Background task to process image generation, ending early on cancel or deadline"""
+    succeeded = False
     try:
-        # Use real AI processing
-        result = await aiService.generateImage(prompt, mode)
+        if generation_jobs.cancelled_early(generation_id):
+            raise asyncio.CancelledError()
+        result = None
+        if RESULT_CACHE_ENABLED and db is not None and mode == "text-to-image" and not image_id:
+            result = await promptWarming.get_cached_result(db, prompt, mode, aiService.providerName)
+        if result is None:
+            # Use real AI processing in the tier's lane, taking a fair share of provider concurrency
+            result = await generation_queue.run(
+                session_id or generation_id,
+                tier,
+                lambda: (
+                    aiService.processMultiImage(image_ids, prompt, deadline)
+                    if mode == "multi-image" and image_ids
+                    else aiService.processImageToImage(image_id, prompt, deadline)
+                    if mode == "image-to-image" and image_id
+                    else aiService.generateImage(prompt, mode, deadline=deadline)
+                ),
+                deadline=deadline
+            )
+        if not result['success']:
+            raise Exception(result['error'])
+        succeeded = True
+        
+        completed = {"processingTime": result['processingTime'], "metadata": result['metadata']}
+        if result['images'][0].startswith("data:"):
+            image_data = base64.b64decode(result['images'][0].split(",", 1)[1])
+            if PROGRESSIVE_DELIVERY_ENABLED:
+                # Placeholder, preview and full image go out as each encode finishes
+                delivery = progressiveDelivery.deliver(generation_id, image_data, **completed)
+            else:
+                delivery = progressiveDelivery.deliver_full(generation_id, image_data, **completed)
+            if db is not None:
+                # Indexed with its stored file, so similar-image lookups can link to it
+                await asyncio.gather(
+                    delivery,
+                    image_hash_index.index_image(db, generation_id, image_data, "generation", f"gen-{generation_id}.png")
+                )
+            else:
+                await delivery
+        else:
+            # Already stored (e.g. a pre-rendered result) - publish its URLs as they are
+            if result.get('thumbnails'):
+                completed["preview"] = result['thumbnails'][0]
+            await progressiveDelivery.publish_state(
+                generation_id, stage="full", status="completed", outputImages=result['images'], **completed
+            )
         
         # In a real app, update database here
-        # Update generation status to completed with results
-        print(f"Generation {generation_id} completed: {result['images'][0]}")
+        print(f"Generation {generation_id} completed: {result['images'][0][:80]}")
         
+    except asyncio.CancelledError:
+        generation_jobs.record_dropped(generation_id, "cancelled")
+        await progressiveDelivery.publish_state(generation_id, status="cancelled")
+        print(f"Generation {generation_id} cancelled")
+    except DeadlineExceeded as e:
+        generation_jobs.record_dropped(generation_id, "expired")
+        await progressiveDelivery.publish_state(generation_id, status="expired", error=str(e))
+        print(f"Generation {generation_id} missed its deadline: {str(e)}")
     except Exception as e:
+        await progressiveDelivery.publish_state(generation_id, status="failed", error=str(e))
         print(f"Generation {generation_id} failed: {str(e)}")
         # In a real app, update database status to failed
+    finally:
+        # Only completed generations are charged
+        if reservation is not None:
+            try:
+                if succeeded:
+                    await creditLedger.settle(db, reservation)
+                else:
+                    await creditLedger.release(db, reservation)
+            except Exception as e:
+                print(f"Credit settlement for {generation_id} failed: {str(e)}")
+
+@scheduled_task("prompt_prewarm", interval=float(os.getenv('PREWARM_INTERVAL', '3600')), budget=900, initial_delay=300)
+async def prewarm_prompts(context: TaskContext) -> dict:
+    """Pre-render the most requested prompts off-peak, within the daily cost budget"""
+    if not promptWarming.is_off_peak():
+        return {"skipped": "peak hours"}
+
+    showcase = [item["prompt"] for item in mock_gallery_items if item.get("metadata", {}).get("featured", False)]
+    prompts = await promptWarming.top_prompts(context.db, promptWarming.PREWARM_TOP_N, seeds=showcase)
+    provider = aiService.providerName
+    stats = {"candidates": len(prompts), "cached": 0, "rendered": 0, "failed": 0}
+
+    for prompt in prompts:
+        if await promptWarming.cached_entry(context.db, prompt, "text-to-image", provider) is not None:
+            stats["cached"] += 1
+            continue
+        if context.out_of_time(0.2):
+            stats["stopped"] = "out of time"
+            break
+        # Real users come first; try again next run
+        if generation_queue.active or generation_queue.depth:
+            stats["stopped"] = "queue busy"
+            break
+        if not await promptWarming.spend_budget(context.db, promptWarming.PREWARM_COST_PER_IMAGE):
+            stats["stopped"] = "budget spent"
+            break
+
+        result = await generation_queue.run(
+            "prewarm", "background", lambda: aiService.generateImage(prompt, "text-to-image")
+        )
+        if not result['success']:
+            stats["failed"] += 1
+            continue
+        await promptWarming.store_result(context.db, prompt, "text-to-image", provider, result)
+        stats["rendered"] += 1
+    return stats
 
 @router.get("/{generation_id}", response_model=GenerationStatus)
 async def get_generation_status(generation_id: str):
     """Get generation status and result"""
     try:
+        # Progress published by the job: placeholder, preview, then outputImages
+        state = await progressiveDelivery.get_state(generation_id)
+        if state is not None:
+            return json_response({"success": True, "generation": state})
+        
         # In a real app, fetch from database
         # For demo, return mock completed status
         mock_generation = {
@@ -107,15 +324,38 @@ async def get_generation_status(generation_id: str):
             "createdAt": datetime.utcnow().isoformat()
         }
         
-        return GenerationStatus(success=True, generation=mock_generation)
+        # Trusted payload - skip GenerationStatus re-validation
+        return json_response({"success": True, "generation": mock_generation})
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
+@router.get("/{generation_id}/events")
+async def stream_generation_events(generation_id: str):
+    """Server-sent events for each delivery stage: lqip, preview, then the full image"""
+    return StreamingResponse(
+        progressiveDelivery.stream_events(generation_id),
+        media_type="text/event-stream",
+        # no-transform keeps the compression middleware and proxies from buffering events
+        headers={"Cache-Control": "no-cache, no-transform", "X-Accel-Buffering": "no"}
+    )
+
+@router.delete("/{generation_id}")
+async def cancel_generation(generation_id: str):
+    """Cancel a queued or running generation; its reserved credits are released"""
+    # Generation IDs are random and only returned to the client that started the job
+    local = await generation_jobs.request_cancel(generation_id)
+    return json_response(
+        {"success": True, "generationId": generation_id, "status": "cancelled" if local else "cancelling"},
+        status_code=202
+    )
+
 @router.post("/upload")
 async def upload_reference_image(
+    background_tasks: BackgroundTasks,
     image: UploadFile = File(...),
-    sessionId: str = Form(...)
+    sessionId: str = Form(...),
+    db=Depends(get_db)
 ):
     """Upload reference image for image-to-image generation"""
     try:
@@ -130,24 +370,56 @@ async def upload_reference_image(
         file_extension = Path(image.filename).suffix
         filename = f"{uuid.uuid4()}{file_extension}"
         
-        # Ensure uploads directory exists
-        uploads_dir = Path(__file__).parent.parent / "uploads"
-        uploads_dir.mkdir(exist_ok=True)
+        content = await image.read()
+        
+        # Header-only check: rejects non-images and decompression bombs before any decode
+        try:
+            header = inspect_header(content)
+        except InvalidImageError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        
+        if UPLOAD_DEDUPE_ENABLED:
+            # Hash inline and hand back the stored copy of a near-identical upload
+            hashes = await image_hash_index.hash(content)
+            duplicate = await image_hash_index.find_duplicate(db, hashes[0])
+            if duplicate is not None:
+                stored = await storage.stat(duplicate["file"])
+                if stored is not None:
+                    return {
+                        "success": True,
+                        "message": "Matching image already uploaded",
+                        "duplicate": True,
+                        "file": {
+                            "id": duplicate["id"],
+                            "fileName": stored.name,
+                            "originalName": image.filename,
+                            "size": stored.size,
+                            "url": f"/api/files/{stored.name}",
+                            "uploadedAt": datetime.utcfromtimestamp(stored.modified).isoformat()
+                        }
+                    }
+        
+        # Save to the hot tier; it's demoted to cold storage once it falls out of use
+        await storage.save(filename, content)
         
-        # Save file
-        file_path = uploads_dir / filename
-        async with aiofiles.open(file_path, 'wb') as f:
-            content = await image.read()
-            await f.write(content)
+        file_id = filename.replace(file_extension, "")
+        if UPLOAD_DEDUPE_ENABLED:
+            await image_hash_index.add(db, file_id, hashes, "upload", filename)
+        else:
+            background_tasks.add_task(image_hash_index.index_image, db, file_id, content, "upload", filename)
+        # Colors, brightness and aspect for gallery filtering, batched in the worker pool
+        background_tasks.add_task(analyze_and_store, db, file_id, filename, content, header)
         
         return {
             "success": True,
             "message": "Image uploaded successfully",
             "file": {
-                "id": filename.replace(file_extension, ""),
+                "id": file_id,
                 "fileName": filename,
                 "originalName": image.filename,
                 "size": len(content),
+                "width": header.width,
+                "height": header.height,
                 "url": f"/api/files/{filename}",
                 "uploadedAt": datetime.utcnow().isoformat()
             }
@@ -1,12 +1,37 @@
-from fastapi import APIRouter, HTTPException, Request
+from fastapi import APIRouter, HTTPException, Request, Depends
 from pydantic import BaseModel, Field
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, Union, TYPE_CHECKING
 import os
 from datetime import datetime
-from emergentintegrations.payments.stripe.checkout import StripeCheckout, CheckoutSessionResponse, CheckoutStatusResponse, CheckoutSessionRequest
+from pymongo import IndexModel
+from services import creditLedger
+from services.cache import TTLCache
+from services.database import get_db, register_indexes
+from services.rateLimiter import RateLimiter, client_ip, get_rate_limiter
+from services.serialization import cached_json
+from services.sharedState import publish_invalidation
+from services.webhookInbox import WebhookInbox, get_webhook_inbox, webhook_handler
+
+if TYPE_CHECKING:
+    from emergentintegrations.payments.stripe.checkout import StripeCheckout
 
 router = APIRouter(prefix="/payments", tags=["payments"])
 
+register_indexes("payment_transactions", [
+    IndexModel([("session_id", 1)], name="session_id_unique", unique=True)
+])
+
+# Long-lived Stripe clients keyed by (api key, webhook url). The URL comes from the
+# request's Host header, so the cache is bounded and spoofed hosts just evict each other
+_stripe_clients = TTLCache(ttl=float('inf'), max_size=8)
+
+# Recent Stripe checkout statuses so polling during checkout doesn't hit Stripe every time
+checkout_status_cache = TTLCache(ttl=float(os.getenv('PAYMENT_STATUS_CACHE_TTL', '3')), max_size=5000)
+
+# Sessions in these states never change again
+TERMINAL_PAYMENT_STATUSES = {"paid", "no_payment_required"}
+TERMINAL_CHECKOUT_STATUSES = {"expired"}
+
 # Subscription packages - NEVER accept amounts from frontend
 SUBSCRIPTION_PACKAGES = {
     "pro_monthly": {
@@ -43,10 +68,85 @@ SUBSCRIPTION_PACKAGES = {
     }
 }
 
+def get_stripe_checkout(http_request: Request) -> "StripeCheckout":
+    """Return a reusable StripeCheckout client for this host"""
+    # Imported on first use - the Stripe SDK is only needed once someone pays
+    from emergentintegrations.payments.stripe.checkout import StripeCheckout
+
+    stripe_api_key = os.getenv('STRIPE_API_KEY')
+    if not stripe_api_key:
+        raise HTTPException(status_code=500, detail="Payment system not configured")
+
+    host_url = str(http_request.base_url)
+    webhook_url = f"{host_url}api/webhook/stripe"
+    key = (stripe_api_key, webhook_url)
+
+    stripe_checkout = _stripe_clients.get(key)
+    if stripe_checkout is None:
+        stripe_checkout = StripeCheckout(api_key=stripe_api_key, webhook_url=webhook_url)
+        _stripe_clients.set(key, stripe_checkout)
+    return stripe_checkout
+
+def is_terminal(payment_status: Optional[str], status: Optional[str]) -> bool:
+    """Whether a checkout session has reached a final state"""
+    return payment_status in TERMINAL_PAYMENT_STATUSES or status in TERMINAL_CHECKOUT_STATUSES
+
+async def grant_transaction_credits(db, session_id: str) -> bool:
+    """
+    Grant a paid transaction's package credits exactly once
+
+    The ledger entry is keyed on the session ID, so a webhook and a status
+    poll racing on the same session (or a redelivered event) can't apply it twice.
+
+    Returns:
+        bool: True if credits were granted by this call
+    """
+    transaction = await db.payment_transactions.find_one({"session_id": session_id})
+    if not transaction or transaction["payment_status"] != "paid":
+        return False
+
+    account_id = transaction.get("user_id")
+    package = SUBSCRIPTION_PACKAGES.get(transaction["package_id"])
+    if not account_id or not package:
+        print(f"Payment {session_id} has no account to credit")
+        return False
+
+    granted = await creditLedger.grant(
+        db, account_id, package["credits"], key=session_id, plan=transaction["package_id"]
+    )
+    if granted:
+        await db.payment_transactions.update_one(
+            {"session_id": session_id},
+            {"$set": {"credits_granted": True, "updated_at": datetime.utcnow()}}
+        )
+        print(f"Granted {package['credits']} credits to {account_id} for session {session_id}")
+    return granted
+
+@webhook_handler("checkout.session.completed")
+async def process_checkout_completed(db, payload: dict):
+    """Apply a queued checkout.session.completed event"""
+    session_id = payload["session_id"]
+    await db.payment_transactions.update_one(
+        {"session_id": session_id},
+        {
+            "$set": {
+                "payment_status": payload["payment_status"],
+                "webhook_processed": True,
+                "updated_at": datetime.utcnow()
+            }
+        }
+    )
+    checkout_status_cache.pop(session_id)
+    await publish_invalidation("payments", session_id)
+
+    if payload["payment_status"] == "paid":
+        await grant_transaction_credits(db, session_id)
+
 # Request Models
 class CreateCheckoutRequest(BaseModel):
     package_id: str = Field(..., description="The subscription package ID")
     origin_url: str = Field(..., description="The frontend origin URL for success/cancel redirects")
+    user_id: Optional[str] = Field(None, description="Account (or session) to credit once paid")
 
 class PaymentTransactionCreate(BaseModel):
     session_id: str
@@ -72,10 +172,10 @@ class PaymentStatusResponse(BaseModel):
     amount_total: float
     currency: str
     package_info: Dict[str, Any]
-    credits_added: Optional[int] = None
+    credits_added: Optional[Union[int, str]] = None
 
 @router.post("/checkout", response_model=CheckoutResponse)
-async def create_checkout_session(request: CreateCheckoutRequest, http_request: Request):
+async def create_checkout_session(request: CreateCheckoutRequest, http_request: Request, db=Depends(get_db)):
     """Create Stripe checkout session for subscription"""
     try:
         # Validate package exists
@@ -84,21 +184,15 @@ async def create_checkout_session(request: CreateCheckoutRequest, http_request:
         
         package = SUBSCRIPTION_PACKAGES[request.package_id]
         
-        # Get Stripe API key from environment
-        stripe_api_key = os.getenv('STRIPE_API_KEY')
-        if not stripe_api_key:
-            raise HTTPException(status_code=500, detail="Payment system not configured")
-        
-        # Initialize Stripe checkout
-        host_url = str(http_request.base_url)
-        webhook_url = f"{host_url}api/webhook/stripe"
-        stripe_checkout = StripeCheckout(api_key=stripe_api_key, webhook_url=webhook_url)
+        # Reuse the Stripe checkout client
+        stripe_checkout = get_stripe_checkout(http_request)
         
         # Build success and cancel URLs using frontend origin
         success_url = f"{request.origin_url}?payment_success=true&session_id={{CHECKOUT_SESSION_ID}}"
         cancel_url = f"{request.origin_url}?payment_cancelled=true"
         
         # Create checkout session request
+        from emergentintegrations.payments.stripe.checkout import CheckoutSessionRequest
         checkout_request = CheckoutSessionRequest(
             amount=package["amount"],
             currency=package["currency"],
@@ -113,12 +207,13 @@ async def create_checkout_session(request: CreateCheckoutRequest, http_request:
         )
         
         # Create checkout session with Stripe
-        session: CheckoutSessionResponse = await stripe_checkout.create_checkout_session(checkout_request)
+        session = await stripe_checkout.create_checkout_session(checkout_request)
         
         # Create payment transaction record
         transaction_data = PaymentTransactionCreate(
             session_id=session.session_id,
             package_id=request.package_id,
+            user_id=request.user_id,
             amount=package["amount"],
             currency=package["currency"],
             payment_status="pending",
@@ -131,7 +226,7 @@ async def create_checkout_session(request: CreateCheckoutRequest, http_request:
         )
         
         # Save transaction to database
-        await http_request.app.state.db.payment_transactions.insert_one({
+        await db.payment_transactions.insert_one({
             **transaction_data.dict(),
             "created_at": datetime.utcnow(),
             "updated_at": datetime.utcnow()
@@ -151,33 +246,42 @@ async def create_checkout_session(request: CreateCheckoutRequest, http_request:
         raise HTTPException(status_code=500, detail="Failed to create checkout session")
 
 @router.get("/status/{session_id}", response_model=PaymentStatusResponse)
-async def get_payment_status(session_id: str, http_request: Request):
+async def get_payment_status(session_id: str, http_request: Request, db=Depends(get_db)):
     """Get payment status and update credits if successful"""
     try:
         # Find transaction record
-        transaction = await http_request.app.state.db.payment_transactions.find_one({
+        transaction = await db.payment_transactions.find_one({
             "session_id": session_id
         })
         
         if not transaction:
             raise HTTPException(status_code=404, detail="Payment session not found")
         
-        # Get Stripe API key
-        stripe_api_key = os.getenv('STRIPE_API_KEY')
-        if not stripe_api_key:
-            raise HTTPException(status_code=500, detail="Payment system not configured")
+        package = SUBSCRIPTION_PACKAGES.get(transaction["package_id"], {})
         
-        # Initialize Stripe checkout
-        host_url = str(http_request.base_url)
-        webhook_url = f"{host_url}api/webhook/stripe"
-        stripe_checkout = StripeCheckout(api_key=stripe_api_key, webhook_url=webhook_url)
+        # Final states recorded in Mongo never change - answer without calling Stripe
+        if is_terminal(transaction["payment_status"], transaction.get("status")):
+            return PaymentStatusResponse(
+                success=True,
+                payment_status=transaction["payment_status"],
+                status=transaction.get("status") or "complete",
+                amount_total=transaction["amount"],
+                currency=transaction["currency"],
+                package_info=package,
+                credits_added=package.get("credits") if transaction["payment_status"] == "paid" else None
+            )
         
-        # Check payment status with Stripe
-        checkout_status: CheckoutStatusResponse = await stripe_checkout.get_checkout_status(session_id)
+        # Check payment status with Stripe, reusing a recent answer while the user polls
+        checkout_status = checkout_status_cache.get(session_id)
+        if checkout_status is None:
+            stripe_checkout = get_stripe_checkout(http_request)
+            checkout_status = await stripe_checkout.get_checkout_status(session_id)
+            checkout_status_cache.set(session_id, checkout_status)
         
-        # Update transaction status if changed
-        if checkout_status.payment_status != transaction["payment_status"]:
-            await http_request.app.state.db.payment_transactions.update_one(
+        # Update transaction status if changed (so terminal states short-circuit next time)
+        if (checkout_status.payment_status != transaction["payment_status"] or
+                checkout_status.status != transaction.get("status")):
+            await db.payment_transactions.update_one(
                 {"session_id": session_id},
                 {
                     "$set": {
@@ -188,26 +292,9 @@ async def get_payment_status(session_id: str, http_request: Request):
                 }
             )
             
-            # If payment successful and not already processed, add credits
-            if (checkout_status.payment_status == "paid" and 
-                transaction["payment_status"] != "paid"):
-                
-                package_id = transaction["package_id"]
-                if package_id in SUBSCRIPTION_PACKAGES:
-                    package = SUBSCRIPTION_PACKAGES[package_id]
-                    credits = package["credits"]
-                    
-                    # Add credits to user account (if they have an account)
-                    # For demo purposes, we'll just log this
-                    print(f"Payment successful for session {session_id}")
-                    print(f"Would add {credits} credits to user account")
-                    
-                    # In real implementation:
-                    # if transaction.get("user_id"):
-                    #     await add_credits_to_user(transaction["user_id"], credits)
-        
-        # Get updated package info
-        package = SUBSCRIPTION_PACKAGES.get(transaction["package_id"], {})
+            # If payment successful, add credits (idempotent if the webhook got there first)
+            if checkout_status.payment_status == "paid":
+                await grant_transaction_credits(db, session_id)
         
         return PaymentStatusResponse(
             success=True,
@@ -226,14 +313,9 @@ async def get_payment_status(session_id: str, http_request: Request):
         raise HTTPException(status_code=500, detail="Failed to get payment status")
 
 @router.post("/webhook/stripe")
-async def stripe_webhook(http_request: Request):
-    """Handle Stripe webhooks"""
+async def stripe_webhook(http_request: Request, inbox: WebhookInbox = Depends(get_webhook_inbox)):
+    """Verify a Stripe webhook, queue it and acknowledge immediately"""
     try:
-        # Get Stripe API key
-        stripe_api_key = os.getenv('STRIPE_API_KEY')
-        if not stripe_api_key:
-            raise HTTPException(status_code=500, detail="Payment system not configured")
-        
         # Get webhook body and signature
         webhook_body = await http_request.body()
         stripe_signature = http_request.headers.get("Stripe-Signature")
@@ -241,33 +323,21 @@ async def stripe_webhook(http_request: Request):
         if not stripe_signature:
             raise HTTPException(status_code=400, detail="Missing Stripe signature")
         
-        # Initialize Stripe checkout
-        host_url = str(http_request.base_url)
-        webhook_url = f"{host_url}api/webhook/stripe"
-        stripe_checkout = StripeCheckout(api_key=stripe_api_key, webhook_url=webhook_url)
+        # Reuse the Stripe checkout client
+        stripe_checkout = get_stripe_checkout(http_request)
         
         # Handle webhook
         webhook_response = await stripe_checkout.handle_webhook(webhook_body, stripe_signature)
         
-        # Process the webhook event
-        if webhook_response.event_type == "checkout.session.completed":
-            session_id = webhook_response.session_id
-            
-            # Update transaction status
-            await http_request.app.state.db.payment_transactions.update_one(
-                {"session_id": session_id},
-                {
-                    "$set": {
-                        "payment_status": webhook_response.payment_status,
-                        "webhook_processed": True,
-                        "updated_at": datetime.utcnow()
-                    }
-                }
-            )
-            
-            print(f"Webhook processed for session {session_id}")
+        # Queue for the inbox worker; redeliveries of the same event ID are dropped here
+        event_id = webhook_response.event_id or f"{webhook_response.event_type}:{webhook_response.session_id}"
+        queued = await inbox.enqueue(event_id, webhook_response.event_type, {
+            "session_id": webhook_response.session_id,
+            "payment_status": webhook_response.payment_status,
+            "metadata": webhook_response.metadata
+        })
         
-        return {"success": True, "event_processed": True}
+        return {"success": True, "event_received": True, "duplicate": not queued}
         
     except HTTPException:
         raise
@@ -275,10 +345,62 @@ async def stripe_webhook(http_request: Request):
         print(f"Webhook error: {str(e)}")
         raise HTTPException(status_code=500, detail="Webhook processing failed")
 
+@router.post("/credits/{account_id}")
+async def open_credit_account(
+    account_id: str,
+    http_request: Request,
+    db=Depends(get_db),
+    rate_limiter: RateLimiter = Depends(get_rate_limiter)
+):
+    """Open an account with the free credit allowance (once per account ID)"""
+    try:
+        if not 8 <= len(account_id) <= 64:
+            raise HTTPException(status_code=400, detail="Account ID must be 8 to 64 characters")
+        
+        # Existing accounts are returned as-is; only new ones count against the signup limit
+        account = await creditLedger.get_account(db, account_id)
+        if account is None:
+            decision = await rate_limiter.check([("signup", f"ip:{client_ip(http_request)}")])
+            if not decision.allowed:
+                raise HTTPException(
+                    status_code=429,
+                    detail=f"Too many new accounts. Try again in {decision.retry_after:.0f} seconds",
+                    headers={"Retry-After": str(max(1, round(decision.retry_after)))}
+                )
+            account = await creditLedger.open_account(db, account_id)
+        return {
+            "success": True,
+            "accountId": account_id,
+            "credits": account
+        }
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+
+@router.get("/credits/{account_id}")
+async def get_credit_balance(account_id: str, db=Depends(get_db)):
+    """Get an account's credit balance and plan"""
+    try:
+        account = await creditLedger.get_account(db, account_id)
+        if account is None:
+            raise HTTPException(status_code=404, detail="Account not found")
+        return {
+            "success": True,
+            "accountId": account_id,
+            "credits": account
+        }
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+
 @router.get("/packages")
 async def get_subscription_packages():
     """Get available subscription packages"""
-    return {
+    return cached_json("payments:packages", lambda: {
         "success": True,
         "packages": SUBSCRIPTION_PACKAGES
-    }
\ No newline at end of file
+    })
\ No newline at end of file
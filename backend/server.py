@@ -1,13 +1,15 @@
-from fastapi import FastAPI, APIRouter
+from fastapi import FastAPI, APIRouter, Depends, Query, HTTPException
+from fastapi.responses import StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
-from motor.motor_asyncio import AsyncIOMotorClient
 from dotenv import load_dotenv
+import asyncio
 import os
 import logging
 from pathlib import Path
 from pydantic import BaseModel, Field
-from typing import List
+from pymongo import IndexModel, ASCENDING
+from typing import List, Optional
 import uuid
 from datetime import datetime
 
@@ -17,13 +19,27 @@ from routes_python.gallery import router as gallery_router
 from routes_python.content import router as content_router
 from routes_python.files import router as files_router
 from routes_python.payments import router as payments_router
+from routes_python.admin import router as admin_router
+from services.database import create_client, get_db, ensure_indexes, check_database, register_indexes
+from services.serialization import FastJSONResponse, dumps
+from services.compression import CompressionMiddleware
+from services.microCache import MicroCacheMiddleware, micro_cache_stats
+from services.webhookInbox import WebhookInbox
+from services.rateLimiter import create_rate_limiter
+from services.aiService import aiService
+from services.fairQueue import generation_queue
+from services.generationJobs import generation_jobs
+from services.sharedState import init_shared_state, run_invalidation_listener
+from services.storage import storage
+from services.scheduler import Scheduler
+from services import creditLedger, progressiveDelivery
+from routes_python.payments import checkout_status_cache
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
-# MongoDB connection
-mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
+# MongoDB connection (pool size, timeouts, read preference and write concern from env)
+client = create_client(os.environ['MONGO_URL'])
 db = client[os.environ['DB_NAME']]
 
 # Create the main app
@@ -31,7 +47,8 @@ app = FastAPI(
     title="Nano Banana AI Image Editor API", 
     version="1.0.0",
     description="Advanced AI image editing with natural language prompts",
-    redirect_slashes=False  # Disable automatic slash redirects
+    redirect_slashes=False,  # Disable automatic slash redirects
+    default_response_class=FastJSONResponse
 )
 
 # Create a router with the /api prefix
@@ -46,6 +63,18 @@ class StatusCheck(BaseModel):
 class StatusCheckCreate(BaseModel):
     client_name: str
 
+# Status checks are paged by (timestamp, id) and expire after the retention window
+STATUS_CHECK_RETENTION_DAYS = int(os.getenv('STATUS_CHECK_RETENTION_DAYS', '30'))
+STATUS_CHECK_PROJECTION = {"_id": 0, "id": 1, "client_name": 1, "timestamp": 1}
+register_indexes("status_checks", [
+    IndexModel([("timestamp", ASCENDING), ("id", ASCENDING)], name="timestamp_id"),
+    IndexModel(
+        [("timestamp", ASCENDING)],
+        name="timestamp_ttl",
+        expireAfterSeconds=STATUS_CHECK_RETENTION_DAYS * 24 * 60 * 60
+    )
+])
+
 # Basic health check endpoints
 @api_router.get("/")
 async def root():
@@ -57,36 +86,80 @@ async def root():
     }
 
 @api_router.get("/health")
-async def health_check():
-    try:
-        # Test database connection
-        await db.list_collection_names()
+async def health_check(db=Depends(get_db)):
+    # Cached ping instead of listing collections on every probe
+    database = await check_database(db)
+    if database["connected"]:
         return {
             "status": "healthy",
             "database": "connected",
+            "databaseLatencyMs": database["latencyMs"],
             "timestamp": datetime.utcnow(),
             "services": ["API", "Database", "File Storage"]
         }
-    except Exception as e:
-        return {
-            "status": "unhealthy", 
-            "database": "disconnected",
-            "error": str(e),
-            "timestamp": datetime.utcnow()
-        }
+    return {
+        "status": "unhealthy", 
+        "database": "disconnected",
+        "error": database["error"],
+        "timestamp": datetime.utcnow()
+    }
 
 # Legacy status endpoints for backward compatibility
 @api_router.post("/status", response_model=StatusCheck)
-async def create_status_check(input: StatusCheckCreate):
+async def create_status_check(input: StatusCheckCreate, db=Depends(get_db)):
     status_dict = input.dict()
     status_obj = StatusCheck(**status_dict)
     _ = await db.status_checks.insert_one(status_obj.dict())
     return status_obj
 
 @api_router.get("/status", response_model=List[StatusCheck])
-async def get_status_checks():
-    status_checks = await db.status_checks.find().to_list(1000)
-    return [StatusCheck(**status_check) for status_check in status_checks]
+async def get_status_checks(
+    limit: int = Query(100, ge=1, le=1000),
+    after: Optional[datetime] = None,
+    after_id: Optional[str] = None,
+    db=Depends(get_db)
+):
+    """
+    Page through status checks oldest-first
+
+    Pass the timestamp and id of the last item as `after`/`after_id` to
+    fetch the next page. Documents are streamed from the cursor as they
+    arrive, so memory per request stays constant.
+    """
+    query = {}
+    if after_id and not after:
+        raise HTTPException(status_code=400, detail="after_id requires after")
+    if after:
+        query = {"$or": [
+            {"timestamp": {"$gt": after}},
+            {"timestamp": after, "id": {"$gt": after_id or ""}}
+        ]}
+
+    cursor = (
+        db.status_checks.find(query, STATUS_CHECK_PROJECTION)
+        .sort([("timestamp", ASCENDING), ("id", ASCENDING)])
+        .limit(limit)
+        .batch_size(min(limit, 100))
+    )
+    return StreamingResponse(_stream_status_checks(cursor), media_type="application/json")
+
+@api_router.get("/health/micro-cache")
+async def micro_cache_health():
+    return micro_cache_stats()
+
+@api_router.get("/health/queue")
+async def generation_queue_health():
+    """Provider slots in use, per-tier queue waits against their SLOs, and time saved by cancels"""
+    return {**generation_queue.stats(), "jobs": generation_jobs.stats()}
+
+async def _stream_status_checks(cursor):
+    """Encode projected documents straight to JSON, skipping model re-validation"""
+    yield b"["
+    separator = b""
+    async for status_check in cursor:
+        yield separator + dumps(status_check)
+        separator = b","
+    yield b"]"
 
 # Include all routers
 api_router.include_router(generate_router)
@@ -94,6 +167,7 @@ api_router.include_router(gallery_router)
 api_router.include_router(content_router)
 api_router.include_router(files_router)
 api_router.include_router(payments_router)
+api_router.include_router(admin_router)
 
 app.add_middleware(
     CORSMiddleware,
@@ -106,13 +180,57 @@ app.add_middleware(
 # Include the main API router in the app
 app.include_router(api_router)
 
+# Short-TTL cache for the anonymous GETs the landing page fires together; sits inside
+# compression so entries hold the uncompressed body
+if os.environ.get('MICRO_CACHE_ENABLED', 'true').lower() == 'true':
+    app.add_middleware(MicroCacheMiddleware)
+
+# Compress JSON and data-URL payloads; images from /api/files are skipped by content type
+app.add_middleware(
+    CompressionMiddleware,
+    minimum_size=int(os.environ.get('COMPRESSION_MIN_SIZE', '1024')),
+    gzip_level=int(os.environ.get('COMPRESSION_GZIP_LEVEL', '6')),
+    brotli_quality=int(os.environ.get('COMPRESSION_BROTLI_QUALITY', '4')),
+    zstd_level=int(os.environ.get('COMPRESSION_ZSTD_LEVEL', '3')),
+)
+
 # Add database to app state
 @app.on_event("startup")
 async def startup_db_client():
     app.state.db = db
+    # Counters, caches, locks and pub/sub shared across workers (SHARED_STATE_BACKEND)
+    app.state.shared_state = init_shared_state(db)
+    app.state.invalidation_listeners = [
+        asyncio.create_task(run_invalidation_listener("credits", creditLedger.balance_cache)),
+        asyncio.create_task(run_invalidation_listener("payments", checkout_status_cache)),
+        # Cancels for generation jobs running on this replica
+        asyncio.create_task(generation_jobs.listen()),
+        # One progress subscription per worker, shared by its open SSE streams
+        progressiveDelivery.start_listener(),
+    ]
+    # Build indexes in the background so an unreachable Mongo doesn't block boot
+    app.state.index_task = asyncio.create_task(ensure_indexes(db))
+    # Worker that processes queued Stripe webhooks
+    app.state.webhook_inbox = WebhookInbox(db)
+    app.state.webhook_inbox.start()
+    app.state.rate_limiter = create_rate_limiter(db)
+    # Move least recently used images from local disk to the cold tier
+    app.state.storage_demoter = asyncio.create_task(
+        storage.run_demoter(float(os.environ.get('STORAGE_DEMOTE_INTERVAL', '60')))
+    )
+    # Periodic maintenance (file cleanup, stats rollups, cache warming, index checks), one replica per run
+    app.state.scheduler = Scheduler(db).start()
+    # Providers are built lazily; optionally warm them off the event loop once we're serving
+    if os.environ.get('PROVIDER_WARMUP', 'false').lower() == 'true':
+        asyncio.get_running_loop().run_in_executor(None, aiService.warmup)
 
 @app.on_event("shutdown")
 async def shutdown_db_client():
+    await app.state.webhook_inbox.stop()
+    await app.state.scheduler.stop()
+    for listener in app.state.invalidation_listeners:
+        listener.cancel()
+    app.state.storage_demoter.cancel()
     client.close()
 
 app.add_middleware(
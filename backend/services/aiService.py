@@ -1,30 +1,57 @@
 import base64
 import asyncio
-import os
+import time
 from dotenv import load_dotenv
-from emergentintegrations.llm.openai.image_generation import OpenAIImageGeneration
+from services.fairQueue import DeadlineExceeded
+from services.generationJobs import generation_jobs, with_deadline
+from services.imagePreprocess import load_reference, load_references
+from services.imageProvider import create_provider, provider_class
+from services.promptEnhancer import promptEnhancer
 
 # Load environment variables
 load_dotenv()
 
 class AIService:
     def __init__(self):
-        # Get the Emergent LLM key
-        self.api_key = os.getenv('EMERGENT_LLM_KEY')
-        if not self.api_key:
-            raise ValueError("EMERGENT_LLM_KEY not found in environment variables")
-        
-        # Initialize OpenAI image generation
-        self.image_generator = OpenAIImageGeneration(api_key=self.api_key)
+        # Image backend selected by IMAGE_PROVIDER (Emergent/OpenAI by default, 'stub' offline).
+        # Built on first use so importing the app doesn't load the provider SDK or need its key
+        self._provider = None
+
+    @property
+    def provider(self):
+        if self._provider is None:
+            self._provider = create_provider()
+        return self._provider
+
+    @property
+    def providerName(self) -> str:
+        """Provider name for metadata and cache keys, the same whether or not it's built yet"""
+        if self._provider is not None:
+            return self._provider.name
+        return provider_class().name
 
-    async def generateImage(self, prompt: str, mode: str = "text-to-image", input_image: str = None):
+    def warmup(self):
+        """Construct the provider ahead of the first request (see PROVIDER_WARMUP)"""
+        return self.provider
+
+    async def generateImage(
+        self,
+        prompt: str,
+        mode: str = "text-to-image",
+        input_image: bytes = None,
+        deadline: float = None,
+        reference_images: list = None
+    ):
         """
         Generate image using OpenAI DALL-E through Emergent LLM Key
         
         Args:
             prompt (str): Text prompt for image generation
             mode (str): Generation mode ('text-to-image' or 'image-to-image')
-            input_image (str): Base64 or URL of input image (currently not used for DALL-E)
+            input_image (bytes): Provider-ready reference image for edits
+            deadline (float): time.monotonic() by which the provider call must finish;
+                it's cancelled and DeadlineExceeded raised once that passes
+            reference_images (list): Provider-ready references for one multi-image edit
             
         Returns:
             dict: Generation result with success status and image data
@@ -37,12 +64,17 @@ class AIService:
             # Enhance prompt for better results
             enhanced_prompt = self._enhance_prompt(prompt)
             
-            # Generate image using DALL-E
-            images = await self.image_generator.generate_images(
-                prompt=enhanced_prompt,
-                model="gpt-image-1",  # Latest DALL-E model
-                number_of_images=1
-            )
+            if deadline is not None and deadline <= time.monotonic():
+                raise DeadlineExceeded("Deadline passed before the provider call")
+            
+            # Edit the reference image, or generate from text
+            async with generation_jobs.provider_call():
+                if reference_images:
+                    images = await with_deadline(self.provider.edit_many(reference_images, enhanced_prompt), deadline)
+                elif input_image is not None:
+                    images = await with_deadline(self.provider.edit(input_image, enhanced_prompt), deadline)
+                else:
+                    images = await with_deadline(self.provider.generate(enhanced_prompt), deadline)
             
             if not images or len(images) == 0:
                 raise Exception("No image was generated by DALL-E")
@@ -61,7 +93,7 @@ class AIService:
                 'images': [image_data_url],
                 'processingTime': processing_time,
                 'metadata': {
-                    'model': 'dall-e-3-via-emergent',
+                    'model': self.providerName,
                     'enhanced_prompt': enhanced_prompt,
                     'original_prompt': prompt,
                     'mode': mode,
@@ -69,6 +101,8 @@ class AIService:
                 }
             }
             
+        except DeadlineExceeded:
+            raise
         except Exception as error:
             end_time = asyncio.get_event_loop().time()
             processing_time = (end_time - start_time) * 1000
@@ -80,7 +114,7 @@ class AIService:
                 'error': f'AI image generation failed: {str(error)}',
                 'processingTime': processing_time,
                 'metadata': {
-                    'model': 'dall-e-3-via-emergent',
+                    'model': self.providerName,
                     'prompt': prompt,
                     'mode': mode
                 }
@@ -96,48 +130,34 @@ class AIService:
         Returns:
             str: Enhanced prompt with quality modifiers
         """
-        # Don't enhance if prompt is already detailed
-        if len(prompt.split()) > 15:
-            return prompt
-            
-        # Add quality enhancers for better results
-        quality_enhancers = [
-            "highly detailed",
-            "professional quality", 
-            "8k resolution",
-            "stunning composition"
-        ]
-        
-        # Add style context based on content
-        if any(word in prompt.lower() for word in ['landscape', 'mountain', 'nature', 'forest', 'ocean']):
-            enhanced = f"{prompt}, {', '.join(quality_enhancers[:2])}, natural lighting, photorealistic"
-        elif any(word in prompt.lower() for word in ['portrait', 'person', 'character', 'face']):
-            enhanced = f"{prompt}, {', '.join(quality_enhancers)}, professional portrait lighting"
-        elif any(word in prompt.lower() for word in ['art', 'painting', 'drawing', 'artistic']):
-            enhanced = f"{prompt}, {', '.join(quality_enhancers)}, masterpiece, fine art"
-        else:
-            enhanced = f"{prompt}, {', '.join(quality_enhancers[:3])}"
-            
-        return enhanced
+        # Keyword categories and templates live in config/prompt_rules.json
+        return promptEnhancer.enhance(prompt)
 
-    async def processImageToImage(self, image_path: str, prompt: str):
+    async def processImageToImage(self, image_path: str, prompt: str, deadline: float = None):
         """
-        Process image-to-image generation
-        Note: DALL-E doesn't directly support image-to-image, so we'll use text-to-image with descriptive prompt
+        Process image-to-image generation through the provider's edit API
         
         Args:
-            image_path (str): Path to input image (for future reference)
+            image_path (str): Upload file name or ID from /generate/upload
             prompt (str): Text prompt for modifications
+            deadline (float): time.monotonic() by which the provider call must finish
             
         Returns:
             dict: Processing result
         """
         try:
-            # For now, treat as text-to-image since DALL-E 3 doesn't support image editing in the same way
-            # In the future, this could be enhanced with image analysis + prompt combination
-            enhanced_prompt = f"Create an image based on this description: {prompt}"
-            return await self.generateImage(enhanced_prompt, 'image-to-image', image_path)
-            
+            if not self.provider.supports_edit:
+                # Provider has no edit API - fall back to a descriptive text-to-image prompt
+                print(f"⚠️ {self.provider.name} can't edit images, falling back to text-to-image")
+                enhanced_prompt = f"Create an image based on this description: {prompt}"
+                return await self.generateImage(enhanced_prompt, 'image-to-image', deadline=deadline)
+            
+            # Load the upload, downscaling only if the provider can't take it as-is
+            input_image = await load_reference(image_path, self.provider)
+            return await self.generateImage(prompt, 'image-to-image', input_image, deadline)
+            
+        except DeadlineExceeded:
+            raise
         except Exception as error:
             print(f"❌ Image-to-Image processing error: {str(error)}")
             return {
@@ -145,6 +165,38 @@ class AIService:
                 'error': f'Image processing failed: {str(error)}'
             }
 
+    async def processMultiImage(self, image_refs: list, prompt: str, deadline: float = None):
+        """
+        Generate from several uploaded reference images in one provider call
+        
+        Args:
+            image_refs (list): Upload file names or IDs from /generate/upload
+            prompt (str): Text prompt describing how to combine them
+            deadline (float): time.monotonic() by which the provider call must finish
+            
+        Returns:
+            dict: Processing result
+        """
+        try:
+            if not self.provider.supports_edit:
+                print(f"⚠️ {self.provider.name} can't edit images, falling back to text-to-image")
+                return await self.generateImage(f"Create an image based on this description: {prompt}", 'multi-image', deadline=deadline)
+            
+            # Loaded and preprocessed in parallel; combined into a grid if the provider takes fewer images
+            references = await load_references(image_refs, self.provider)
+            if len(references) < len(image_refs):
+                prompt = f"{prompt}. The reference image is a grid of {len(image_refs)} images in reading order."
+            return await self.generateImage(prompt, 'multi-image', deadline=deadline, reference_images=references)
+            
+        except DeadlineExceeded:
+            raise
+        except Exception as error:
+            print(f"❌ Multi-image processing error: {str(error)}")
+            return {
+                'success': False,
+                'error': f'Image processing failed: {str(error)}'
+            }
+
     async def getGenerationStatus(self, generation_id: str):
         """
         Get generation status (for real-time updates)
@@ -170,7 +222,7 @@ class AIService:
         
         Args:
             prompt (str): Text prompt
-            mode (str): Generation mode
+            mode (str): Generation mode ('text-to-image', 'image-to-image' or 'multi-image')
             
         Returns:
             list: Array of validation errors
@@ -186,7 +238,7 @@ class AIService:
         if prompt and len(prompt) > 1000:
             errors.append('Prompt must be less than 1000 characters')
         
-        if mode and mode not in ['text-to-image', 'image-to-image']:
+        if mode and mode not in ['text-to-image', 'image-to-image', 'multi-image']:
             errors.append('Invalid generation mode')
             
         return errors
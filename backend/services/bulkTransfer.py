@@ -0,0 +1,187 @@
+import logging
+import time
+from datetime import datetime
+from typing import AsyncIterator, Dict, Iterable, Optional
+
+import orjson
+from bson import ObjectId, json_util
+from pymongo import ReplaceOne
+
+from services.compression import ZstdEncoder, zstandard
+
+logger = logging.getLogger(__name__)
+
+FORMAT_VERSION = 1
+
+# Collections covered by backup/migration, with the subset of documents to take
+EXPORT_COLLECTIONS: Dict[str, dict] = {
+    "generations": {},
+    "payment_transactions": {},
+    "credit_accounts": {},
+    "credit_ledger": {},
+    "image_hashes": {},
+    "image_metadata": {},
+    "shared_counters": {"_id": {"$regex": "^gallery:"}},  # gallery likes
+}
+
+# Output is handed to the client in chunks of about this size
+CHUNK_SIZE = 256 * 1024
+
+
+def _default(value):
+    # MongoDB Extended JSON (relaxed) for BSON types, so imports restore them exactly
+    if isinstance(value, ObjectId):
+        return {"$oid": str(value)}
+    if isinstance(value, datetime):
+        return {"$date": value.isoformat(timespec="milliseconds") + ("" if value.tzinfo else "Z")}
+    if isinstance(value, bytes):
+        return json_util.default(value)
+    raise TypeError(f"Cannot export {type(value).__name__}")
+
+
+def encode_line(record: dict) -> bytes:
+    return orjson.dumps(record, default=_default, option=orjson.OPT_PASSTHROUGH_DATETIME) + b"\n"
+
+
+def _restore(value):
+    if isinstance(value, dict):
+        value = {key: _restore(item) for key, item in value.items()}
+        if any(key.startswith("$") for key in value):
+            return json_util.object_hook(value)
+        return value
+    if isinstance(value, list):
+        return [_restore(item) for item in value]
+    return value
+
+
+def decode_line(line: bytes) -> dict:
+    return _restore(orjson.loads(line))
+
+
+async def export_ndjson(
+    db,
+    collections: Iterable[str],
+    batch_size: int = 1000,
+    compress: bool = False,
+    after: Optional[Dict[str, object]] = None
+) -> AsyncIterator[bytes]:
+    """
+    Stream collections as NDJSON, optionally zstd-compressed
+
+    The first line is a header; each following line is {"c": collection,
+    "d": document}. Documents are read in _id order, batch_size at a time,
+    and output is yielded in ~CHUNK_SIZE pieces, so memory stays bounded and
+    a slow reader simply pauses the cursor. `after` maps a collection to
+    the last _id already exported, to resume an interrupted export.
+    """
+    encoder = ZstdEncoder() if compress else None
+    buffer = bytearray(encode_line({"type": "header", "version": FORMAT_VERSION,
+                                    "exported_at": datetime.utcnow(), "collections": list(collections)}))
+
+    for name in collections:
+        query = dict(EXPORT_COLLECTIONS.get(name, {}))
+        if after and name in after:
+            query["_id"] = {**query.get("_id", {}), "$gt": after[name]}
+        cursor = db[name].find(query).sort("_id", 1).batch_size(batch_size)
+        async for doc in cursor:
+            buffer += encode_line({"c": name, "d": doc})
+            if len(buffer) >= CHUNK_SIZE:
+                yield encoder.compress(bytes(buffer)) if encoder else bytes(buffer)
+                buffer.clear()
+
+    if encoder:
+        yield encoder.compress(bytes(buffer)) + encoder.finish()
+    elif buffer:
+        yield bytes(buffer)
+
+
+async def _lines(chunks: AsyncIterator[bytes], compressed: bool) -> AsyncIterator[bytes]:
+    """Split a byte stream into lines, decompressing zstd as it arrives"""
+    decompressor = None
+    if compressed:
+        decompressor = zstandard.ZstdDecompressor().decompressobj()
+
+    pending = b""
+    async for chunk in chunks:
+        if not chunk:
+            continue
+        if decompressor:
+            try:
+                chunk = decompressor.decompress(chunk)
+            except zstandard.ZstdError as e:
+                raise ValueError(f"Invalid zstd stream: {str(e)}")
+        pending += chunk
+        *lines, pending = pending.split(b"\n")
+        for line in lines:
+            if line:
+                yield line
+    if pending.strip():
+        yield pending
+
+
+async def import_ndjson(
+    db,
+    chunks: AsyncIterator[bytes],
+    import_id: str,
+    compressed: bool = False,
+    batch_size: int = 1000,
+    allowed: Iterable[str] = EXPORT_COLLECTIONS
+) -> dict:
+    """
+    Load an export stream with batched bulk_write upserts, resumably
+
+    Documents are replaced by _id, so re-running an import is idempotent.
+    After every batch the line number reached is checkpointed in
+    bulk_import_checkpoints under import_id; running the same import_id
+    again skips lines up to that checkpoint.
+    """
+    allowed = set(allowed)
+    checkpoint = await db.bulk_import_checkpoints.find_one({"_id": import_id}) or {}
+    resume_from = checkpoint.get("line", 0)
+    started = time.perf_counter()
+    stats = {"imported": 0, "skipped": 0, "batches": 0}
+    batches: Dict[str, list] = {}
+    line_number = 0
+
+    async def flush():
+        for name, operations in batches.items():
+            if operations:
+                await db[name].bulk_write(operations, ordered=False)
+                stats["imported"] += len(operations)
+                stats["batches"] += 1
+        batches.clear()
+        await db.bulk_import_checkpoints.update_one(
+            {"_id": import_id},
+            {"$set": {"line": line_number, "updated_at": datetime.utcnow()}},
+            upsert=True
+        )
+
+    async for line in _lines(chunks, compressed):
+        line_number += 1
+        if line_number <= resume_from:
+            stats["skipped"] += 1
+            continue
+        record = decode_line(line)
+        if record.get("type") == "header":
+            if record.get("version") != FORMAT_VERSION:
+                raise ValueError(f"Unsupported export version: {record.get('version')}")
+            continue
+        name = record["c"]
+        if name not in allowed:
+            raise ValueError(f"Collection not importable: {name}")
+        batches.setdefault(name, []).append(ReplaceOne({"_id": record["d"]["_id"]}, record["d"], upsert=True))
+        if sum(len(operations) for operations in batches.values()) >= batch_size:
+            await flush()
+
+    await flush()
+    await db.bulk_import_checkpoints.update_one({"_id": import_id}, {"$set": {"completed": True}})
+
+    elapsed = time.perf_counter() - started
+    stats.update({
+        "importId": import_id,
+        "resumedFromLine": resume_from,
+        "seconds": round(elapsed, 3),
+        "docsPerSecond": round(stats["imported"] / elapsed, 1) if elapsed else 0.0
+    })
+    logger.info(f"Import {import_id}: {stats}")
+    return stats
@@ -0,0 +1,81 @@
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+
+
+class TTLCache:
+    """
+    Small in-process LRU cache with per-entry expiry
+
+    Args:
+        ttl (float): Default seconds an entry stays valid
+        max_size (int): Entries kept before the least recently used is evicted
+        max_bytes (int): Optional bound on the total len() of the cached values,
+            for caches holding bytes
+    """
+
+    def __init__(self, ttl: float, max_size: int = 10000, max_bytes: Optional[int] = None):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def _size(self, value: Any) -> int:
+        return len(value) if self.max_bytes is not None else 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return default
+
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            self._bytes -= self._size(value)
+            self.misses += 1
+            return default
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        self.pop(key)
+        if self.max_bytes is not None and len(value) > self.max_bytes:
+            # Wouldn't fit even with everything else evicted
+            return
+        self._entries[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+        self._bytes += self._size(value)
+        while len(self._entries) > self.max_size or (self.max_bytes is not None and self._bytes > self.max_bytes):
+            _, (_, evicted) = self._entries.popitem(last=False)
+            self._bytes -= self._size(evicted)
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return default
+        self._bytes -= self._size(entry[1])
+        return entry[1]
+
+    def clear(self):
+        self._entries.clear()
+        self._bytes = 0
+
+    def __contains__(self, key: Hashable) -> bool:
+        return self.get(key, _MISSING) is not _MISSING
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> dict:
+        stats = {"size": len(self._entries), "hits": self.hits, "misses": self.misses}
+        if self.max_bytes is not None:
+            stats["bytes"] = self._bytes
+        return stats
+
+
+_MISSING = object()
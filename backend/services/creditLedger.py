@@ -0,0 +1,326 @@
+import os
+from datetime import datetime, timedelta
+from typing import Optional, Sequence
+
+from pymongo import IndexModel, ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+from services.cache import TTLCache
+from services.database import register_indexes
+from services.scheduler import TaskContext, scheduled_task
+from services.sharedState import publish_invalidation
+
+# Credits every new account starts with, and the price of one generation
+FREE_CREDITS = int(os.getenv('FREE_CREDITS', '25'))
+GENERATION_CREDIT_COST = int(os.getenv('GENERATION_CREDIT_COST', '1'))
+CREDIT_METERING_ENABLED = os.getenv('CREDIT_METERING_ENABLED', 'true').lower() == 'true'
+# Ledger entries recently applied to an account, kept on it so retried writes aren't applied twice
+APPLIED_KEYS_KEPT = 1000
+# How often balances are checked against the ledger, and how long an account must be idle first
+RECONCILE_INTERVAL = float(os.getenv('CREDIT_RECONCILE_INTERVAL', '3600'))
+RECONCILE_QUIET_SECONDS = float(os.getenv('CREDIT_RECONCILE_QUIET_SECONDS', '300'))
+
+# Materialized account state (balance/unlimited) per account, kept in sync on every write
+balance_cache = TTLCache(ttl=float(os.getenv('CREDIT_BALANCE_CACHE_TTL', '30')), max_size=50000)
+
+register_indexes("credit_ledger", [
+    IndexModel([("account_id", 1), ("created_at", -1)], name="account_created"),
+    IndexModel([("created_at", 1)], name="created_at")
+])
+
+
+class AccountNotFoundError(Exception):
+    """Raised when metering an account that was never opened"""
+
+    def __init__(self, account_id: str):
+        super().__init__(f"Unknown account: {account_id}")
+        self.account_id = account_id
+
+
+class InsufficientCreditsError(Exception):
+    """Raised when an account can't cover a debit"""
+
+    def __init__(self, account_id: str, balance: int, required: int):
+        super().__init__(f"Insufficient credits: {balance} available, {required} required")
+        self.account_id = account_id
+        self.balance = balance
+        self.required = required
+
+
+def tier_for_plan(plan: Optional[str]) -> str:
+    """Map a subscription package ID (e.g. 'pro_monthly') to its tier"""
+    if plan and plan.startswith("enterprise"):
+        return "enterprise"
+    if plan and plan.startswith("pro"):
+        return "pro"
+    return "free"
+
+
+def _account_view(account: dict) -> dict:
+    return {
+        "balance": account.get("balance", 0),
+        "unlimited": account.get("unlimited", False),
+        "plan": account.get("plan", "free")
+    }
+
+
+async def _append(db, entry_id: str, account_id: str, amount: int, kind: str, **fields) -> bool:
+    """
+    Append a ledger entry under an idempotency key
+
+    Returns:
+        bool: False if an entry with this key already exists
+    """
+    try:
+        await db.credit_ledger.insert_one({
+            "_id": entry_id,
+            "account_id": account_id,
+            "amount": amount,
+            "kind": kind,
+            "created_at": datetime.utcnow(),
+            **fields
+        })
+        return True
+    except DuplicateKeyError:
+        return False
+
+
+async def _apply(
+    db,
+    account_id: str,
+    update: dict,
+    key: Optional[str] = None,
+    conditions: Sequence[dict] = (),
+    upsert: bool = False
+) -> Optional[dict]:
+    """
+    Apply an update to the materialized account and write it through to the cache
+
+    With a ledger entry `key`, the update is applied at most once: the key is
+    recorded on the account in the same write, and an account already listing
+    it doesn't match. Callers append the ledger entry first and call this
+    whether or not the append was a duplicate, so a retry finishes a write
+    that failed between the two steps.
+
+    Returns:
+        dict: The updated account view, or None if the account didn't match
+            (update already applied, a condition failed, or no such account)
+    """
+    now = datetime.utcnow()
+    update.setdefault("$set", {})["updated_at"] = now
+    update["$setOnInsert"] = {"created_at": now}
+    conditions = list(conditions)
+    if key is not None:
+        conditions.append({"applied": {"$ne": key}})
+        update["$push"] = {"applied": {"$each": [key], "$slice": -APPLIED_KEYS_KEPT}}
+    query = {"_id": account_id}
+    if conditions:
+        query["$and"] = conditions
+    account = await db.credit_accounts.find_one_and_update(
+        query,
+        update,
+        upsert=upsert,
+        return_document=ReturnDocument.AFTER
+    )
+    if account is None:
+        return None
+    view = _account_view(account)
+    balance_cache.set(account_id, view)
+    await publish_invalidation("credits", account_id)
+    return view
+
+
+async def get_account(db, account_id: str) -> Optional[dict]:
+    """
+    Return the account's balance and plan, or None if it was never opened
+
+    Served from the cache when possible.
+    """
+    view = balance_cache.get(account_id)
+    if view is not None:
+        return view
+
+    account = await db.credit_accounts.find_one({"_id": account_id})
+    if account is None:
+        return None
+
+    view = _account_view(account)
+    balance_cache.set(account_id, view)
+    return view
+
+
+async def open_account(db, account_id: str) -> dict:
+    """
+    Create an account with the free allowance
+
+    Idempotent: the allowance is granted once per account ID, so opening an
+    existing account just returns it. The account is created in a single
+    insert, so a retry after a failure part-way creates it then.
+    """
+    key = f"signup:{account_id}"
+    await _append(db, key, account_id, FREE_CREDITS, "grant", reason="free")
+    now = datetime.utcnow()
+    try:
+        await db.credit_accounts.insert_one({
+            "_id": account_id,
+            "balance": FREE_CREDITS,
+            "applied": [key],
+            "created_at": now,
+            "updated_at": now
+        })
+    except DuplicateKeyError:
+        pass
+    else:
+        await publish_invalidation("credits", account_id)
+    balance_cache.pop(account_id)
+    view = await get_account(db, account_id)
+    return view if view is not None else _account_view({})
+
+
+async def grant(db, account_id: str, credits, key: str, plan: Optional[str] = None) -> bool:
+    """
+    Credit an account exactly once per idempotency key
+
+    Args:
+        credits (int | str): Number of credits, or "unlimited" for enterprise plans
+        key (str): Idempotency key, e.g. the Stripe checkout session ID
+        plan (str): Subscription package to record on the account
+
+    Returns:
+        bool: True if this call applied the grant
+    """
+    if await get_account(db, account_id) is None:
+        await open_account(db, account_id)
+
+    unlimited = credits == "unlimited"
+    entry_id = f"grant:{key}"
+    await _append(db, entry_id, account_id, 0 if unlimited else int(credits), "grant", plan=plan)
+
+    update = {"$set": {"plan": plan}} if plan else {}
+    if unlimited:
+        update.setdefault("$set", {})["unlimited"] = True
+    else:
+        update["$inc"] = {"balance": int(credits)}
+    return await _apply(db, account_id, update, key=entry_id) is not None
+
+
+async def reserve(db, account_id: str, generation_id: str, cost: int = GENERATION_CREDIT_COST) -> dict:
+    """
+    Atomically check and debit credits for a generation
+
+    Unlimited accounts are answered from the cache without any database write.
+
+    Raises:
+        AccountNotFoundError: If the account was never opened
+        InsufficientCreditsError: If the balance can't cover the cost
+    """
+    view = await get_account(db, account_id)
+    if view is None:
+        raise AccountNotFoundError(account_id)
+    reservation = {"account_id": account_id, "generation_id": generation_id, "amount": cost}
+    if view["unlimited"]:
+        return {**reservation, "amount": 0, "unlimited": True}
+    reservation["unlimited"] = False
+
+    # Ledger first, so a debit is never applied without its entry
+    entry_id = f"reserve:{generation_id}"
+    await _append(db, entry_id, account_id, -cost, "reserve", generation_id=generation_id)
+    try:
+        updated = await _apply(
+            db, account_id, {"$inc": {"balance": -cost}}, key=entry_id,
+            conditions=[{"balance": {"$gte": cost}}]
+        )
+    except Exception:
+        # The debit may or may not have landed; a release squares it either way
+        await release(db, reservation)
+        raise
+    if updated is not None:
+        return reservation
+
+    account = await db.credit_accounts.find_one({"_id": account_id}, {"balance": 1, "applied": 1})
+    if account is not None and entry_id in account.get("applied", []):
+        # Already reserved for this generation
+        return reservation
+    # Not debited - balance the ledger entry with its release
+    await release(db, reservation)
+    raise InsufficientCreditsError(account_id, account["balance"] if account else 0, cost)
+
+
+async def settle(db, reservation: dict):
+    """Record that a reserved generation completed and its debit is final"""
+    if reservation["unlimited"]:
+        return
+    await _append(
+        db, f"settle:{reservation['generation_id']}", reservation["account_id"], 0, "settle",
+        generation_id=reservation["generation_id"]
+    )
+
+
+async def release(db, reservation: dict):
+    """
+    Refund a reservation for a generation that failed
+
+    The refund is applied at most once, and only if the reservation's debit
+    was; its ledger entry is written either way, which cancels out the
+    reservation's entry when nothing was debited.
+    """
+    if reservation["unlimited"]:
+        return
+    amount = reservation["amount"]
+    entry_id = f"release:{reservation['generation_id']}"
+    await _append(
+        db, entry_id, reservation["account_id"], amount, "release",
+        generation_id=reservation["generation_id"]
+    )
+    await _apply(
+        db, reservation["account_id"], {"$inc": {"balance": amount}}, key=entry_id,
+        conditions=[{"applied": f"reserve:{reservation['generation_id']}"}]
+    )
+
+
+async def ledger_balance(db, account_id: str) -> int:
+    """Sum of an account's ledger entries"""
+    pipeline = [
+        {"$match": {"account_id": account_id}},
+        {"$group": {"_id": None, "balance": {"$sum": "$amount"}}}
+    ]
+    totals = await db.credit_ledger.aggregate(pipeline).to_list(1)
+    return totals[0]["balance"] if totals else 0
+
+
+async def rebuild_balance(db, account_id: str) -> int:
+    """Recompute the materialized balance from the ledger (for reconciliation)"""
+    balance = await ledger_balance(db, account_id)
+    await _apply(db, account_id, {"$set": {"balance": balance}}, upsert=True)
+    return balance
+
+
+@scheduled_task("credit_reconcile", interval=RECONCILE_INTERVAL, budget=300, initial_delay=120)
+async def reconcile_balances(context: TaskContext) -> dict:
+    """
+    Rebuild balances that drifted from the ledger, for accounts with recent entries
+
+    Covers writes that failed between the ledger entry and the balance
+    update and were never retried. Accounts with entries in the last
+    RECONCILE_QUIET_SECONDS are left for the next run, as they may be mid-write.
+    """
+    now = datetime.utcnow()
+    quiet_since = now - timedelta(seconds=RECONCILE_QUIET_SECONDS)
+    pipeline = [
+        {"$match": {"created_at": {"$gte": now - timedelta(seconds=2 * RECONCILE_INTERVAL)}}},
+        {"$group": {"_id": "$account_id", "last": {"$max": "$created_at"}}}
+    ]
+    stats = {"checked": 0, "repaired": 0, "busy": 0}
+    for group in await context.db.credit_ledger.aggregate(pipeline).to_list(None):
+        if context.out_of_time():
+            stats["stopped"] = "out of time"
+            break
+        if group["last"] > quiet_since:
+            stats["busy"] += 1
+            continue
+        stats["checked"] += 1
+        account = await context.db.credit_accounts.find_one({"_id": group["_id"]}, {"balance": 1})
+        if account is None or account.get("balance") != await ledger_balance(context.db, group["_id"]):
+            await rebuild_balance(context.db, group["_id"])
+            stats["repaired"] += 1
+    return stats
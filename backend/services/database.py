@@ -0,0 +1,122 @@
+import asyncio
+import os
+import logging
+import time
+from typing import Dict, List, Optional
+
+from fastapi import Request
+from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorDatabase
+from pymongo import IndexModel
+
+logger = logging.getLogger(__name__)
+
+# Indexes registered by route/service modules, created once at startup
+INDEXES: Dict[str, List[IndexModel]] = {}
+
+# Cached result of the last readiness probe
+HEALTH_CACHE_TTL = float(os.getenv('MONGO_HEALTH_CACHE_TTL', '5'))
+_health_cache = {"checked_at": 0.0, "result": None}
+_health_lock: Optional[asyncio.Lock] = None
+
+
+def get_client_options() -> dict:
+    """
+    Build Motor client options from the environment
+
+    Returns:
+        dict: Keyword arguments for AsyncIOMotorClient
+    """
+    options = {
+        "maxPoolSize": int(os.getenv('MONGO_MAX_POOL_SIZE', '100')),
+        "minPoolSize": int(os.getenv('MONGO_MIN_POOL_SIZE', '5')),
+        "maxIdleTimeMS": int(os.getenv('MONGO_MAX_IDLE_TIME_MS', '60000')),
+        "serverSelectionTimeoutMS": int(os.getenv('MONGO_SERVER_SELECTION_TIMEOUT_MS', '5000')),
+        "connectTimeoutMS": int(os.getenv('MONGO_CONNECT_TIMEOUT_MS', '5000')),
+        "socketTimeoutMS": int(os.getenv('MONGO_SOCKET_TIMEOUT_MS', '20000')),
+        "waitQueueTimeoutMS": int(os.getenv('MONGO_WAIT_QUEUE_TIMEOUT_MS', '5000')),
+        "readPreference": os.getenv('MONGO_READ_PREFERENCE', 'primaryPreferred'),
+        "retryWrites": True,
+    }
+
+    write_concern = os.getenv('MONGO_WRITE_CONCERN', 'majority')
+    options["w"] = int(write_concern) if write_concern.isdigit() else write_concern
+    if os.getenv('MONGO_WRITE_TIMEOUT_MS'):
+        options["wTimeoutMS"] = int(os.environ['MONGO_WRITE_TIMEOUT_MS'])
+
+    return options
+
+
+def create_client(mongo_url: Optional[str] = None) -> AsyncIOMotorClient:
+    """Create the shared Motor client with tuned pool settings"""
+    return AsyncIOMotorClient(mongo_url or os.environ['MONGO_URL'], **get_client_options())
+
+
+def get_db(request: Request) -> AsyncIOMotorDatabase:
+    """
+    FastAPI dependency returning the shared database handle
+
+    Override with app.dependency_overrides[get_db] to run against a
+    local mongod or a mongomock stand-in.
+    """
+    return request.app.state.db
+
+
+def register_indexes(collection: str, indexes: List[IndexModel]):
+    """Register indexes to be created for a collection at startup"""
+    INDEXES.setdefault(collection, []).extend(indexes)
+
+
+async def ensure_indexes(db: AsyncIOMotorDatabase):
+    """Create all registered indexes (no-op for indexes that already exist)"""
+    for collection, indexes in INDEXES.items():
+        try:
+            names = await db[collection].create_indexes(indexes)
+            logger.info(f"Ensured indexes on {collection}: {', '.join(names)}")
+        except Exception as e:
+            logger.error(f"Failed to ensure indexes on {collection}: {str(e)}")
+
+
+async def check_database(db: AsyncIOMotorDatabase, ttl: float = HEALTH_CACHE_TTL) -> dict:
+    """
+    Lightweight readiness probe using a cached ping
+
+    Args:
+        db: Database handle to probe
+        ttl (float): Seconds to reuse the previous result
+
+    Returns:
+        dict: {"connected": bool, "latencyMs": float, "error": str | None}
+    """
+    global _health_lock
+
+    now = time.monotonic()
+    if _health_cache["result"] and now - _health_cache["checked_at"] < ttl:
+        return _health_cache["result"]
+
+    if _health_lock is None:
+        _health_lock = asyncio.Lock()
+
+    async with _health_lock:
+        # Another probe may have refreshed the cache while we waited
+        now = time.monotonic()
+        if _health_cache["result"] and now - _health_cache["checked_at"] < ttl:
+            return _health_cache["result"]
+
+        start = time.perf_counter()
+        try:
+            await db.command("ping")
+            result = {
+                "connected": True,
+                "latencyMs": round((time.perf_counter() - start) * 1000, 2),
+                "error": None
+            }
+        except Exception as e:
+            result = {
+                "connected": False,
+                "latencyMs": round((time.perf_counter() - start) * 1000, 2),
+                "error": str(e)
+            }
+
+        _health_cache["result"] = result
+        _health_cache["checked_at"] = time.monotonic()
+        return result
@@ -0,0 +1,232 @@
+import asyncio
+import heapq
+import itertools
+import os
+import time
+from collections import deque
+from typing import Awaitable, Callable, Dict, List, NamedTuple, Optional, Tuple, TypeVar
+
+T = TypeVar("T")
+
+# Share of provider capacity per plan tier when flows compete
+TIER_WEIGHTS = {"free": 1.0, "pro": 4.0, "enterprise": 8.0}
+
+
+class DeadlineExceeded(Exception):
+    """A job's deadline passed before it could finish"""
+
+
+class Lane(NamedTuple):
+    weight: float
+    # Slots no other lane may take, so this lane never waits behind a full house
+    reserved: int = 0
+    # Most of the slots this lane may hold while any other lane that can start has jobs waiting
+    share_under_load: float = 1.0
+    # Target queue wait in seconds, reported against in stats()
+    slo: float = 30.0
+
+
+LANES: Dict[str, Lane] = {
+    "free": Lane(
+        TIER_WEIGHTS["free"],
+        share_under_load=float(os.getenv('FREE_TIER_SHARE_UNDER_LOAD', '0.5')),
+        slo=float(os.getenv('FREE_TIER_QUEUE_SLO', '30'))
+    ),
+    "pro": Lane(TIER_WEIGHTS["pro"], slo=float(os.getenv('PRO_TIER_QUEUE_SLO', '5'))),
+    "enterprise": Lane(
+        TIER_WEIGHTS["enterprise"],
+        reserved=int(os.getenv('ENTERPRISE_RESERVED_SLOTS', '1')),
+        slo=float(os.getenv('ENTERPRISE_TIER_QUEUE_SLO', '2'))
+    ),
+    # Pre-rendering and other speculative work; only runs when nobody else is waiting
+    "background": Lane(0.25, share_under_load=0.0, slo=3600),
+}
+
+
+class LaneStats:
+    """Queue-wait samples for one lane"""
+
+    def __init__(self, samples: int = 1000):
+        self.waits = deque(maxlen=samples)
+        self.started = 0
+        self.within_slo = 0
+        self.expired = 0
+
+    def record(self, wait: float, slo: float):
+        self.waits.append(wait)
+        self.started += 1
+        if wait <= slo:
+            self.within_slo += 1
+
+    def percentile(self, fraction: float) -> float:
+        if not self.waits:
+            return 0.0
+        ordered = sorted(self.waits)
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+class FairQueue:
+    """
+    Weighted fair queue in front of a fixed number of provider slots
+
+    Each flow (a session) gets a virtual finish tag per job of
+    max(virtual clock, flow's last tag) + cost / weight, and free slots go to
+    the smallest tag. A session that submits 100 jobs therefore interleaves
+    with everyone else instead of occupying every slot, and heavier-weighted
+    tiers get proportionally more turns.
+
+    Jobs wait in per-tier lanes. A lane's weight sets its tags, `reserved`
+    slots are kept free for that lane alone, and `share_under_load` caps how
+    many slots it may hold while other lanes have jobs waiting - so a spike
+    of free-tier jobs can't push paying customers' jobs back.
+    """
+
+    def __init__(
+        self,
+        concurrency: int = int(os.getenv('PROVIDER_CONCURRENCY', '4')),
+        lanes: Dict[str, Lane] = LANES
+    ):
+        self.concurrency = concurrency
+        # Always leave at least one slot that any lane can use
+        budget = max(0, concurrency - 1)
+        self.lanes = {}
+        for name, lane in lanes.items():
+            reserved = min(lane.reserved, budget)
+            budget -= reserved
+            self.lanes[name] = lane._replace(reserved=reserved)
+        self.active = 0
+        self._active: Dict[str, int] = {name: 0 for name in self.lanes}
+        self._virtual_time = 0.0
+        self._last_finish: Dict[str, float] = {}
+        self._waiting: Dict[str, List[Tuple[float, int, float, asyncio.Future]]] = {name: [] for name in self.lanes}
+        self._sequence = itertools.count()
+        self._stats = {name: LaneStats() for name in self.lanes}
+
+    @property
+    def depth(self) -> int:
+        return sum(len(waiting) for waiting in self._waiting.values())
+
+    async def run(
+        self,
+        flow_id: str,
+        lane: str,
+        job: Callable[[], Awaitable[T]],
+        cost: float = 1.0,
+        deadline: Optional[float] = None
+    ) -> T:
+        """
+        Wait for this flow's turn in its lane, then run the job in a provider slot
+
+        With a time.monotonic() `deadline`, the job is dropped with
+        DeadlineExceeded if it passes before a slot comes free.
+        """
+        await self._acquire(flow_id, lane, cost, deadline)
+        try:
+            return await job()
+        finally:
+            self._release(lane)
+
+    async def _acquire(self, flow_id: str, lane: str, cost: float, deadline: Optional[float]):
+        if deadline is not None and deadline <= time.monotonic():
+            self._stats[lane].expired += 1
+            raise DeadlineExceeded("Deadline passed before the job was queued")
+        weight = self.lanes[lane].weight
+        finish = max(self._virtual_time, self._last_finish.get(flow_id, 0.0)) + cost / max(weight, 0.01)
+        self._last_finish[flow_id] = finish
+
+        future = asyncio.get_running_loop().create_future()
+        entry = (finish, next(self._sequence), time.monotonic(), future)
+        heapq.heappush(self._waiting[lane], entry)
+        self._dispatch()
+        if future.done():
+            return
+        try:
+            if deadline is None:
+                await future
+            else:
+                await asyncio.wait_for(future, deadline - time.monotonic())
+        except asyncio.TimeoutError:
+            self._abandon(lane, entry)
+            self._stats[lane].expired += 1
+            raise DeadlineExceeded("Deadline passed while waiting for a provider slot")
+        except asyncio.CancelledError:
+            self._abandon(lane, entry)
+            raise
+
+    def _abandon(self, lane: str, entry: tuple):
+        future = entry[3]
+        if future.done() and not future.cancelled():
+            # We were handed a slot just as we gave up - pass it on
+            self._release(lane)
+        elif entry in self._waiting[lane]:
+            # Leaving may let a lane held back by our waiting job start
+            self._waiting[lane].remove(entry)
+            heapq.heapify(self._waiting[lane])
+            self._dispatch()
+
+    def _can_start(self, name: str) -> bool:
+        lane = self.lanes[name]
+        held = sum(
+            max(0, other.reserved - self._active[other_name])
+            for other_name, other in self.lanes.items() if other_name != name
+        )
+        if self.active + held >= self.concurrency:
+            return False
+        # Only lanes that could take a slot count as load; a waiting background job
+        # (share 0) can't start while we wait, so it mustn't cap us and idle slots
+        if lane.share_under_load < 1.0 and any(
+            waiting for other_name, waiting in self._waiting.items()
+            if other_name != name and self.lanes[other_name].share_under_load > 0
+        ):
+            return self._active[name] < int(lane.share_under_load * self.concurrency)
+        return True
+
+    def _dispatch(self):
+        """Hand free slots to the smallest finish tag among lanes allowed to start"""
+        while self.active < self.concurrency:
+            best = None
+            for name, waiting in self._waiting.items():
+                while waiting and waiting[0][3].cancelled():
+                    heapq.heappop(waiting)
+                if waiting and (best is None or waiting[0][:2] < self._waiting[best][0][:2]) and self._can_start(name):
+                    best = name
+            if best is None:
+                return
+
+            finish, _, enqueued, future = heapq.heappop(self._waiting[best])
+            self.active += 1
+            self._active[best] += 1
+            self._virtual_time = max(self._virtual_time, finish)
+            self._stats[best].record(time.monotonic() - enqueued, self.lanes[best].slo)
+            future.set_result(None)
+
+    def _release(self, lane: str):
+        self.active -= 1
+        self._active[lane] -= 1
+        self._dispatch()
+        if not self.active and not self.depth:
+            # Idle - forget per-flow history so it can't grow without bound
+            self._last_finish.clear()
+
+    def stats(self) -> dict:
+        """Per-lane load and queue-wait percentiles against each lane's SLO"""
+        lanes = {}
+        for name, lane in self.lanes.items():
+            stats = self._stats[name]
+            lanes[name] = {
+                "active": self._active[name],
+                "waiting": len(self._waiting[name]),
+                "reserved": lane.reserved,
+                "sloSeconds": lane.slo,
+                "started": stats.started,
+                "expired": stats.expired,
+                "withinSlo": round(stats.within_slo / stats.started, 4) if stats.started else 1.0,
+                "waitP50": round(stats.percentile(0.5), 3),
+                "waitP95": round(stats.percentile(0.95), 3),
+                "waitP99": round(stats.percentile(0.99), 3)
+            }
+        return {"concurrency": self.concurrency, "active": self.active, "depth": self.depth, "lanes": lanes}
+
+
+# Shared queue for provider calls from generation jobs
+generation_queue = FairQueue()
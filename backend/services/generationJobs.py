@@ -0,0 +1,151 @@
+import asyncio
+import contextvars
+import logging
+import time
+from contextlib import asynccontextmanager
+from typing import Awaitable, Callable, Dict, Optional, TypeVar
+
+from services.cache import TTLCache
+from services.fairQueue import DeadlineExceeded
+from services.sharedState import WORKER_ID, get_shared_state
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+CANCEL_CHANNEL = "generation-cancel"
+
+# The job a provider call is made for, so it can be counted against that job
+_current_job: contextvars.ContextVar[Optional["Job"]] = contextvars.ContextVar("generation_job", default=None)
+
+
+async def with_deadline(awaitable: Awaitable[T], deadline: Optional[float]) -> T:
+    """Await with a time.monotonic() deadline, raising DeadlineExceeded once it passes"""
+    if deadline is None:
+        return await awaitable
+    remaining = deadline - time.monotonic()
+    if remaining <= 0:
+        if asyncio.iscoroutine(awaitable):
+            awaitable.close()
+        raise DeadlineExceeded("Deadline passed before the call started")
+    try:
+        return await asyncio.wait_for(awaitable, remaining)
+    except asyncio.TimeoutError:
+        raise DeadlineExceeded("Deadline passed during the call")
+
+
+class Job:
+    def __init__(self, generation_id: str):
+        self.generation_id = generation_id
+        self.task: Optional[asyncio.Task] = None
+        self.provider_started = False
+
+
+class GenerationJobs:
+    """
+    Generation jobs running in this process, cancellable by ID
+
+    Each job runs in its own task, so cancelling it unwinds the fair-queue
+    wait or the provider call in progress without touching the request that
+    started it. A cancel for a job on another replica is published on the
+    shared-state channel; one that arrives before its job starts is
+    remembered briefly and applied when the job does start.
+
+    Provider time is tracked as wasted (spent on calls cancelled part-way)
+    or saved (the typical call time not spent on jobs dropped before or
+    during their provider call).
+    """
+
+    def __init__(self):
+        self._jobs: Dict[str, Job] = {}
+        self._early_cancels = TTLCache(ttl=600, max_size=10000)
+        self.completed_calls = 0
+        self.average_call_seconds = 0.0
+        self.dropped = {"cancelled": 0, "expired": 0}
+        self.interrupted = 0
+        self.wasted_seconds = 0.0
+        self.saved_seconds = 0.0
+
+    async def run(self, generation_id: str, func: Callable[..., Awaitable[None]], *args, **kwargs):
+        """Run func(*args, **kwargs) as the job for generation_id and wait for it"""
+        job = Job(generation_id)
+        self._jobs[generation_id] = job
+        token = _current_job.set(job)
+        try:
+            job.task = asyncio.create_task(func(*args, **kwargs))
+        finally:
+            _current_job.reset(token)
+        try:
+            await job.task
+        finally:
+            self._jobs.pop(generation_id, None)
+
+    def cancelled_early(self, generation_id: str) -> bool:
+        """True if a cancel for this job arrived before it started"""
+        return self._early_cancels.pop(generation_id) is not None
+
+    def cancel(self, generation_id: str) -> bool:
+        """Cancel a job running here; otherwise remember the cancel in case it's about to start"""
+        job = self._jobs.get(generation_id)
+        if job is None or job.task is None:
+            self._early_cancels.set(generation_id, True)
+            return False
+        job.task.cancel()
+        return True
+
+    async def request_cancel(self, generation_id: str) -> bool:
+        """Cancel a job wherever it runs; True if it was running in this process"""
+        if self.cancel(generation_id):
+            return True
+        await get_shared_state().publish(CANCEL_CHANNEL, {"id": generation_id, "origin": WORKER_ID})
+        return False
+
+    async def listen(self):
+        """Apply cancels published by other replicas"""
+        async for message in get_shared_state().subscribe(CANCEL_CHANNEL):
+            if message.get("origin") != WORKER_ID:
+                self.cancel(message["id"])
+
+    def record_dropped(self, generation_id: str, reason: str):
+        """A job ended by cancel or deadline; counts as saved if its provider call never started"""
+        job = self._jobs.get(generation_id)
+        if job is not None and job.provider_started:
+            return
+        self.dropped[reason] += 1
+        self.saved_seconds += self.average_call_seconds
+
+    @asynccontextmanager
+    async def provider_call(self):
+        """Time a provider call made for the current job"""
+        job = _current_job.get()
+        if job is not None:
+            job.provider_started = True
+        started = time.monotonic()
+        try:
+            yield
+        except (asyncio.CancelledError, DeadlineExceeded):
+            elapsed = time.monotonic() - started
+            self.interrupted += 1
+            self.wasted_seconds += elapsed
+            self.saved_seconds += max(0.0, self.average_call_seconds - elapsed)
+            raise
+        else:
+            elapsed = time.monotonic() - started
+            self.completed_calls += 1
+            # Moving average so the "saved" estimate follows the provider's current speed
+            weight = 1 / min(self.completed_calls, 100)
+            self.average_call_seconds += (elapsed - self.average_call_seconds) * weight
+
+    def stats(self) -> dict:
+        return {
+            "running": len(self._jobs),
+            "completedCalls": self.completed_calls,
+            "averageCallSeconds": round(self.average_call_seconds, 3),
+            "droppedBeforeCall": dict(self.dropped),
+            "interruptedCalls": self.interrupted,
+            "providerSecondsWasted": round(self.wasted_seconds, 3),
+            "providerSecondsSaved": round(self.saved_seconds, 3)
+        }
+
+
+generation_jobs = GenerationJobs()
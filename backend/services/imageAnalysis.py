@@ -0,0 +1,246 @@
+import asyncio
+import io
+import logging
+import os
+from datetime import datetime
+from typing import Any, Callable, List, NamedTuple, Optional
+
+from pymongo import IndexModel
+
+from services.database import register_indexes
+from services.workerPool import run_in_pool
+
+logger = logging.getLogger(__name__)
+
+# Decoded size limits; a small file can still expand to gigabytes of pixels
+MAX_IMAGE_PIXELS = int(os.getenv('MAX_IMAGE_PIXELS', str(40_000_000)))
+MAX_IMAGE_SIDE = int(os.getenv('MAX_IMAGE_SIDE', '12000'))
+ALLOWED_FORMATS = {"PNG", "JPEG", "WEBP", "GIF", "BMP", "TIFF"}
+
+# Longest side of the thumbnail features are computed on
+ANALYSIS_SIDE = 64
+BRIGHTNESS_BINS = 8
+# 4 levels per channel -> 64-color palette for dominant colors
+PALETTE_LEVELS = 4
+
+register_indexes("image_metadata", [
+    IndexModel([("aspect", 1), ("created_at", -1)], name="aspect_created_at"),
+    IndexModel([("color_families", 1), ("created_at", -1)], name="color_families_created_at"),
+    IndexModel([("tone", 1), ("created_at", -1)], name="tone_created_at"),
+])
+
+
+class InvalidImageError(ValueError):
+    """Raised when uploaded bytes aren't an acceptable image"""
+
+
+class ImageHeader(NamedTuple):
+    format: str
+    width: int
+    height: int
+
+
+def inspect_header(data: bytes) -> ImageHeader:
+    """
+    Validate an image from its header alone
+
+    Pillow's open() only parses the header, so format and dimensions are
+    checked - and decompression bombs rejected - before any pixel data is
+    decoded.
+    """
+    from PIL import Image, UnidentifiedImageError
+
+    try:
+        with Image.open(io.BytesIO(data)) as img:
+            header = ImageHeader(img.format, img.width, img.height)
+    except Image.DecompressionBombError:
+        raise InvalidImageError("Image dimensions are too large")
+    except (UnidentifiedImageError, OSError, SyntaxError):
+        raise InvalidImageError("File is not a readable image")
+
+    if header.format not in ALLOWED_FORMATS:
+        raise InvalidImageError(f"Unsupported image format: {header.format}")
+    if header.width < 1 or header.height < 1:
+        raise InvalidImageError("Image has no pixels")
+    if max(header.width, header.height) > MAX_IMAGE_SIDE or header.width * header.height > MAX_IMAGE_PIXELS:
+        raise InvalidImageError("Image dimensions are too large")
+    return header
+
+
+def aspect_class(width: int, height: int) -> str:
+    ratio = width / height
+    if ratio >= 2.0:
+        return "panorama"
+    if ratio > 1.1:
+        return "landscape"
+    if ratio >= 1 / 1.1:
+        return "square"
+    return "portrait"
+
+
+def _color_family(r: int, g: int, b: int) -> str:
+    import colorsys
+
+    hue, lightness, saturation = colorsys.rgb_to_hls(r / 255, g / 255, b / 255)
+    if lightness < 0.15:
+        return "black"
+    if lightness > 0.9:
+        return "white"
+    if saturation < 0.2:
+        return "gray"
+    degrees = hue * 360
+    for limit, name in ((15, "red"), (45, "orange"), (70, "yellow"), (160, "green"),
+                        (200, "cyan"), (260, "blue"), (290, "purple"), (340, "pink")):
+        if degrees < limit:
+            return name
+    return "red"
+
+
+def _thumbnail(data: bytes):
+    import numpy as np
+    from PIL import Image
+
+    with Image.open(io.BytesIO(data)) as img:
+        img.draft("RGB", (ANALYSIS_SIDE, ANALYSIS_SIDE))  # JPEG decodes at a reduced scale
+        img.thumbnail((ANALYSIS_SIDE, ANALYSIS_SIDE))
+        return np.asarray(img.convert("RGB"), dtype=np.uint8).reshape(-1, 3)
+
+
+def analyze_batch(images: List[bytes]) -> List[dict]:
+    """
+    Color and brightness features for a batch of images (runs in the worker pool)
+
+    Each image is reduced to a small thumbnail, then every thumbnail's
+    pixels are processed together: one luminance pass and two offset
+    bincounts give every image's brightness histogram and palette counts.
+    Images that fail to decode get an {"error": ...} entry instead.
+    """
+    import numpy as np
+
+    results: List[Optional[dict]] = [None] * len(images)
+    pixels, owners = [], []
+    for i, data in enumerate(images):
+        try:
+            thumb = _thumbnail(data)
+        except Exception as e:
+            results[i] = {"error": str(e)}
+            continue
+        pixels.append(thumb)
+        owners.append(np.full(len(thumb), i, dtype=np.int64))
+    if not pixels:
+        return results
+
+    pixels = np.concatenate(pixels).astype(np.float32)
+    owners = np.concatenate(owners)
+    count = len(images)
+    per_image = np.bincount(owners, minlength=count)
+
+    luminance = pixels @ np.array([0.299, 0.587, 0.114], dtype=np.float32)
+    brightness_bins = np.minimum((luminance * BRIGHTNESS_BINS / 256).astype(np.int64), BRIGHTNESS_BINS - 1)
+    histograms = np.bincount(owners * BRIGHTNESS_BINS + brightness_bins, minlength=count * BRIGHTNESS_BINS)
+    histograms = histograms.reshape(count, BRIGHTNESS_BINS)
+    mean_brightness = np.bincount(owners, weights=luminance, minlength=count)
+
+    levels = (pixels * PALETTE_LEVELS / 256).astype(np.int64)
+    codes = (levels[:, 0] * PALETTE_LEVELS + levels[:, 1]) * PALETTE_LEVELS + levels[:, 2]
+    palette_size = PALETTE_LEVELS ** 3
+    palettes = np.bincount(owners * palette_size + codes, minlength=count * palette_size).reshape(count, palette_size)
+    top_codes = np.argsort(-palettes, axis=1)[:, :3]
+    step = 256 // PALETTE_LEVELS
+
+    for i in range(count):
+        if results[i] is not None:
+            continue
+        total = int(per_image[i])
+        colors = []
+        for code in top_codes[i]:
+            share = palettes[i, code] / total
+            if share < 0.05:
+                break
+            r, g, b = ((code // PALETTE_LEVELS ** 2) % PALETTE_LEVELS, (code // PALETTE_LEVELS) % PALETTE_LEVELS,
+                       code % PALETTE_LEVELS)
+            rgb = tuple(int(level * step + step // 2) for level in (r, g, b))
+            colors.append({"hex": "#%02x%02x%02x" % rgb, "share": round(float(share), 3),
+                           "family": _color_family(*rgb)})
+        brightness = float(mean_brightness[i] / total / 255)
+        results[i] = {
+            "dominant_colors": colors,
+            "color_families": sorted({color["family"] for color in colors}),
+            "brightness": round(brightness, 3),
+            "brightness_histogram": [round(float(v), 3) for v in histograms[i] / total],
+            "tone": "dark" if brightness < 0.35 else "light" if brightness > 0.65 else "balanced",
+        }
+    return results
+
+
+class BatchRunner:
+    """
+    Gather single-item calls into batches for a worker-pool function
+
+    Items submitted within max_delay of each other (up to max_batch) are
+    sent to the pool as one call, so per-task pickling and process hops
+    are paid per batch and the NumPy work runs over all of them at once.
+    """
+
+    def __init__(self, func: Callable[[List[Any]], List[Any]], max_batch: int = 16, max_delay: float = 0.02):
+        self.func = func
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self._pending: List[tuple] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._tasks = set()
+
+    async def submit(self, item: Any) -> Any:
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((item, future))
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.max_delay, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            task = asyncio.create_task(self._run(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch: List[tuple]):
+        try:
+            results = await run_in_pool(self.func, [item for item, _ in batch])
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+
+analysis_batcher = BatchRunner(analyze_batch)
+
+
+async def analyze_and_store(db, file_id: str, file_name: str, data: bytes, header: ImageHeader):
+    """Compute ingest features for an upload and save them for gallery filtering"""
+    try:
+        features = await analysis_batcher.submit(data)
+        if "error" in features:
+            logger.warning(f"Analysis of {file_name} failed: {features['error']}")
+            return
+        await db.image_metadata.replace_one({"_id": file_id}, {
+            "_id": file_id,
+            "file": file_name,
+            "format": header.format,
+            "width": header.width,
+            "height": header.height,
+            "aspect": aspect_class(header.width, header.height),
+            **features,
+            "created_at": datetime.utcnow()
+        }, upsert=True)
+    except Exception as e:
+        logger.warning(f"Analysis of {file_name} failed: {str(e)}")
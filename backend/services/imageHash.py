@@ -0,0 +1,279 @@
+import io
+import logging
+import os
+from collections import defaultdict
+from datetime import datetime, timedelta
+from itertools import combinations
+from typing import Dict, List, Optional, Tuple
+
+from pymongo import IndexModel
+
+from services.database import register_indexes
+from services.workerPool import run_in_pool
+
+logger = logging.getLogger(__name__)
+
+HASH_BITS = 64
+# Near-duplicate threshold on the 64-bit pHash (resized, recompressed or lightly edited copies)
+DUPLICATE_DISTANCE = int(os.getenv('IMAGE_DUPLICATE_DISTANCE', '6'))
+# Refreshes re-scan this far behind the newest hash seen, so documents written late or
+# stamped by another worker's clock aren't skipped; already-indexed IDs are ignored
+REFRESH_OVERLAP = timedelta(seconds=float(os.getenv('IMAGE_HASH_REFRESH_OVERLAP', '60')))
+
+register_indexes("image_hashes", [
+    IndexModel([("created_at", 1)], name="created_at")
+])
+
+
+def _grayscale(data: bytes, width: int, height: int):
+    import numpy as np
+    from PIL import Image
+
+    with Image.open(io.BytesIO(data)) as img:
+        img.draft("L", (width * 4, height * 4))  # let JPEG decode at reduced scale
+        small = img.convert("L").resize((width, height), Image.LANCZOS)
+    return np.asarray(small, dtype=np.float64)
+
+
+def _bits_to_int(bits) -> int:
+    value = 0
+    for bit in bits.ravel():
+        value = (value << 1) | int(bit)
+    return value
+
+
+def _dct_matrix(n: int):
+    import numpy as np
+
+    k = np.arange(n)
+    matrix = np.cos(np.pi * (2 * k[None, :] + 1) * k[:, None] / (2 * n)) * np.sqrt(2 / n)
+    matrix[0] /= np.sqrt(2)
+    return matrix
+
+
+def compute_hashes(data: bytes) -> Tuple[int, int]:
+    """
+    64-bit pHash and dHash of an image (runs in the worker pool)
+
+    pHash thresholds the lowest 8x8 DCT frequencies of a 32x32 grayscale
+    copy against their median; dHash compares horizontally adjacent pixels
+    of a 9x8 copy. Both survive resizing and recompression.
+    """
+    import numpy as np
+
+    pixels = _grayscale(data, 32, 32)
+    dct = _dct_matrix(32)
+    low = (dct @ pixels @ dct.T)[:8, :8]
+    phash = _bits_to_int(low > np.median(low.ravel()[1:]))
+
+    pixels = _grayscale(data, 9, 8)
+    dhash = _bits_to_int(pixels[:, 1:] > pixels[:, :-1])
+    return phash, dhash
+
+
+def hamming(a: int, b: int) -> int:
+    return (a ^ b).bit_count()
+
+
+def popcount(array):
+    """Per-element set-bit count of a uint64 array"""
+    import numpy as np
+
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(array)
+    return np.unpackbits(array.view(np.uint8).reshape(-1, 8), axis=1).sum(axis=1)
+
+
+class MultiIndexHash:
+    """
+    Hamming-radius search over 64-bit hashes by multi-index hashing
+
+    Each hash is split into `chunks` 16-bit substrings, each with its own
+    bucket table. Any hash within distance r of the query matches at least
+    one substring within r // chunks bits, so a query only probes buckets
+    within that small radius and verifies the candidates - sublinear,
+    unlike a scan, for the small radii near-duplicate search uses. Wider
+    searches fall back to a vectorized scan, which is cheaper there.
+    """
+
+    def __init__(self, chunks: int = 4):
+        self.chunks = chunks
+        self.chunk_bits = HASH_BITS // chunks
+        self._mask = (1 << self.chunk_bits) - 1
+        self._tables: List[Dict[int, List[int]]] = [defaultdict(list) for _ in range(chunks)]
+        self._hashes: Dict[str, int] = {}
+        self._slots: Dict[str, int] = {}
+        # Item IDs by slot; removed items leave None behind so slot numbers stay valid
+        self._ids: List[Optional[str]] = []
+        # Hash values by slot, grown by doubling, so candidates are verified in one vectorized
+        # pass; allocated on first add so importing the module doesn't load numpy
+        self._values = None
+
+    def __len__(self) -> int:
+        return len(self._hashes)
+
+    def __contains__(self, item_id: str) -> bool:
+        return item_id in self._hashes
+
+    def get(self, item_id: str) -> Optional[int]:
+        return self._hashes.get(item_id)
+
+    def _substrings(self, value: int):
+        return [(value >> (i * self.chunk_bits)) & self._mask for i in range(self.chunks)]
+
+    def add(self, item_id: str, value: int):
+        import numpy as np
+
+        if item_id in self._hashes:
+            return
+        slot = len(self._ids)
+        if self._values is None:
+            self._values = np.zeros(1024, dtype=np.uint64)
+        elif slot == len(self._values):
+            self._values = np.concatenate([self._values, np.zeros_like(self._values)])
+        self._values[slot] = value
+        self._ids.append(item_id)
+        self._slots[item_id] = slot
+        self._hashes[item_id] = value
+        for table, substring in zip(self._tables, self._substrings(value)):
+            table[substring].append(slot)
+
+    def remove(self, item_id: str):
+        value = self._hashes.pop(item_id, None)
+        if value is None:
+            return
+        slot = self._slots.pop(item_id)
+        self._ids[slot] = None
+        for table, substring in zip(self._tables, self._substrings(value)):
+            bucket = table[substring]
+            bucket.remove(slot)
+            if not bucket:
+                del table[substring]
+
+    def _variants(self, substring: int, radius: int):
+        yield substring
+        for flips in range(1, radius + 1):
+            for positions in combinations(range(self.chunk_bits), flips):
+                variant = substring
+                for position in positions:
+                    variant ^= 1 << position
+                yield variant
+
+    def search(self, value: int, max_distance: int, limit: Optional[int] = None) -> List[Tuple[int, str]]:
+        """(distance, id) pairs within max_distance, nearest first"""
+        import numpy as np
+
+        if not self._hashes:
+            return []
+        radius = max_distance // self.chunks
+        if radius >= 2:
+            # Past one flipped bit per substring the probes cost more than scanning every hash
+            distances = popcount(self._values[:len(self._ids)] ^ np.uint64(value))
+            slots = np.nonzero(distances <= max_distance)[0]
+            distances = distances[slots]
+        else:
+            candidates = []
+            for table, substring in zip(self._tables, self._substrings(value)):
+                for variant in self._variants(substring, radius):
+                    bucket = table.get(variant)
+                    if bucket:
+                        candidates.extend(bucket)
+            if not candidates:
+                return []
+            slots = np.unique(np.array(candidates, dtype=np.int64))
+            distances = popcount(self._values[slots] ^ np.uint64(value))
+            within = distances <= max_distance
+            slots, distances = slots[within], distances[within]
+
+        ids = (self._ids[slot] for slot in slots.tolist())
+        matches = sorted((d, i) for d, i in zip(distances.tolist(), ids) if i is not None)
+        return matches[:limit] if limit else matches
+
+
+class ImageHashIndex:
+    """
+    Perceptual hashes of uploaded and generated images
+
+    Hashes are persisted in `image_hashes` next to the file name and kind
+    they describe; each worker keeps a MultiIndexHash of the pHashes,
+    loaded on first use and topped up with newer documents before queries
+    so hashes indexed by other workers show up. Hashes another worker
+    forgets stay in this worker's index but are dropped on lookup, since
+    their documents are gone.
+    """
+
+    def __init__(self):
+        self.index = MultiIndexHash()
+        self._loaded_until: Optional[datetime] = None
+
+    async def refresh(self, db):
+        """Load hashes persisted since the last refresh, re-scanning REFRESH_OVERLAP behind it"""
+        query = {"created_at": {"$gte": self._loaded_until - REFRESH_OVERLAP}} if self._loaded_until else {}
+        async for doc in db.image_hashes.find(query, {"phash": 1, "created_at": 1}).sort("created_at", 1):
+            self.index.add(doc["_id"], int(doc["phash"], 16))
+            self._loaded_until = max(self._loaded_until or doc["created_at"], doc["created_at"])
+
+    async def hash(self, data: bytes) -> Tuple[int, int]:
+        """(pHash, dHash), computed in the worker pool"""
+        return await run_in_pool(compute_hashes, data)
+
+    async def add(self, db, item_id: str, hashes: Tuple[int, int], kind: str, file_name: Optional[str] = None):
+        """Persist an item's hashes and add it to the search index"""
+        phash, dhash = hashes
+        doc = {
+            "_id": item_id,
+            "kind": kind,
+            "file": file_name,
+            "phash": f"{phash:016x}",
+            "dhash": f"{dhash:016x}",
+            "created_at": datetime.utcnow()
+        }
+        await db.image_hashes.replace_one({"_id": item_id}, doc, upsert=True)
+        self.index.add(item_id, phash)
+
+    async def index_image(self, db, item_id: str, data: bytes, kind: str, file_name: Optional[str] = None):
+        """Hash and index an image once an upload or generation completes"""
+        try:
+            await self.add(db, item_id, await self.hash(data), kind, file_name)
+        except Exception as e:
+            logger.warning(f"Hashing {kind} {item_id} failed: {str(e)}")
+
+    async def forget_file(self, db, file_name: str):
+        """Drop the hashes of a deleted file from the collection and this worker's index"""
+        ids = [doc["_id"] async for doc in db.image_hashes.find({"file": file_name}, {"_id": 1})]
+        if not ids:
+            return
+        await db.image_hashes.delete_many({"_id": {"$in": ids}})
+        for item_id in ids:
+            self.index.remove(item_id)
+
+    async def similar(self, db, item_id: str, max_distance: int = 10, limit: int = 20) -> Optional[List[dict]]:
+        """Indexed items near item_id, or None if item_id hasn't been hashed"""
+        await self.refresh(db)
+        phash = self.index.get(item_id)
+        if phash is None:
+            return None
+        matches = [(d, i) for d, i in self.index.search(phash, max_distance) if i != item_id][:limit]
+        return await self._describe(db, matches)
+
+    async def find_duplicate(self, db, phash: int, max_distance: int = DUPLICATE_DISTANCE) -> Optional[dict]:
+        """Closest stored file within max_distance of a pHash"""
+        await self.refresh(db)
+        matches = self.index.search(phash, max_distance, limit=20)
+        return next((match for match in await self._describe(db, matches) if match["file"]), None)
+
+    async def _describe(self, db, matches: List[Tuple[int, str]]) -> List[dict]:
+        if not matches:
+            return []
+        docs = {
+            doc["_id"]: doc
+            async for doc in db.image_hashes.find({"_id": {"$in": [i for _, i in matches]}}, {"kind": 1, "file": 1})
+        }
+        return [
+            {"id": item_id, "distance": distance, "kind": docs[item_id]["kind"], "file": docs[item_id]["file"]}
+            for distance, item_id in matches if item_id in docs
+        ]
+
+
+# Process-wide index
+image_hash_index = ImageHashIndex()
@@ -0,0 +1,177 @@
+import asyncio
+import hashlib
+import io
+import math
+import os
+from typing import List, Sequence, Tuple
+
+from services.cache import TTLCache
+from services.storage import storage
+from services.workerPool import run_in_pool
+
+# Downscaled inputs, tiles and grids keyed by content hash; bounded by total bytes per worker
+preprocessed_cache = TTLCache(
+    ttl=3600,
+    max_size=256,
+    max_bytes=int(float(os.getenv('PREPROCESS_CACHE_MB', '128')) * 1024 * 1024)
+)
+
+
+def probe_image(data: bytes) -> Tuple[str, int, int]:
+    """Read format and dimensions from the image header without decoding pixels"""
+    from PIL import Image
+
+    with Image.open(io.BytesIO(data)) as img:
+        return img.format, img.width, img.height
+
+
+def downscale_image(data: bytes, max_side: int, output_format: str) -> bytes:
+    """Resize so the longest edge fits max_side and re-encode (runs in the worker pool)"""
+    from PIL import Image
+
+    with Image.open(io.BytesIO(data)) as img:
+        img.thumbnail((max_side, max_side), Image.LANCZOS)
+        if output_format == "JPEG" and img.mode not in ("RGB", "L"):
+            img = img.convert("RGB")
+        out = io.BytesIO()
+        img.save(out, format=output_format)
+        return out.getvalue()
+
+
+def make_thumbnail(data: bytes, max_side: int = 256, quality: int = 80) -> bytes:
+    """WebP preview for gallery grids and cached results (runs in the worker pool)"""
+    from PIL import Image
+
+    with Image.open(io.BytesIO(data)) as img:
+        img.draft("RGB", (max_side, max_side))
+        img.thumbnail((max_side, max_side), Image.LANCZOS)
+        if img.mode not in ("RGB", "RGBA"):
+            img = img.convert("RGBA" if "transparency" in img.info else "RGB")
+        out = io.BytesIO()
+        img.save(out, format="WEBP", quality=quality, method=4)
+        return out.getvalue()
+
+
+def make_lqip(data: bytes, side: int = 16) -> bytes:
+    """Tiny blurred WebP placeholder, a few hundred bytes, shown while larger versions load (runs in the worker pool)"""
+    from PIL import Image, ImageFilter
+
+    with Image.open(io.BytesIO(data)) as img:
+        img.draft("RGB", (side * 4, side * 4))
+        img = img.convert("RGB")
+        img.thumbnail((side, side), Image.BILINEAR)
+        img = img.filter(ImageFilter.GaussianBlur(1))
+        out = io.BytesIO()
+        img.save(out, format="WEBP", quality=40)
+        return out.getvalue()
+
+
+async def prepare_input(data: bytes, provider) -> bytes:
+    """
+    Make image bytes acceptable to the provider
+
+    Inputs already within the provider's format, size and dimension limits
+    are passed through untouched; others are downscaled in the worker pool.
+    Downscaled results are cached by content hash so repeated edits skip the
+    work (pass-through inputs aren't, as there's no work to save).
+    """
+    formats = tuple(sorted(provider.input_formats))
+    key = (hashlib.sha256(data).hexdigest(), provider.max_input_side, formats)
+    cached = preprocessed_cache.get(key)
+    if cached is not None:
+        return cached
+
+    image_format, width, height = probe_image(data)
+    if (image_format in provider.input_formats and
+            max(width, height) <= provider.max_input_side and
+            len(data) <= provider.max_input_bytes):
+        return data
+
+    output_format = image_format if image_format in provider.input_formats else "PNG"
+    prepared = await run_in_pool(downscale_image, data, provider.max_input_side, output_format)
+    preprocessed_cache.set(key, prepared)
+    return prepared
+
+
+async def load_reference(file_ref: str, provider) -> bytes:
+    """Load an upload from either storage tier and return provider-ready bytes"""
+    name = await storage.locate(file_ref)
+    if name is None:
+        raise FileNotFoundError(f"Reference image not found: {file_ref}")
+
+    data = await storage.read(name)
+    return await prepare_input(data, provider)
+
+
+def normalize_tile(data: bytes, side: int) -> bytes:
+    """Decode, apply EXIF orientation, flatten to RGB and fit within side x side (runs in the worker pool)"""
+    from PIL import Image, ImageOps
+
+    with Image.open(io.BytesIO(data)) as img:
+        img.draft("RGB", (side, side))
+        img = ImageOps.exif_transpose(img)
+        if img.mode != "RGB":
+            background = Image.new("RGB", img.size, (255, 255, 255))
+            rgba = img.convert("RGBA")
+            background.paste(rgba, mask=rgba.getchannel("A"))
+            img = background
+        img.thumbnail((side, side), Image.LANCZOS)
+        out = io.BytesIO()
+        img.save(out, format="PNG")
+        return out.getvalue()
+
+
+def compose_grid(tiles: List[bytes], side: int) -> bytes:
+    """Lay normalized tiles out in reading order on one near-square canvas (runs in the worker pool)"""
+    from PIL import Image
+
+    columns = math.ceil(math.sqrt(len(tiles)))
+    rows = math.ceil(len(tiles) / columns)
+    canvas = Image.new("RGB", (columns * side, rows * side), (255, 255, 255))
+    for index, tile in enumerate(tiles):
+        with Image.open(io.BytesIO(tile)) as img:
+            row, column = divmod(index, columns)
+            # Centre each tile in its cell
+            canvas.paste(img, (column * side + (side - img.width) // 2, row * side + (side - img.height) // 2))
+    out = io.BytesIO()
+    canvas.save(out, format="PNG")
+    return out.getvalue()
+
+
+async def _normalized_tile(data: bytes, side: int) -> bytes:
+    key = ("tile", hashlib.sha256(data).hexdigest(), side)
+    cached = preprocessed_cache.get(key)
+    if cached is None:
+        cached = await run_in_pool(normalize_tile, data, side)
+        preprocessed_cache.set(key, cached)
+    return cached
+
+
+async def load_references(file_refs: Sequence[str], provider) -> List[bytes]:
+    """
+    Load several uploads as inputs for one provider call
+
+    Uploads are read and preprocessed concurrently in the worker pool. If
+    the provider takes fewer images than given, they are normalized and
+    combined into a single grid image instead. Both the per-image results
+    and the combined grid are cached by content hash, so iterating on the
+    same set of references repeats none of the work.
+    """
+    names = await asyncio.gather(*(storage.locate(file_ref) for file_ref in file_refs))
+    missing = [file_ref for file_ref, name in zip(file_refs, names) if name is None]
+    if missing:
+        raise FileNotFoundError(f"Reference images not found: {', '.join(missing)}")
+    images = await asyncio.gather(*(storage.read(name) for name in names))
+
+    if len(images) <= provider.max_input_images:
+        return list(await asyncio.gather(*(prepare_input(data, provider) for data in images)))
+
+    columns = math.ceil(math.sqrt(len(images)))
+    side = provider.max_input_side // columns
+    key = ("grid", tuple(hashlib.sha256(data).hexdigest() for data in images), side)
+    grid = preprocessed_cache.get(key)
+    if grid is None:
+        tiles = await asyncio.gather(*(_normalized_tile(data, side) for data in images))
+        grid = await run_in_pool(compose_grid, list(tiles), side)
+        preprocessed_cache.set(key, grid)
+    return [grid]
@@ -0,0 +1,138 @@
+import asyncio
+import hashlib
+import os
+import struct
+import zlib
+from typing import List, Type
+
+
+class ImageProvider:
+    """
+    Interface every image backend implements
+
+    Attributes:
+        name (str): Identifier reported in generation metadata
+        max_input_side (int): Longest edge accepted for edit inputs
+        max_input_bytes (int): Largest edit input accepted
+        input_formats (set): Pillow format names accepted for edit inputs
+        supports_edit (bool): Whether edit() is implemented
+        max_input_images (int): Most reference images edit_many() takes in one call
+    """
+    name = "provider"
+    supports_edit = False
+    max_input_images = 1
+    max_input_side = 1536
+    max_input_bytes = 20 * 1024 * 1024
+    input_formats = {"PNG", "JPEG", "WEBP"}
+
+    async def generate(self, prompt: str, number_of_images: int = 1) -> List[bytes]:
+        raise NotImplementedError
+
+    async def edit(self, image: bytes, prompt: str, number_of_images: int = 1) -> List[bytes]:
+        raise NotImplementedError
+
+    async def edit_many(self, images: List[bytes], prompt: str, number_of_images: int = 1) -> List[bytes]:
+        """Edit from up to max_input_images references in one call"""
+        if len(images) == 1:
+            return await self.edit(images[0], prompt, number_of_images)
+        raise NotImplementedError
+
+
+class EmergentOpenAIProvider(ImageProvider):
+    """
+    OpenAI image models through the Emergent LLM key
+
+    Only OpenAIImageGeneration.generate_images(prompt=, model=,
+    number_of_images=) is relied on. The SDK isn't pinned or vendored here
+    and its edit API hasn't been checked, so supports_edit stays False and
+    image-to-image requests use the text-to-image fallback until it is.
+    """
+    name = "dall-e-3-via-emergent"
+    # Set once edit() is verified against the installed emergentintegrations release
+    supports_edit = False
+
+    def __init__(self, api_key: str, model: str = "gpt-image-1"):
+        from emergentintegrations.llm.openai.image_generation import OpenAIImageGeneration
+
+        self.model = model
+        self.image_generator = OpenAIImageGeneration(api_key=api_key)
+
+    async def generate(self, prompt: str, number_of_images: int = 1) -> List[bytes]:
+        return await self.image_generator.generate_images(
+            prompt=prompt,
+            model=self.model,
+            number_of_images=number_of_images
+        )
+
+    async def edit(self, image: bytes, prompt: str, number_of_images: int = 1) -> List[bytes]:
+        # Unverified: assumes an edit_images counterpart to generate_images; not called while supports_edit is False
+        return await self.image_generator.edit_images(
+            image=image,
+            prompt=prompt,
+            model=self.model,
+            number_of_images=number_of_images
+        )
+
+
+def _solid_png(width: int, height: int, rgb: bytes) -> bytes:
+    """Encode a solid-colour RGB PNG without any imaging library"""
+    def chunk(kind: bytes, data: bytes) -> bytes:
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+
+    raw = (b"\x00" + rgb * width) * height
+    header = struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)
+    return b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", header) + chunk(b"IDAT", zlib.compress(raw)) + chunk(b"IEND", b"")
+
+
+class StubImageProvider(ImageProvider):
+    """
+    Offline provider for tests and benchmarks
+
+    Returns a deterministic PNG coloured by the prompt (and input image, for
+    edits) after an optional simulated latency.
+    """
+    name = "stub"
+    supports_edit = True
+    max_input_images = 4
+
+    def __init__(self, latency: float = 0.0, size: int = 256):
+        self.latency = latency
+        self.size = size
+        self.calls = {"generate": 0, "edit": 0, "edit_many": 0}
+
+    async def _render(self, seed: bytes, number_of_images: int) -> List[bytes]:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        rgb = hashlib.sha256(seed).digest()[:3]
+        return [_solid_png(self.size, self.size, rgb) for _ in range(number_of_images)]
+
+    async def generate(self, prompt: str, number_of_images: int = 1) -> List[bytes]:
+        self.calls["generate"] += 1
+        return await self._render(prompt.encode(), number_of_images)
+
+    async def edit(self, image: bytes, prompt: str, number_of_images: int = 1) -> List[bytes]:
+        self.calls["edit"] += 1
+        return await self._render(hashlib.sha256(image).digest() + prompt.encode(), number_of_images)
+
+    async def edit_many(self, images: List[bytes], prompt: str, number_of_images: int = 1) -> List[bytes]:
+        self.calls["edit_many"] += 1
+        seed = b"".join(hashlib.sha256(image).digest() for image in images)
+        return await self._render(seed + prompt.encode(), number_of_images)
+
+
+def provider_class() -> Type[ImageProvider]:
+    """The provider class IMAGE_PROVIDER ('emergent' or 'stub') selects, without building it"""
+    if os.getenv('IMAGE_PROVIDER', 'emergent') == 'stub':
+        return StubImageProvider
+    return EmergentOpenAIProvider
+
+
+def create_provider() -> ImageProvider:
+    """Build the provider selected by IMAGE_PROVIDER"""
+    if provider_class() is StubImageProvider:
+        return StubImageProvider(latency=float(os.getenv('STUB_PROVIDER_LATENCY', '0')))
+
+    api_key = os.getenv('EMERGENT_LLM_KEY')
+    if not api_key:
+        raise ValueError("EMERGENT_LLM_KEY not found in environment variables")
+    return EmergentOpenAIProvider(api_key)
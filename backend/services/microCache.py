@@ -0,0 +1,208 @@
+import asyncio
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qsl, urlencode
+
+from starlette.datastructures import Headers
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+# Routes the landing page fetches together, with their TTL in seconds
+MICRO_CACHE_ROUTES: Dict[str, float] = {
+    "/api/gallery/": 2,
+    "/api/gallery/featured/showcase": 5,
+    "/api/content/features": 5,
+    "/api/content/reviews": 5,
+    "/api/content/faqs": 5,
+    "/api/content/stats": 2,
+}
+
+# Per-route counters, shared by every middleware instance in this process
+micro_cache_metrics: Dict[str, Dict[str, int]] = defaultdict(
+    lambda: {"hit": 0, "miss": 0, "coalesced": 0, "bypass": 0, "uncacheable": 0}
+)
+
+
+class _Entry:
+    __slots__ = ("expires_at", "stored_at", "status", "headers", "body")
+
+    def __init__(self, ttl: float, status: int, headers: List[Tuple[bytes, bytes]], body: bytes):
+        self.stored_at = time.monotonic()
+        self.expires_at = self.stored_at + ttl
+        self.status = status
+        self.headers = headers
+        self.body = body
+
+
+def _cache_control(value: str) -> Dict[str, Optional[str]]:
+    directives = {}
+    for part in value.lower().split(","):
+        name, _, arg = part.strip().partition("=")
+        if name:
+            directives[name] = arg.strip('"') or None
+    return directives
+
+
+class MicroCacheMiddleware:
+    """
+    Short-TTL response cache for hot anonymous GETs
+
+    Only routes listed in `routes` are cached, keyed on path plus sorted
+    query string and the request headers named in the response's Vary.
+    Concurrent misses for the same key wait on a single handler execution
+    and replay its response, so a traffic spike costs about one handler call
+    per route per TTL window. Requests carrying credentials or
+    Cache-Control: no-cache bypass the cache; responses marked no-store,
+    private or no-cache are never stored, and max-age/s-maxage can only
+    shorten the route TTL.
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        routes: Dict[str, float] = MICRO_CACHE_ROUTES,
+        max_body_size: int = 1024 * 1024,
+        max_entries: int = 1000,
+    ):
+        self.app = app
+        self.routes = routes
+        self.max_body_size = max_body_size
+        self.max_entries = max_entries
+        self._entries: Dict[tuple, _Entry] = {}
+        # Vary header names last seen per path
+        self._vary: Dict[str, Tuple[str, ...]] = {}
+        self._inflight: Dict[tuple, asyncio.Future] = {}
+        _instances.append(self)
+
+    def _base_key(self, scope: Scope) -> tuple:
+        query = sorted(parse_qsl(scope.get("query_string", b"").decode("latin-1"), keep_blank_values=True))
+        return (scope["method"], scope["path"], urlencode(query))
+
+    def _key(self, base_key: tuple, headers: Headers) -> tuple:
+        vary = self._vary.get(base_key[1], ())
+        return base_key + tuple(headers.get(name, "") for name in vary)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http" or scope["method"] not in ("GET", "HEAD"):
+            await self.app(scope, receive, send)
+            return
+
+        path = scope["path"]
+        ttl = self.routes.get(path)
+        if ttl is None:
+            await self.app(scope, receive, send)
+            return
+
+        headers = Headers(scope=scope)
+        metrics = micro_cache_metrics[path]
+        if ("authorization" in headers or "cookie" in headers or
+                "no-cache" in _cache_control(headers.get("cache-control", ""))):
+            metrics["bypass"] += 1
+            await self.app(scope, receive, send)
+            return
+
+        base_key = self._base_key(scope)
+        key = self._key(base_key, headers)
+
+        entry = self._entries.get(key)
+        if entry is not None and entry.expires_at > time.monotonic():
+            metrics["hit"] += 1
+            await self._replay(entry, send, "HIT", scope["method"])
+            return
+
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            await asyncio.shield(inflight)
+            # Look up again - the leader's response may have added Vary headers
+            entry = self._entries.get(self._key(base_key, headers))
+            if entry is not None:
+                metrics["coalesced"] += 1
+                await self._replay(entry, send, "COALESCED", scope["method"])
+                return
+            # Leader's response wasn't cacheable for us - run the handler ourselves
+            await self.app(scope, receive, send)
+            return
+
+        metrics["miss"] += 1
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        entry = None
+        try:
+            entry = await self._fetch(scope, receive, send, ttl)
+            if entry is None:
+                metrics["uncacheable"] += 1
+            else:
+                # Re-key now that the response's Vary is known
+                self._store(self._key(base_key, headers), entry)
+        finally:
+            del self._inflight[key]
+            future.set_result(entry)
+
+    async def _fetch(self, scope: Scope, receive: Receive, send: Send, ttl: float) -> Optional[_Entry]:
+        """Run the handler, streaming to the client while capturing a cacheable copy"""
+        captured = {"status": 0, "headers": [], "chunks": [], "size": 0, "cacheable": True}
+
+        async def capture(message: Message):
+            if message["type"] == "http.response.start":
+                captured["status"] = message["status"]
+                captured["headers"] = list(message.get("headers", []))
+                message = dict(message, headers=captured["headers"] + [(b"x-micro-cache", b"MISS")])
+            elif message["type"] == "http.response.body" and captured["cacheable"]:
+                body = message.get("body", b"")
+                captured["size"] += len(body)
+                if captured["size"] > self.max_body_size:
+                    captured["cacheable"] = False
+                    captured["chunks"] = []
+                else:
+                    captured["chunks"].append(body)
+            await send(message)
+
+        await self.app(scope, receive, capture)
+
+        if captured["status"] != 200 or not captured["cacheable"]:
+            return None
+
+        response_headers = Headers(raw=captured["headers"])
+        directives = _cache_control(response_headers.get("cache-control", ""))
+        if {"no-store", "private", "no-cache"} & directives.keys() or "set-cookie" in response_headers:
+            return None
+
+        max_age = directives.get("s-maxage") or directives.get("max-age")
+        if max_age is not None and max_age.isdigit():
+            ttl = min(ttl, float(max_age))
+        if ttl <= 0:
+            return None
+
+        vary = tuple(
+            name.strip().lower() for name in response_headers.get("vary", "").split(",") if name.strip()
+        )
+        if "*" in vary:
+            return None
+        self._vary[scope["path"]] = vary
+
+        return _Entry(ttl, captured["status"], captured["headers"], b"".join(captured["chunks"]))
+
+    def _store(self, key: tuple, entry: _Entry):
+        if key not in self._entries and len(self._entries) >= self.max_entries:
+            now = time.monotonic()
+            self._entries = {k: e for k, e in self._entries.items() if e.expires_at > now}
+            if len(self._entries) >= self.max_entries:
+                self._entries.pop(next(iter(self._entries)))
+        self._entries[key] = entry
+
+    async def _replay(self, entry: _Entry, send: Send, state: str, method: str):
+        age = int(time.monotonic() - entry.stored_at)
+        headers = entry.headers + [(b"x-micro-cache", state.encode()), (b"age", str(age).encode())]
+        await send({"type": "http.response.start", "status": entry.status, "headers": headers})
+        await send({"type": "http.response.body", "body": b"" if method == "HEAD" else entry.body})
+
+
+_instances: List[MicroCacheMiddleware] = []
+
+
+def micro_cache_stats() -> dict:
+    """Entry count and per-route hit/miss/coalesced/bypass counters"""
+    return {
+        "entries": sum(len(instance._entries) for instance in _instances),
+        "routes": {path: dict(counters) for path, counters in micro_cache_metrics.items()}
+    }
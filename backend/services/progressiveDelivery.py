@@ -0,0 +1,179 @@
+import asyncio
+import base64
+import logging
+import os
+from collections import defaultdict
+from datetime import datetime
+from typing import AsyncIterator, Dict, Optional, Set
+
+import orjson
+
+from services.imagePreprocess import make_lqip, make_thumbnail
+from services.sharedState import get_shared_state
+from services.storage import storage
+from services.workerPool import run_in_pool
+
+logger = logging.getLogger(__name__)
+
+PROGRESS_CHANNEL = "generation-progress"
+# How long a generation's state can be read back from GET /generate/{id}
+STATE_TTL = float(os.getenv('GENERATION_STATE_TTL', '3600'))
+PREVIEW_SIDE = int(os.getenv('PREVIEW_SIDE', '512'))
+# Stream subscribers re-read the stored state this often, in case an event was missed
+RESYNC_INTERVAL = 5.0
+# Streams for a generation nobody has published state for end after this many resyncs
+UNKNOWN_RESYNCS = 12
+# Events buffered per stream; each carries the whole state, so a slow client only loses intermediate ones
+STREAM_QUEUE_SIZE = 16
+
+TERMINAL_STATUSES = {"completed", "failed", "cancelled", "expired"}
+
+
+def state_key(generation_id: str) -> str:
+    return f"generation:{generation_id}"
+
+
+async def get_state(generation_id: str) -> Optional[dict]:
+    return await get_shared_state().cache_get(state_key(generation_id))
+
+
+async def publish_state(generation_id: str, **changes) -> Optional[dict]:
+    """
+    Merge changes into a generation's state, store it and notify subscribers
+
+    Each event carries the whole state so far, so a subscriber that misses
+    one still catches up on the next. States are stored and fanned out to
+    every subscriber, so images go in as file URLs (or a tiny LQIP), never
+    as full data URLs.
+    """
+    shared_state = get_shared_state()
+    try:
+        # A copy, so states already handed to subscribers don't change under them
+        state = dict(await shared_state.cache_get(state_key(generation_id)) or {"_id": generation_id})
+        state.update(changes, updatedAt=datetime.utcnow().isoformat())
+        await shared_state.cache_set(state_key(generation_id), state, STATE_TTL)
+        await shared_state.publish(PROGRESS_CHANNEL, {"id": generation_id, "state": state})
+        return state
+    except Exception as e:
+        logger.warning(f"Failed to publish progress for {generation_id}: {str(e)}")
+        return None
+
+
+async def deliver(generation_id: str, image: bytes, **result) -> Optional[dict]:
+    """
+    Publish a finished image progressively
+
+    The blurred placeholder, the mid-res WebP and the full-resolution PNG
+    are encoded and stored in parallel (the encodes in the worker pool), and
+    each stage is published as soon as it's ready: `lqip` (an inline data
+    URL of a few hundred bytes), then `preview`, then the full asset with
+    status completed. `result` is merged into the final state.
+    """
+    preview_name = f"gen-{generation_id}-preview.webp"
+    full_name = f"gen-{generation_id}.png"
+
+    lqip = asyncio.create_task(run_in_pool(make_lqip, image))
+    preview = asyncio.create_task(run_in_pool(make_thumbnail, image, PREVIEW_SIDE, 75))
+    full = asyncio.create_task(storage.save(full_name, image))
+    try:
+        placeholder = await lqip
+        await publish_state(
+            generation_id,
+            stage="lqip",
+            lqip=f"data:image/webp;base64,{base64.b64encode(placeholder).decode('utf-8')}"
+        )
+
+        await storage.save(preview_name, await preview)
+        await publish_state(generation_id, stage="preview", preview=f"/api/files/{preview_name}")
+
+        await full
+    except BaseException:
+        for task in (lqip, preview, full):
+            task.cancel()
+        raise
+    return await publish_state(
+        generation_id,
+        stage="full",
+        status="completed",
+        outputImages=[f"/api/files/{full_name}"],
+        **result
+    )
+
+
+async def deliver_full(generation_id: str, image: bytes, **result) -> Optional[dict]:
+    """Store a finished image and publish it in one step, without the placeholder or preview"""
+    full_name = f"gen-{generation_id}.png"
+    await storage.save(full_name, image)
+    return await publish_state(
+        generation_id,
+        stage="full",
+        status="completed",
+        outputImages=[f"/api/files/{full_name}"],
+        **result
+    )
+
+
+def _event(state: dict) -> bytes:
+    return b"event: " + state.get("stage", "status").encode() + b"\ndata: " + orjson.dumps(state) + b"\n\n"
+
+
+# Open streams on this worker by generation ID, fed by the one progress subscription
+_streams: Dict[str, Set[asyncio.Queue]] = defaultdict(set)
+_listener: Optional[asyncio.Task] = None
+
+
+async def _dispatch():
+    async for message in get_shared_state().subscribe(PROGRESS_CHANNEL):
+        for queue in _streams.get(message.get("id"), ()):
+            if queue.full():
+                queue.get_nowait()
+            queue.put_nowait(message["state"])
+
+
+def start_listener() -> asyncio.Task:
+    """
+    Subscribe this worker to progress events, once
+
+    Started with the other listeners at startup, and again by the next
+    stream if it has stopped, so every open stream shares one subscription.
+    """
+    global _listener
+    if _listener is None or _listener.done():
+        _listener = asyncio.create_task(_dispatch())
+    return _listener
+
+
+async def stream_events(generation_id: str) -> AsyncIterator[bytes]:
+    """Server-sent events with a generation's state, until it reaches a terminal status"""
+    queue: asyncio.Queue = asyncio.Queue(maxsize=STREAM_QUEUE_SIZE)
+    # Register before reading the stored state so nothing published in between is lost
+    _streams[generation_id].add(queue)
+    start_listener()
+    await asyncio.sleep(0)
+    last = None
+    misses = 0
+    try:
+        state = await get_state(generation_id)
+        while True:
+            # Events can race the resync reads; only ever move forward
+            if state is not None and (last is None or state["updatedAt"] > last["updatedAt"]):
+                last = state
+                yield _event(state)
+                if state.get("status") in TERMINAL_STATUSES:
+                    return
+
+            try:
+                state = await asyncio.wait_for(queue.get(), RESYNC_INTERVAL)
+            except asyncio.TimeoutError:
+                state = await get_state(generation_id)
+                if state is None and last is None:
+                    misses += 1
+                    if misses >= UNKNOWN_RESYNCS:
+                        return
+                    # The job may not have started yet; keep the connection open
+                    yield b": waiting\n\n"
+    finally:
+        streams = _streams[generation_id]
+        streams.discard(queue)
+        if not streams:
+            del _streams[generation_id]
@@ -0,0 +1,95 @@
+import json
+import os
+import re
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+DEFAULT_RULES_PATH = Path(__file__).parent.parent / "config" / "prompt_rules.json"
+
+# One pass over the prompt yields every word; keywords are matched per token, not per scan
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:'[a-z]+)?")
+
+
+class PromptEnhancer:
+    """
+    Rule-driven prompt enhancement
+
+    Keyword categories from the rules file are compiled once into lookup
+    tables: single words in a dict, multi-word phrases keyed by token tuple.
+    Matching tokenizes the prompt once and does a dict lookup per token (and
+    per n-gram when phrases are configured), so the cost depends on prompt
+    length, not on how many categories are configured. Keywords match on word
+    boundaries, with a trailing plural 's' tolerated.
+    """
+
+    def __init__(self, rules: dict):
+        self.max_words = rules.get("max_words", 15)
+        self.default_template = rules["default_template"]
+        self.templates: Dict[str, str] = {}
+        self.priorities: Dict[str, int] = {}
+        self.words: Dict[str, Tuple[int, str]] = {}
+        self.phrases: Dict[Tuple[str, ...], Tuple[int, str]] = {}
+        self.max_phrase_length = 1
+
+        for category in rules["categories"]:
+            name = category["name"]
+            self.templates[name] = category["template"]
+            self.priorities[name] = priority = category.get("priority", 0)
+            for keyword in category["keywords"]:
+                tokens = tuple(TOKEN_PATTERN.findall(keyword.lower()))
+                if not tokens:
+                    continue
+                table, key = (self.words, tokens[0]) if len(tokens) == 1 else (self.phrases, tokens)
+                # Keep the higher-priority category if a keyword appears twice
+                if key not in table or table[key][0] < priority:
+                    table[key] = (priority, name)
+                self.max_phrase_length = max(self.max_phrase_length, len(tokens))
+
+        self.enhance = lru_cache(maxsize=int(os.getenv('PROMPT_ENHANCE_CACHE_SIZE', '4096')))(self._enhance)
+
+    @classmethod
+    def from_file(cls, path: Optional[Path] = None) -> "PromptEnhancer":
+        path = Path(path or os.getenv('PROMPT_RULES_PATH') or DEFAULT_RULES_PATH)
+        with open(path, encoding="utf-8") as f:
+            return cls(json.load(f))
+
+    def _match_phrases(self, tokens: List[str], best: Optional[Tuple[int, str]]) -> Optional[Tuple[int, str]]:
+        for start in range(len(tokens)):
+            for length in range(2, min(self.max_phrase_length, len(tokens) - start) + 1):
+                phrase = tokens[start:start + length]
+                match = self.phrases.get(tuple(phrase))
+                if match is None and phrase[-1].endswith("s"):
+                    match = self.phrases.get(tuple(phrase[:-1]) + (phrase[-1][:-1],))
+                if match is not None and (best is None or match[0] > best[0]):
+                    best = match
+        return best
+
+    def classify(self, prompt: str) -> Optional[str]:
+        """Return the highest-priority category whose keywords appear in the prompt"""
+        tokens: List[str] = TOKEN_PATTERN.findall(prompt.lower())
+        words = self.words
+        best = None
+        for token in tokens:
+            match = words.get(token)
+            if match is None and token[-1] == "s":
+                match = words.get(token[:-1])
+            if match is not None and (best is None or match[0] > best[0]):
+                best = match
+
+        if self.phrases:
+            best = self._match_phrases(tokens, best)
+        return best[1] if best else None
+
+    def _enhance(self, prompt: str) -> str:
+        # Don't enhance if prompt is already detailed
+        if len(prompt.split()) > self.max_words:
+            return prompt
+
+        category = self.classify(prompt)
+        template = self.templates[category] if category else self.default_template
+        return template.format(prompt=prompt)
+
+
+# Rules are loaded once at import
+promptEnhancer = PromptEnhancer.from_file()
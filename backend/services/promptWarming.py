@@ -0,0 +1,181 @@
+import base64
+import hashlib
+import logging
+import os
+import re
+from datetime import datetime, timedelta
+from typing import Iterable, List, Optional
+
+from pymongo import IndexModel
+from pymongo.errors import DuplicateKeyError
+
+from services.cache import TTLCache
+from services.database import register_indexes
+from services.imageHash import image_hash_index
+from services.imagePreprocess import make_thumbnail
+from services.storage import storage
+from services.workerPool import run_in_pool
+
+logger = logging.getLogger(__name__)
+
+PREWARM_TOP_N = int(os.getenv('PREWARM_TOP_N', '10'))
+# Estimated provider cost per image and the most pre-rendering may spend per UTC day
+PREWARM_COST_PER_IMAGE = float(os.getenv('PREWARM_COST_PER_IMAGE', '0.04'))
+PREWARM_DAILY_BUDGET = float(os.getenv('PREWARM_DAILY_BUDGET', '1.0'))
+# UTC hours (start-end, inclusive) considered off-peak
+PREWARM_HOURS = os.getenv('PREWARM_HOURS', '1-6')
+# How long a pre-rendered result is served before it's rendered again
+RESULT_CACHE_DAYS = float(os.getenv('RESULT_CACHE_DAYS', '7'))
+
+register_indexes("prompt_stats", [
+    IndexModel([("count", -1)], name="count"),
+    IndexModel([("last_seen", 1)], name="last_seen_ttl", expireAfterSeconds=30 * 24 * 60 * 60)
+])
+register_indexes("generation_cache", [
+    IndexModel([("expires_at", 1)], name="expires_at_ttl", expireAfterSeconds=0)
+])
+
+# Hot entries of generation_cache, so repeated demo prompts skip the database too
+result_cache = TTLCache(ttl=300, max_size=256)
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_prompt(prompt: str) -> str:
+    """Case, whitespace and trailing punctuation don't change what gets rendered"""
+    return _WHITESPACE.sub(" ", prompt).strip().rstrip(".!").lower()
+
+
+def cache_key(prompt: str, mode: str, provider: str) -> str:
+    return hashlib.sha256(f"{provider}|{mode}|{normalize_prompt(prompt)}".encode()).hexdigest()[:32]
+
+
+async def record_prompt(db, prompt: str):
+    """Count a text-to-image prompt towards the pre-render ranking"""
+    normalized = normalize_prompt(prompt)
+    try:
+        await db.prompt_stats.update_one(
+            {"_id": normalized},
+            {"$inc": {"count": 1}, "$set": {"prompt": prompt, "last_seen": datetime.utcnow()}},
+            upsert=True
+        )
+    except Exception as e:
+        logger.warning(f"Failed to record prompt: {str(e)}")
+
+
+async def top_prompts(db, limit: int, seeds: Iterable[str] = ()) -> List[str]:
+    """Most requested prompts, topped up with seed prompts (e.g. the showcase) while there's room"""
+    prompts = [doc["prompt"] async for doc in db.prompt_stats.find({}, {"prompt": 1}).sort("count", -1).limit(limit)]
+    seen = {normalize_prompt(prompt) for prompt in prompts}
+    for seed in seeds:
+        if len(prompts) >= limit:
+            break
+        if normalize_prompt(seed) not in seen:
+            seen.add(normalize_prompt(seed))
+            prompts.append(seed)
+    return prompts
+
+
+async def cached_entry(db, prompt: str, mode: str, provider: str) -> Optional[dict]:
+    key = cache_key(prompt, mode, provider)
+    entry = result_cache.get(key)
+    if entry is None:
+        entry = await db.generation_cache.find_one({"_id": key, "expires_at": {"$gt": datetime.utcnow()}})
+        if entry is not None:
+            result_cache.set(key, entry)
+    return entry
+
+
+async def get_cached_result(db, prompt: str, mode: str, provider: str) -> Optional[dict]:
+    """
+    A pre-rendered result for this prompt in the same shape as AIService.generateImage
+
+    The image and thumbnail are returned as the URLs they're already stored
+    under, so serving a hit reads, writes and re-indexes nothing.
+    """
+    entry = await cached_entry(db, prompt, mode, provider)
+    if entry is None:
+        return None
+
+    if await storage.stat(entry["file"]) is None:
+        result_cache.pop(entry["_id"])
+        return None
+    return {
+        'success': True,
+        'images': [f"/api/files/{entry['file']}"],
+        'thumbnails': [f"/api/files/{entry['thumbnail']}"],
+        'processingTime': 0,
+        'metadata': {
+            'model': provider,
+            'enhanced_prompt': entry["enhanced_prompt"],
+            'original_prompt': prompt,
+            'mode': mode,
+            'image_format': 'url',
+            'cached': True
+        }
+    }
+
+
+async def store_result(db, prompt: str, mode: str, provider: str, result: dict) -> dict:
+    """
+    Save a generated image and its thumbnail to storage and index it in the result cache
+
+    The image is also hashed for similar-image lookups here, once, rather
+    than each time it's served.
+    """
+    key = cache_key(prompt, mode, provider)
+    image = base64.b64decode(result['images'][0].split(",", 1)[1])
+    thumbnail = await run_in_pool(make_thumbnail, image)
+    await storage.save(f"gen-{key}.png", image)
+    await storage.save(f"gen-{key}-thumb.webp", thumbnail)
+    await image_hash_index.index_image(db, f"gen-{key}", image, "generation", f"gen-{key}.png")
+
+    now = datetime.utcnow()
+    entry = {
+        "_id": key,
+        "prompt": prompt,
+        "mode": mode,
+        "provider": provider,
+        "file": f"gen-{key}.png",
+        "thumbnail": f"gen-{key}-thumb.webp",
+        "enhanced_prompt": result['metadata'].get('enhanced_prompt', prompt),
+        "created_at": now,
+        "expires_at": now + timedelta(days=RESULT_CACHE_DAYS)
+    }
+    await db.generation_cache.replace_one({"_id": key}, entry, upsert=True)
+    result_cache.set(key, entry)
+    return entry
+
+
+async def forget_file(db, name: str):
+    """Drop pre-rendered results whose image or thumbnail was deleted"""
+    query = {"$or": [{"file": name}, {"thumbnail": name}]}
+    async for entry in db.generation_cache.find(query, {"_id": 1}):
+        result_cache.pop(entry["_id"])
+    await db.generation_cache.delete_many(query)
+
+
+def is_off_peak(now: Optional[datetime] = None) -> bool:
+    start, _, end = PREWARM_HOURS.partition("-")
+    hour = (now or datetime.utcnow()).hour
+    start, end = int(start), int(end or start)
+    return start <= hour <= end if start <= end else hour >= start or hour <= end
+
+
+async def spend_budget(db, cost: float) -> bool:
+    """Reserve cost against today's pre-render budget; False once it's used up"""
+    if cost > PREWARM_DAILY_BUDGET:
+        return False
+    day = datetime.utcnow().strftime("%Y-%m-%d")
+    updated = await db.prewarm_budget.find_one_and_update(
+        {"_id": day, "spent": {"$lte": PREWARM_DAILY_BUDGET - cost}},
+        {"$inc": {"spent": cost, "renders": 1}},
+    )
+    if updated is not None:
+        return True
+    try:
+        await db.prewarm_budget.insert_one({"_id": day, "spent": cost, "renders": 1})
+        return True
+    except DuplicateKeyError:
+        # Today's document exists and is already over budget
+        return False
@@ -0,0 +1,157 @@
+import os
+import time
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from fastapi import Request
+from pymongo import IndexModel
+from pymongo.errors import DuplicateKeyError
+
+from services.database import register_indexes
+
+register_indexes("rate_limits", [
+    IndexModel([("expires_at", 1)], name="expires_at_ttl", expireAfterSeconds=0)
+])
+
+
+class RateLimit(NamedTuple):
+    """Allow `limit` requests per `period` seconds, with bursts up to `burst`"""
+    limit: int
+    period: float
+    burst: Optional[int] = None
+
+    @property
+    def interval(self) -> float:
+        return self.period / self.limit
+
+    @property
+    def tolerance(self) -> float:
+        return self.interval * ((self.burst or self.limit) - 1)
+
+
+class Decision(NamedTuple):
+    allowed: bool
+    scope: str = ""
+    retry_after: float = 0.0
+
+
+# Generate endpoint limits per plan tier (per session) and per client IP, and account signups per IP
+GENERATE_LIMITS: Dict[str, RateLimit] = {
+    "free": RateLimit(int(os.getenv('RATE_LIMIT_FREE_PER_MIN', '10')), 60, burst=3),
+    "pro": RateLimit(int(os.getenv('RATE_LIMIT_PRO_PER_MIN', '60')), 60, burst=10),
+    "enterprise": RateLimit(int(os.getenv('RATE_LIMIT_ENTERPRISE_PER_MIN', '300')), 60, burst=30),
+    "ip": RateLimit(int(os.getenv('RATE_LIMIT_IP_PER_MIN', '120')), 60, burst=20),
+    "signup": RateLimit(int(os.getenv('RATE_LIMIT_SIGNUP_PER_HOUR', '5')), 3600, burst=3),
+}
+
+# Reverse proxies (ingress, load balancer) that append to X-Forwarded-For in front of the app
+TRUSTED_PROXY_COUNT = int(os.getenv('TRUSTED_PROXY_COUNT', '1'))
+
+
+class MemoryBackend:
+    """
+    GCRA state in a process-local dict
+
+    Each key stores only its theoretical arrival time (TAT), so a check is a
+    dict lookup and a float comparison.
+    """
+
+    def __init__(self, max_keys: int = 100000):
+        self.max_keys = max_keys
+        self._tat: Dict[str, float] = {}
+
+    async def acquire(self, key: str, rate: RateLimit) -> Tuple[bool, float]:
+        now = time.time()
+        tat = max(self._tat.get(key, now), now)
+        if tat - now > rate.tolerance:
+            return False, tat - now - rate.tolerance
+
+        self._tat[key] = tat + rate.interval
+        if len(self._tat) > self.max_keys:
+            self._prune(now)
+        return True, 0.0
+
+    def _prune(self, now: float):
+        self._tat = {key: tat for key, tat in self._tat.items() if tat > now}
+
+
+class MongoBackend:
+    """
+    GCRA state shared across workers and replicas in the rate_limits collection
+
+    The allow-check and TAT update are a single conditional upsert: when the
+    key is over its limit the filter doesn't match, the upsert collides with
+    the existing _id and the request is denied.
+    """
+
+    def __init__(self, db):
+        self.db = db
+
+    async def acquire(self, key: str, rate: RateLimit) -> Tuple[bool, float]:
+        now = time.time()
+        try:
+            await self.db.rate_limits.update_one(
+                {"_id": key, "tat": {"$lte": now + rate.tolerance}},
+                [{"$set": {
+                    "tat": {"$add": [{"$max": ["$tat", now]}, rate.interval]},
+                    "expires_at": {"$toDate": {"$multiply": [
+                        {"$add": [{"$max": ["$tat", now]}, rate.interval]}, 1000
+                    ]}}
+                }}],
+                upsert=True
+            )
+            return True, 0.0
+        except DuplicateKeyError:
+            state = await self.db.rate_limits.find_one({"_id": key}, {"tat": 1})
+            retry_after = (state["tat"] - now - rate.tolerance) if state else rate.interval
+            return False, max(retry_after, 0.0)
+
+
+class RateLimiter:
+    def __init__(self, backend=None, limits: Dict[str, RateLimit] = GENERATE_LIMITS):
+        self.backend = backend or MemoryBackend()
+        self.limits = limits
+
+    async def check(self, checks: List[Tuple[str, str]]) -> Decision:
+        """
+        Apply several limits, stopping at the first denial
+
+        Args:
+            checks: (limit name, key) pairs, e.g. [("pro", "session:abc"), ("ip", "ip:1.2.3.4")]
+
+        Returns:
+            Decision: Whether the request may proceed and, if not, when to retry
+        """
+        for limit_name, key in checks:
+            allowed, retry_after = await self.backend.acquire(f"{limit_name}:{key}", self.limits[limit_name])
+            if not allowed:
+                return Decision(False, limit_name, retry_after)
+        return Decision(True)
+
+
+def client_ip(request: Request) -> str:
+    """
+    Client address as seen by the outermost trusted proxy
+
+    Each proxy appends the address it received the request from to
+    X-Forwarded-For, so with TRUSTED_PROXY_COUNT proxies in front of the app
+    the client is that many hops from the right; anything further left was
+    sent by the client and can't be trusted.
+    """
+    forwarded = request.headers.get("x-forwarded-for")
+    if forwarded and TRUSTED_PROXY_COUNT:
+        hops = [hop.strip() for hop in forwarded.split(",")]
+        if len(hops) >= TRUSTED_PROXY_COUNT:
+            return hops[-TRUSTED_PROXY_COUNT]
+    return request.client.host if request.client else "unknown"
+
+
+def get_rate_limiter(request: Request) -> RateLimiter:
+    """FastAPI dependency returning the app's rate limiter"""
+    return request.app.state.rate_limiter
+
+
+def create_rate_limiter(db) -> RateLimiter:
+    """Build the limiter for RATE_LIMIT_BACKEND ('memory' or the shared 'mongo')"""
+    if os.getenv('RATE_LIMIT_BACKEND', 'memory') == 'mongo':
+        return RateLimiter(MongoBackend(db))
+    return RateLimiter(MemoryBackend())
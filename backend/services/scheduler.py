@@ -0,0 +1,218 @@
+import asyncio
+import logging
+import os
+import random
+import time
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict, List, NamedTuple, Optional
+
+from fastapi import Request
+from pymongo import IndexModel
+from pymongo.errors import DuplicateKeyError
+
+from services.database import register_indexes
+from services.sharedState import WORKER_ID
+
+logger = logging.getLogger(__name__)
+
+register_indexes("scheduler_runs", [
+    IndexModel([("task", 1), ("started_at", -1)], name="task_started_at"),
+    IndexModel([("started_at", 1)], name="started_at_ttl", expireAfterSeconds=30 * 24 * 60 * 60)
+])
+
+
+class TaskContext:
+    """Passed to each run so long tasks can stop cleanly before their budget runs out"""
+
+    def __init__(self, db, budget: float):
+        self.db = db
+        self.budget = budget
+        self.deadline = time.monotonic() + budget
+
+    def remaining(self) -> float:
+        return self.deadline - time.monotonic()
+
+    def out_of_time(self, margin: float = 0.1) -> bool:
+        """True once less than `margin` of the budget is left"""
+        return self.remaining() < self.budget * margin
+
+
+class ScheduledTask(NamedTuple):
+    name: str
+    func: Callable[[TaskContext], Awaitable[Optional[dict]]]
+    interval: float
+    budget: float
+    jitter: float
+    initial_delay: Optional[float]
+    enabled: bool = True
+
+
+# Periodic tasks keyed by name, registered by the modules that own them
+SCHEDULED_TASKS: Dict[str, ScheduledTask] = {}
+
+
+def scheduled_task(
+    name: str,
+    interval: float,
+    budget: float = 60,
+    jitter: float = 0.1,
+    initial_delay: Optional[float] = None,
+    enabled: bool = True
+):
+    """
+    Register a coroutine taking a TaskContext to run every `interval` seconds
+
+    Runs are cancelled after `budget` seconds; `jitter` spreads start times
+    by that fraction of the interval so replicas don't wake in lockstep.
+    A task registered with enabled=False only runs when triggered by hand.
+    """
+    def decorator(func):
+        SCHEDULED_TASKS[name] = ScheduledTask(name, func, interval, budget, jitter, initial_delay, enabled)
+        return func
+    return decorator
+
+
+def get_scheduler(request: Request) -> "Scheduler":
+    """FastAPI dependency returning the app's scheduler"""
+    return request.app.state.scheduler
+
+
+class Scheduler:
+    """
+    In-process runner for periodic maintenance tasks
+
+    Every replica runs a timer per task, but a run only goes ahead after
+    atomically claiming the task's slot in `scheduler_tasks` - moving its
+    next_run forward - so each due run is executed by exactly one replica.
+    Each run gets a runtime budget and is recorded in `scheduler_runs`.
+    """
+
+    def __init__(self, db, tasks: Dict[str, ScheduledTask] = SCHEDULED_TASKS):
+        self.db = db
+        self.tasks = tasks
+        self._loops: List[asyncio.Task] = []
+        self._running: Dict[str, asyncio.Task] = {}
+
+    def start(self):
+        if os.getenv('SCHEDULER_ENABLED', 'true').lower() != 'true':
+            return self
+        self._loops = [asyncio.create_task(self._loop(task)) for task in self.tasks.values() if task.enabled]
+        return self
+
+    async def stop(self):
+        for loop in self._loops:
+            loop.cancel()
+        for run in list(self._running.values()):
+            run.cancel()
+        await asyncio.gather(*self._loops, *self._running.values(), return_exceptions=True)
+
+    def _jittered(self, task: ScheduledTask, seconds: float) -> float:
+        return seconds * random.uniform(1 - task.jitter, 1 + task.jitter)
+
+    async def _loop(self, task: ScheduledTask):
+        delay = task.initial_delay if task.initial_delay is not None else task.interval
+        while True:
+            await asyncio.sleep(self._jittered(task, delay))
+            delay = task.interval
+            try:
+                if await self._claim(task):
+                    await self.run(task.name)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Scheduler loop for {task.name} failed: {str(e)}")
+
+    async def _claim(self, task: ScheduledTask, force: bool = False) -> bool:
+        """Take this run for our replica; False if another replica already has it"""
+        now = datetime.utcnow()
+        query = {"_id": task.name}
+        if not force:
+            query["next_run"] = {"$lte": now}
+        # The earliest any replica's jittered timer can fire for the next run
+        next_run = now + timedelta(seconds=task.interval * (1 - task.jitter))
+        try:
+            await self.db.scheduler_tasks.update_one(
+                query,
+                {"$set": {"next_run": next_run, "claimed_by": WORKER_ID, "claimed_at": now}},
+                upsert=True
+            )
+            return True
+        except DuplicateKeyError:
+            return False
+
+    async def run(self, name: str) -> dict:
+        """Run a task now in this process and record the outcome"""
+        if name in self._running:
+            raise RuntimeError(f"Task {name} is already running")
+        task = self.tasks[name]
+        context = TaskContext(self.db, task.budget)
+        record = {"task": name, "worker": WORKER_ID, "started_at": datetime.utcnow()}
+
+        runner = asyncio.create_task(task.func(context))
+        self._running[name] = runner
+        started = time.perf_counter()
+        try:
+            result = await asyncio.wait_for(runner, timeout=task.budget)
+            record.update(status="ok", result=result or {})
+        except asyncio.TimeoutError:
+            record.update(status="timeout", error=f"Exceeded budget of {task.budget}s")
+        except asyncio.CancelledError:
+            record.update(status="cancelled")
+            raise
+        except Exception as e:
+            logger.error(f"Scheduled task {name} failed: {str(e)}")
+            record.update(status="error", error=str(e))
+        finally:
+            self._running.pop(name, None)
+            record.update(finished_at=datetime.utcnow(), duration=round(time.perf_counter() - started, 3))
+            try:
+                await self.db.scheduler_runs.insert_one(record)
+            except Exception as e:
+                logger.error(f"Failed to record run of {name}: {str(e)}")
+            record.pop("_id", None)
+        return record
+
+    async def trigger(self, name: str) -> dict:
+        """Run a task on demand, pushing its next scheduled run out by an interval"""
+        await self._claim(self.tasks[name], force=True)
+        return await self.run(name)
+
+    async def describe(self) -> List[dict]:
+        slots = {doc["_id"]: doc async for doc in self.db.scheduler_tasks.find({"_id": {"$in": list(self.tasks)}})}
+        described = []
+        for task in self.tasks.values():
+            last = await self.db.scheduler_runs.find_one(
+                {"task": task.name}, {"_id": 0}, sort=[("started_at", -1)]
+            )
+            slot = slots.get(task.name, {})
+            described.append({
+                "name": task.name,
+                "interval": task.interval,
+                "budget": task.budget,
+                "enabled": task.enabled,
+                "running": task.name in self._running,
+                "nextRun": slot.get("next_run"),
+                "claimedBy": slot.get("claimed_by"),
+                "lastRun": last
+            })
+        return described
+
+    async def history(self, name: str, limit: int = 20) -> List[dict]:
+        cursor = self.db.scheduler_runs.find({"task": name}, {"_id": 0}).sort("started_at", -1).limit(limit)
+        return [run async for run in cursor]
+
+
+@scheduled_task("index_check", interval=float(os.getenv('INDEX_CHECK_INTERVAL', '21600')), budget=120, initial_delay=60)
+async def check_indexes(context: TaskContext) -> dict:
+    """Re-create any registered index that has gone missing and report what was fixed"""
+    from services.database import INDEXES, ensure_indexes
+
+    missing = {}
+    for collection, indexes in INDEXES.items():
+        existing = await context.db[collection].index_information()
+        absent = [index.document["name"] for index in indexes if index.document["name"] not in existing]
+        if absent:
+            missing[collection] = absent
+    if missing:
+        await ensure_indexes(context.db)
+    return {"collections": len(INDEXES), "missing": missing}
@@ -0,0 +1,75 @@
+from typing import Any, Callable, Dict, Hashable, Optional
+
+import orjson
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+
+# Non-string dict keys show up in a few mock payloads; numpy arrays in image analysis
+ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+
+# Pre-encoded bodies for responses that never change between requests
+_encoded_cache: Dict[Hashable, bytes] = {}
+
+
+def _default(obj: Any):
+    """Fallback encoder for types orjson doesn't handle natively"""
+    if isinstance(obj, BaseModel):
+        return obj.model_dump()
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+
+
+def dumps(content: Any) -> bytes:
+    """Serialize content to JSON bytes with orjson"""
+    return orjson.dumps(content, default=_default, option=ORJSON_OPTIONS)
+
+
+class FastJSONResponse(JSONResponse):
+    """
+    App-wide JSON response class backed by orjson
+
+    Accepts already-encoded bytes as content so cached bodies are sent as-is.
+    """
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        if isinstance(content, bytes):
+            return content
+        return dumps(content)
+
+
+def json_response(content: Any, status_code: int = 200, headers: Optional[dict] = None) -> FastJSONResponse:
+    """
+    Return trusted handler data directly
+
+    Returning a Response skips FastAPI's jsonable_encoder pass and any
+    response_model re-validation, so only use it for data we built ourselves.
+    """
+    return FastJSONResponse(content, status_code=status_code, headers=headers)
+
+
+def cached_json(key: Hashable, build: Callable[[], Any]) -> FastJSONResponse:
+    """
+    Serve a static payload from pre-encoded bytes
+
+    Args:
+        key: Cache key for the payload
+        build: Called once to produce the payload on a cache miss
+
+    Returns:
+        FastJSONResponse: Response with the cached body
+    """
+    body = _encoded_cache.get(key)
+    if body is None:
+        body = dumps(build())
+        _encoded_cache[key] = body
+    return FastJSONResponse(body)
+
+
+def invalidate_cached_json(key: Optional[Hashable] = None):
+    """Drop one pre-encoded payload, or all of them when no key is given"""
+    if key is None:
+        _encoded_cache.clear()
+    else:
+        _encoded_cache.pop(key, None)
@@ -0,0 +1,273 @@
+import asyncio
+import itertools
+import logging
+import os
+import time
+import uuid
+from collections import OrderedDict, defaultdict
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta
+from typing import Any, AsyncIterator, Dict, Iterable, Optional
+
+from pymongo import CursorType, IndexModel, ReturnDocument
+from pymongo.errors import CollectionInvalid, DuplicateKeyError
+
+from services.database import register_indexes
+
+logger = logging.getLogger(__name__)
+
+# Identifies this process in lock ownership and published messages
+WORKER_ID = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+
+# A reopened subscription re-reads events published this long before the newest it has seen
+RESUME_OVERLAP = timedelta(seconds=float(os.getenv('SHARED_EVENTS_RESUME_OVERLAP', '5')))
+
+register_indexes("shared_cache", [
+    IndexModel([("expires_at", 1)], name="expires_at_ttl", expireAfterSeconds=0)
+])
+register_indexes("shared_locks", [
+    IndexModel([("expires_at", 1)], name="expires_at_ttl", expireAfterSeconds=0)
+])
+
+
+class LockNotAcquired(Exception):
+    """Raised when a lock is held elsewhere and blocking wasn't requested"""
+
+
+class MemoryState:
+    """
+    Shared-state backend for a single process
+
+    Counters, cache entries, locks and pub/sub channels live in this
+    process only - correct for one uvicorn worker, inconsistent for several.
+    Cache entries are swept once there are more than max_cache_entries:
+    expired ones first, then the oldest written.
+    """
+
+    def __init__(self, max_cache_entries: int = int(os.getenv('SHARED_CACHE_MAX_ENTRIES', '10000'))):
+        self.max_cache_entries = max_cache_entries
+        self._counters: Dict[str, int] = defaultdict(int)
+        self._cache: Dict[str, tuple] = {}
+        self._locks: Dict[str, asyncio.Lock] = defaultdict(asyncio.Lock)
+        self._subscribers: Dict[str, list] = defaultdict(list)
+
+    async def incr(self, key: str, amount: int = 1) -> int:
+        self._counters[key] += amount
+        return self._counters[key]
+
+    async def get_counters(self, keys: Iterable[str]) -> Dict[str, int]:
+        return {key: self._counters.get(key, 0) for key in keys}
+
+    async def cache_get(self, key: str) -> Any:
+        entry = self._cache.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            self._cache.pop(key, None)
+            return None
+        return entry[1]
+
+    async def cache_set(self, key: str, value: Any, ttl: float):
+        # Re-inserted so dict order stays oldest-written first
+        self._cache.pop(key, None)
+        self._cache[key] = (time.monotonic() + ttl, value)
+        if len(self._cache) > self.max_cache_entries:
+            self._sweep()
+
+    def _sweep(self):
+        now = time.monotonic()
+        self._cache = {key: entry for key, entry in self._cache.items() if entry[0] >= now}
+        # Leave some headroom so a full cache of live entries isn't swept on every write
+        excess = len(self._cache) - int(self.max_cache_entries * 0.9)
+        for key in list(itertools.islice(self._cache, max(0, excess))):
+            del self._cache[key]
+
+    async def cache_delete(self, key: str):
+        self._cache.pop(key, None)
+
+    @asynccontextmanager
+    async def lock(self, name: str, ttl: float = 30, blocking: bool = True):
+        lock = self._locks[name]
+        if not blocking and lock.locked():
+            raise LockNotAcquired(name)
+        async with lock:
+            yield
+
+    async def publish(self, channel: str, message: dict):
+        for queue in list(self._subscribers[channel]):
+            queue.put_nowait(message)
+
+    async def subscribe(self, channel: str) -> AsyncIterator[dict]:
+        queue: asyncio.Queue = asyncio.Queue()
+        self._subscribers[channel].append(queue)
+        try:
+            while True:
+                yield await queue.get()
+        finally:
+            self._subscribers[channel].remove(queue)
+
+
+class MongoState:
+    """
+    Shared-state backend on MongoDB, consistent across workers and replicas
+
+    Counters are $inc updates, cache entries and locks are TTL'd documents,
+    and pub/sub tails a capped collection. Point MONGO_URL at a local mongod
+    to run it on a single machine.
+    """
+
+    def __init__(self, db, events_size: int = 16 * 1024 * 1024):
+        self.db = db
+        self.events_size = events_size
+        self._events_ready = False
+
+    async def incr(self, key: str, amount: int = 1) -> int:
+        counter = await self.db.shared_counters.find_one_and_update(
+            {"_id": key},
+            {"$inc": {"value": amount}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        return counter["value"]
+
+    async def get_counters(self, keys: Iterable[str]) -> Dict[str, int]:
+        keys = list(keys)
+        values = {key: 0 for key in keys}
+        async for counter in self.db.shared_counters.find({"_id": {"$in": keys}}):
+            values[counter["_id"]] = counter["value"]
+        return values
+
+    async def cache_get(self, key: str) -> Any:
+        entry = await self.db.shared_cache.find_one({"_id": key, "expires_at": {"$gt": datetime.utcnow()}})
+        return entry["value"] if entry else None
+
+    async def cache_set(self, key: str, value: Any, ttl: float):
+        await self.db.shared_cache.replace_one(
+            {"_id": key},
+            {"_id": key, "value": value, "expires_at": datetime.utcnow() + timedelta(seconds=ttl)},
+            upsert=True
+        )
+
+    async def cache_delete(self, key: str):
+        await self.db.shared_cache.delete_one({"_id": key})
+
+    async def _try_lock(self, name: str, token: str, ttl: float) -> bool:
+        now = datetime.utcnow()
+        try:
+            # Take the lock if it's free or its holder's lease ran out
+            await self.db.shared_locks.update_one(
+                {"_id": name, "expires_at": {"$lt": now}},
+                {"$set": {"owner": token, "expires_at": now + timedelta(seconds=ttl)}},
+                upsert=True
+            )
+            return True
+        except DuplicateKeyError:
+            return False
+
+    @asynccontextmanager
+    async def lock(self, name: str, ttl: float = 30, blocking: bool = True):
+        token = f"{WORKER_ID}:{uuid.uuid4().hex[:8]}"
+        while not await self._try_lock(name, token, ttl):
+            if not blocking:
+                raise LockNotAcquired(name)
+            await asyncio.sleep(0.05)
+        try:
+            yield
+        finally:
+            await self.db.shared_locks.delete_one({"_id": name, "owner": token})
+
+    async def _ensure_events(self):
+        if self._events_ready:
+            return
+        try:
+            await self.db.create_collection("shared_events", capped=True, size=self.events_size)
+        except CollectionInvalid:
+            pass
+        self._events_ready = True
+
+    async def publish(self, channel: str, message: dict):
+        await self._ensure_events()
+        await self.db.shared_events.insert_one({
+            "channel": channel,
+            "message": message,
+            "origin": WORKER_ID,
+            "published_at": datetime.utcnow()
+        })
+
+    async def subscribe(self, channel: str) -> AsyncIterator[dict]:
+        """
+        Tail the channel's events in insertion ($natural) order
+
+        ObjectIds are made by each publisher and don't sort in insertion
+        order, so a reopened cursor can't resume after the last _id. It
+        re-reads from RESUME_OVERLAP before the newest publish time seen and
+        skips events already delivered. Publishers' clocks are assumed to
+        agree to within that overlap.
+        """
+        await self._ensure_events()
+        # Only messages published after joining: events already in the window the
+        # first cursor re-reads count as seen
+        since = datetime.utcnow() - RESUME_OVERLAP
+        seen: "OrderedDict[Any, datetime]" = OrderedDict()
+        async for event in self.db.shared_events.find(
+            {"channel": channel, "published_at": {"$gte": since}}, {"published_at": 1}
+        ):
+            seen[event["_id"]] = event["published_at"]
+
+        while True:
+            cursor = self.db.shared_events.find(
+                {"channel": channel, "published_at": {"$gte": since}},
+                cursor_type=CursorType.TAILABLE_AWAIT
+            )
+            try:
+                while cursor.alive:
+                    async for event in cursor:
+                        if event["_id"] in seen:
+                            continue
+                        seen[event["_id"]] = event["published_at"]
+                        since = max(since, event["published_at"] - RESUME_OVERLAP)
+                        # Events older than the window are never re-read, so needn't be remembered
+                        while seen and next(iter(seen.values())) < since:
+                            seen.popitem(last=False)
+                        yield event["message"]
+                    await asyncio.sleep(0.1)
+                # Tailable cursors die on an empty collection - back off before reopening
+                await asyncio.sleep(0.5)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Subscription to {channel} interrupted: {str(e)}")
+                await asyncio.sleep(1)
+
+
+async def publish_invalidation(channel: str, key: str):
+    """Tell other workers to drop a key from their local cache"""
+    await get_shared_state().publish(channel, {"key": key, "origin": WORKER_ID})
+
+
+async def run_invalidation_listener(channel: str, cache):
+    """Drop keys from a local TTLCache as other workers publish invalidations"""
+    async for message in get_shared_state().subscribe(channel):
+        if message.get("origin") != WORKER_ID:
+            cache.pop(message["key"])
+
+
+# Process-wide backend, set up at startup
+_state: Optional[Any] = None
+
+
+def init_shared_state(db):
+    """Build the backend selected by SHARED_STATE_BACKEND ('memory' or 'mongo')"""
+    global _state
+    _state = MongoState(db) if os.getenv('SHARED_STATE_BACKEND', 'memory') == 'mongo' else MemoryState()
+    return _state
+
+
+def get_shared_state():
+    """
+    Return the shared-state backend
+
+    Usable directly from services and as a FastAPI dependency (override it in tests).
+    """
+    global _state
+    if _state is None:
+        _state = MemoryState()
+    return _state
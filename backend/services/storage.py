@@ -0,0 +1,369 @@
+import asyncio
+import glob
+import logging
+import os
+import re
+import shutil
+import time
+import uuid
+from pathlib import Path
+from typing import AsyncIterator, Iterable, List, NamedTuple, Optional
+
+import aiofiles
+
+from services.sharedState import LockNotAcquired, get_shared_state
+
+logger = logging.getLogger(__name__)
+
+BACKEND_DIR = Path(__file__).parent.parent
+# Hot tier: local disk, served directly; the historical uploads/ directory
+UPLOADS_DIR = Path(os.getenv('HOT_STORAGE_DIR', str(BACKEND_DIR / "uploads")))
+CHUNK_SIZE = 256 * 1024
+# Upload IDs are the random UUID part of an upload's file name
+UPLOAD_ID = re.compile(r"[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}")
+
+
+class StoredObject(NamedTuple):
+    name: str
+    size: int
+    modified: float
+    tier: str
+    # Last read, for the hot tier's LRU; reads leave `modified` (and so Last-Modified/ETag) alone
+    accessed: float = 0.0
+
+
+def _valid_name(name: str) -> bool:
+    """Only bare file names, so references can't escape a tier's root"""
+    return bool(name) and Path(name).name == name and not name.startswith(".")
+
+
+class FilesystemObjectStore:
+    """
+    Cold tier emulated on a directory
+
+    Stands in for an S3-compatible bucket in development and tests; point
+    COLD_STORAGE_DIR at a network mount to use it for real.
+    """
+
+    tier = "cold"
+
+    def __init__(self, root: Path):
+        self.root = root
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    async def stat(self, name: str) -> Optional[StoredObject]:
+        try:
+            st = await asyncio.to_thread(os.stat, self.root / name)
+        except FileNotFoundError:
+            return None
+        return StoredObject(name, st.st_size, st.st_mtime, self.tier)
+
+    async def put_file(self, name: str, source: Path):
+        def copy():
+            temp = self.root / f".{name}.{uuid.uuid4().hex}"
+            shutil.copyfile(source, temp)
+            os.replace(temp, self.root / name)
+        await asyncio.to_thread(copy)
+
+    async def iter_chunks(self, name: str, chunk_size: int = CHUNK_SIZE) -> AsyncIterator[bytes]:
+        async with aiofiles.open(self.root / name, 'rb') as f:
+            while chunk := await f.read(chunk_size):
+                yield chunk
+
+    async def delete(self, name: str):
+        try:
+            await asyncio.to_thread(os.remove, self.root / name)
+        except FileNotFoundError:
+            pass
+
+    async def list(self, prefix: str = "") -> List[StoredObject]:
+        def scan():
+            objects = []
+            for entry in os.scandir(self.root):
+                if entry.is_file() and entry.name.startswith(prefix) and not entry.name.startswith("."):
+                    st = entry.stat()
+                    objects.append(StoredObject(entry.name, st.st_size, st.st_mtime, self.tier))
+            return objects
+        return await asyncio.to_thread(scan)
+
+
+class S3ObjectStore:
+    """
+    Cold tier on an S3-compatible bucket (AWS S3, MinIO, R2, ...)
+
+    boto3 is imported on first use and its blocking calls run in threads.
+    """
+
+    tier = "cold"
+
+    def __init__(self, bucket: str, endpoint_url: Optional[str] = None, prefix: str = ""):
+        self.bucket = bucket
+        self.endpoint_url = endpoint_url
+        self.prefix = prefix
+        self._client = None
+
+    @property
+    def client(self):
+        if self._client is None:
+            import boto3
+            self._client = boto3.client("s3", endpoint_url=self.endpoint_url)
+        return self._client
+
+    async def stat(self, name: str) -> Optional[StoredObject]:
+        from botocore.exceptions import ClientError
+
+        try:
+            head = await asyncio.to_thread(self.client.head_object, Bucket=self.bucket, Key=self.prefix + name)
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                return None
+            raise
+        return StoredObject(name, head["ContentLength"], head["LastModified"].timestamp(), self.tier)
+
+    async def put_file(self, name: str, source: Path):
+        await asyncio.to_thread(self.client.upload_file, str(source), self.bucket, self.prefix + name)
+
+    async def iter_chunks(self, name: str, chunk_size: int = CHUNK_SIZE) -> AsyncIterator[bytes]:
+        response = await asyncio.to_thread(self.client.get_object, Bucket=self.bucket, Key=self.prefix + name)
+        body = response["Body"]
+        try:
+            while chunk := await asyncio.to_thread(body.read, chunk_size):
+                yield chunk
+        finally:
+            body.close()
+
+    async def delete(self, name: str):
+        await asyncio.to_thread(self.client.delete_object, Bucket=self.bucket, Key=self.prefix + name)
+
+    async def list(self, prefix: str = "") -> List[StoredObject]:
+        def scan():
+            objects = []
+            paginator = self.client.get_paginator("list_objects_v2")
+            for page in paginator.paginate(Bucket=self.bucket, Prefix=self.prefix + prefix):
+                for item in page.get("Contents", []):
+                    name = item["Key"][len(self.prefix):]
+                    objects.append(StoredObject(name, item["Size"], item["LastModified"].timestamp(), self.tier))
+            return objects
+        return await asyncio.to_thread(scan)
+
+
+class TieredStorage:
+    """
+    Uploaded and generated images across a hot local tier and a cold object store
+
+    New objects land on local disk. Reads bump the file's atime, so the hot
+    tier is an LRU shared by every worker on the machine; when it grows past
+    hot_max_bytes the demoter copies the least recently used files to the
+    cold tier and removes them locally, down to hot_low_water. Reading a cold
+    object streams it to the caller while writing a hot copy alongside,
+    promoting it without a second download.
+    """
+
+    def __init__(self, hot_root: Path, cold, hot_max_bytes: int, hot_low_water: float = 0.8):
+        self.hot_root = hot_root
+        self.hot_root.mkdir(parents=True, exist_ok=True)
+        self.cold = cold
+        self.hot_max_bytes = hot_max_bytes
+        self.hot_low_water = hot_low_water
+        self._promoting = set()
+        self._demote_needed = asyncio.Event()
+
+    def hot_path(self, name: str) -> Optional[Path]:
+        """Local path if the object is in the hot tier, marking it recently used"""
+        if not _valid_name(name):
+            return None
+        path = self.hot_root / name
+        try:
+            # Only the access time: mtime stays the content's, for caching headers
+            os.utime(path, ns=(time.time_ns(), os.stat(path).st_mtime_ns))
+        except FileNotFoundError:
+            return None
+        return path
+
+    async def save(self, name: str, data: bytes) -> StoredObject:
+        temp = self.hot_root / f".{name}.{uuid.uuid4().hex}"
+        async with aiofiles.open(temp, 'wb') as f:
+            await f.write(data)
+        os.replace(temp, self.hot_root / name)
+        self._demote_needed.set()
+        return StoredObject(name, len(data), time.time(), "hot")
+
+    async def stat(self, name: str) -> Optional[StoredObject]:
+        if not _valid_name(name):
+            return None
+        try:
+            st = os.stat(self.hot_root / name)
+            return StoredObject(name, st.st_size, st.st_mtime, "hot")
+        except FileNotFoundError:
+            return await self.cold.stat(name)
+
+    async def locate(self, file_ref: str) -> Optional[str]:
+        """Resolve a file name or upload ID (name without extension) to a stored name"""
+        if not _valid_name(file_ref):
+            return None
+        if await self.stat(file_ref) is not None:
+            return file_ref
+        # Only a whole upload ID may be completed with an extension; a free-form
+        # prefix or pattern would resolve to whichever file happened to match
+        if not UPLOAD_ID.fullmatch(file_ref):
+            return None
+        for path in self.hot_root.glob(f"{glob.escape(file_ref)}.*"):
+            if path.is_file():
+                return path.name
+        matches = await self.cold.list(prefix=f"{file_ref}.")
+        return matches[0].name if matches else None
+
+    async def stream(self, name: str, chunk_size: int = CHUNK_SIZE) -> AsyncIterator[bytes]:
+        """Yield the object's bytes, promoting it to the hot tier if it was cold"""
+        path = self.hot_path(name)
+        if path is not None:
+            async with aiofiles.open(path, 'rb') as f:
+                while chunk := await f.read(chunk_size):
+                    yield chunk
+            return
+
+        if name in self._promoting:
+            # Another reader is already writing the hot copy
+            async for chunk in self.cold.iter_chunks(name, chunk_size):
+                yield chunk
+            return
+
+        self._promoting.add(name)
+        temp = self.hot_root / f".{name}.{uuid.uuid4().hex}"
+        complete = False
+        try:
+            async with aiofiles.open(temp, 'wb') as f:
+                async for chunk in self.cold.iter_chunks(name, chunk_size):
+                    await f.write(chunk)
+                    yield chunk
+            complete = True
+        finally:
+            self._promoting.discard(name)
+            if complete:
+                os.replace(temp, self.hot_root / name)
+                self._demote_needed.set()
+            else:
+                temp.unlink(missing_ok=True)
+
+    async def read(self, name: str) -> bytes:
+        return b"".join([chunk async for chunk in self.stream(name)])
+
+    async def promote(self, name: str):
+        """Pull a cold object into the hot tier"""
+        if self.hot_path(name) is None and name not in self._promoting:
+            async for _ in self.stream(name):
+                pass
+
+    async def prefetch(self, names: Iterable[str], concurrency: int = 4):
+        """Promote objects a client is about to request, e.g. the images on a gallery page"""
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def fetch(name):
+            async with semaphore:
+                try:
+                    await self.promote(name)
+                except Exception as e:
+                    logger.warning(f"Prefetch of {name} failed: {str(e)}")
+
+        await asyncio.gather(*(fetch(name) for name in set(names) if _valid_name(name)))
+
+    async def delete(self, name: str) -> bool:
+        if not _valid_name(name):
+            return False
+        existed = await self.stat(name) is not None
+        (self.hot_root / name).unlink(missing_ok=True)
+        await self.cold.delete(name)
+        return existed
+
+    def _hot_objects(self) -> List[StoredObject]:
+        objects = []
+        for entry in os.scandir(self.hot_root):
+            if entry.is_file() and not entry.name.startswith("."):
+                st = entry.stat()
+                objects.append(StoredObject(entry.name, st.st_size, st.st_mtime, "hot", st.st_atime))
+        return objects
+
+    async def list(self) -> List[StoredObject]:
+        """Every stored object once, preferring the hot copy"""
+        hot = await asyncio.to_thread(self._hot_objects)
+        names = {obj.name for obj in hot}
+        return hot + [obj for obj in await self.cold.list() if obj.name not in names]
+
+    async def demote(self) -> int:
+        """Move least recently used hot objects to the cold tier until under the low-water mark"""
+        objects = await asyncio.to_thread(self._hot_objects)
+        used = sum(obj.size for obj in objects)
+        if used <= self.hot_max_bytes:
+            return 0
+
+        target = self.hot_max_bytes * self.hot_low_water
+        demoted = 0
+        for obj in sorted(objects, key=lambda o: o.accessed):
+            if used <= target:
+                break
+            path = self.hot_root / obj.name
+            if obj.name in self._promoting:
+                continue
+            # Skip if it was read since the scan. Checked before copying, as the copy
+            # itself may bump atime; a read during the copy still succeeds, from the
+            # open file or from the cold copy
+            try:
+                if os.stat(path).st_atime > obj.accessed:
+                    continue
+            except FileNotFoundError:
+                continue
+            if await self.cold.stat(obj.name) is None:
+                await self.cold.put_file(obj.name, path)
+            path.unlink(missing_ok=True)
+            used -= obj.size
+            demoted += 1
+        return demoted
+
+    async def run_demoter(self, interval: float = 60):
+        """Demote in the background after writes or every interval, one worker at a time"""
+        while True:
+            try:
+                await asyncio.wait_for(self._demote_needed.wait(), timeout=interval)
+            except asyncio.TimeoutError:
+                pass
+            self._demote_needed.clear()
+            try:
+                async with get_shared_state().lock("storage:demote", ttl=300, blocking=False):
+                    demoted = await self.demote()
+                if demoted:
+                    logger.info(f"Demoted {demoted} objects to cold storage")
+            except LockNotAcquired:
+                pass
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Storage demotion failed: {str(e)}")
+
+    async def stats(self) -> dict:
+        hot = await asyncio.to_thread(self._hot_objects)
+        cold = await self.cold.list()
+        return {
+            "hot": {"fileCount": len(hot), "totalSize": sum(o.size for o in hot), "maxSize": self.hot_max_bytes},
+            "cold": {"fileCount": len(cold), "totalSize": sum(o.size for o in cold)},
+        }
+
+
+def create_storage() -> TieredStorage:
+    """Build storage from HOT_STORAGE_* and COLD_STORAGE_BACKEND ('filesystem' or 's3')"""
+    if os.getenv('COLD_STORAGE_BACKEND', 'filesystem') == 's3':
+        cold = S3ObjectStore(
+            bucket=os.environ['S3_BUCKET'],
+            endpoint_url=os.getenv('S3_ENDPOINT_URL'),
+            prefix=os.getenv('S3_PREFIX', 'uploads/')
+        )
+    else:
+        cold = FilesystemObjectStore(Path(os.getenv('COLD_STORAGE_DIR', str(BACKEND_DIR / "cold_storage"))))
+    return TieredStorage(
+        UPLOADS_DIR,
+        cold,
+        hot_max_bytes=int(float(os.getenv('HOT_STORAGE_MAX_MB', '1024')) * 1024 * 1024)
+    )
+
+
+# Process-wide storage
+storage = create_storage()
@@ -0,0 +1,172 @@
+import asyncio
+import logging
+import os
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict, Optional
+
+from fastapi import Request
+from pymongo import IndexModel, ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+from services.database import register_indexes
+
+logger = logging.getLogger(__name__)
+
+# Async handlers keyed by event type, registered by the modules that own them
+WEBHOOK_HANDLERS: Dict[str, Callable[[object, dict], Awaitable[None]]] = {}
+
+register_indexes("webhook_events", [
+    IndexModel([("status", 1), ("lease_until", 1)], name="status_lease"),
+    IndexModel([("received_at", 1)], name="received_at_ttl", expireAfterSeconds=30 * 24 * 60 * 60)
+])
+
+
+def webhook_handler(event_type: str):
+    """Register a coroutine to process one webhook event type"""
+    def decorator(func):
+        WEBHOOK_HANDLERS[event_type] = func
+        return func
+    return decorator
+
+
+def get_webhook_inbox(request: Request) -> "WebhookInbox":
+    """FastAPI dependency returning the app's webhook inbox"""
+    return request.app.state.webhook_inbox
+
+
+class WebhookInbox:
+    """
+    Durable inbox for verified webhook events
+
+    Events are stored under their provider event ID, so a redelivered event
+    is rejected by the primary key and processed at most once. A background
+    worker claims pending events with a lease, runs the registered handler and
+    marks them done; events whose worker died are re-claimed after the lease,
+    or marked failed if that was their last attempt.
+    """
+
+    def __init__(
+        self,
+        db,
+        poll_interval: float = float(os.getenv('WEBHOOK_POLL_INTERVAL', '5')),
+        lease_seconds: int = int(os.getenv('WEBHOOK_LEASE_SECONDS', '60')),
+        max_attempts: int = int(os.getenv('WEBHOOK_MAX_ATTEMPTS', '10')),
+    ):
+        self.db = db
+        self.poll_interval = poll_interval
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    async def enqueue(self, event_id: str, event_type: str, payload: dict) -> bool:
+        """
+        Store a verified event for processing
+
+        Returns:
+            bool: False if the event ID was already received
+        """
+        try:
+            await self.db.webhook_events.insert_one({
+                "_id": event_id,
+                "event_type": event_type,
+                "payload": payload,
+                "status": "pending",
+                "attempts": 0,
+                "lease_until": None,
+                "received_at": datetime.utcnow()
+            })
+        except DuplicateKeyError:
+            return False
+
+        self._wakeup.set()
+        return True
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                await self.drain()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Webhook inbox drain failed: {str(e)}")
+
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    async def drain(self) -> int:
+        """Process claimable events until none are left"""
+        await self._fail_exhausted()
+        processed = 0
+        while True:
+            event = await self._claim()
+            if event is None:
+                return processed
+            await self._process(event)
+            processed += 1
+
+    async def _fail_exhausted(self):
+        """Mark events whose worker died during their last attempt as failed"""
+        result = await self.db.webhook_events.update_many(
+            {
+                "status": "processing",
+                "lease_until": {"$lt": datetime.utcnow()},
+                "attempts": {"$gte": self.max_attempts}
+            },
+            {"$set": {"status": "failed", "last_error": "Lease expired on the final attempt", "lease_until": None}}
+        )
+        if result.modified_count:
+            logger.error(f"Marked {result.modified_count} webhook events failed after their final attempt")
+
+    async def _claim(self) -> Optional[dict]:
+        now = datetime.utcnow()
+        return await self.db.webhook_events.find_one_and_update(
+            {
+                "$or": [
+                    {"status": "pending"},
+                    {"status": "processing", "lease_until": {"$lt": now}}
+                ],
+                "attempts": {"$lt": self.max_attempts}
+            },
+            {
+                "$set": {"status": "processing", "lease_until": now + timedelta(seconds=self.lease_seconds)},
+                "$inc": {"attempts": 1}
+            },
+            sort=[("received_at", 1)],
+            return_document=ReturnDocument.AFTER
+        )
+
+    async def _process(self, event: dict):
+        handler = WEBHOOK_HANDLERS.get(event["event_type"])
+        try:
+            if handler is not None:
+                await handler(self.db, event["payload"])
+            await self.db.webhook_events.update_one(
+                {"_id": event["_id"]},
+                {"$set": {"status": "done", "processed_at": datetime.utcnow(), "lease_until": None}}
+            )
+        except Exception as e:
+            logger.error(f"Webhook event {event['_id']} failed (attempt {event['attempts']}): {str(e)}")
+            # Leave it leased with exponential backoff; it is re-claimed once the lease lapses
+            status = "failed" if event["attempts"] >= self.max_attempts else "processing"
+            retry_at = datetime.utcnow() + timedelta(seconds=min(2 ** event["attempts"], 300))
+            await self.db.webhook_events.update_one(
+                {"_id": event["_id"]},
+                {"$set": {"status": status, "last_error": str(e), "lease_until": retry_at}}
+            )
@@ -0,0 +1,33 @@
+import asyncio
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from typing import Callable, Optional, TypeVar
+
+T = TypeVar("T")
+
+# CPU-bound image work (decode, resize, encode, hashing) runs here, off the event loop
+IMAGE_WORKERS = int(os.getenv('IMAGE_WORKERS', str(max(1, min(4, (os.cpu_count() or 2) - 1)))))
+
+_pool: Optional[ProcessPoolExecutor] = None
+
+
+def get_pool() -> ProcessPoolExecutor:
+    """Create the shared process pool on first use"""
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=IMAGE_WORKERS)
+    return _pool
+
+
+async def run_in_pool(func: Callable[..., T], *args, **kwargs) -> T:
+    """Run a picklable top-level function in the image worker pool"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_pool(), partial(func, *args, **kwargs))
+
+
+def shutdown_pool():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
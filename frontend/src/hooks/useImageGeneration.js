@@ -1,5 +1,5 @@
 import { useState, useCallback } from 'react';
-import { generationAPI, getSessionId } from '../utils/api';
+import { ensureAccount, generationAPI, getSessionId } from '../utils/api';
 
 export const useImageGeneration = () => {
   const [isGenerating, setIsGenerating] = useState(false);
@@ -15,6 +15,7 @@ export const useImageGeneration = () => {
       setGenerationStatus('starting');
 
       const sessionId = getSessionId();
+      await ensureAccount(sessionId);
       
       const response = await generationAPI.generateImage(prompt, mode, sessionId);
 
@@ -267,4 +267,13 @@ export const getSessionId = () => {
   return sessionId;
 };
 
+// Open the session's credit account once; generations from unknown sessions are rejected
+export const ensureAccount = async (sessionId) => {
+  if (localStorage.getItem('nanobanana_account') === sessionId) {
+    return;
+  }
+  await apiClient.post(`/payments/credits/${sessionId}`);
+  localStorage.setItem('nanobanana_account', sessionId);
+};
+
 export default apiClient;
\ No newline at end of file